@@ -0,0 +1,119 @@
+'''
+Admission control for reports - caps how many run at once, queues the rest for a bounded wait and turns everything beyond that into a fast 503, and cancels a report's whole task tree (fetches, executor jobs, LLM calls) when its client disconnects
+'''
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+from backend import metrics, timing
+
+logger = logging.getLogger(__name__)
+
+MAX_INFLIGHT_REPORTS = int(os.environ.get("MAX_INFLIGHT_REPORTS", "4"))
+MAX_QUEUED_REPORTS = int(os.environ.get("MAX_QUEUED_REPORTS", "16"))
+QUEUE_TIMEOUT_S = float(os.environ.get("REPORT_QUEUE_TIMEOUT_S", "30"))
+
+
+class Overloaded(Exception):
+    """No slot free and the queue is full, or the queue wait timed out - answer 503."""
+
+    def __init__(self, message: str, retry_after_s: int):
+        super().__init__(message)
+        self.retry_after_s = retry_after_s
+
+
+class ClientDisconnected(Exception):
+    """The caller went away and its report was cancelled."""
+
+
+class AdmissionController:
+    """At most max_in_flight holders; up to max_queued more wait (for at most queue_timeout_s) in FIFO order."""
+
+    def __init__(self, max_in_flight: int = MAX_INFLIGHT_REPORTS, max_queued: int = MAX_QUEUED_REPORTS,
+                 queue_timeout_s: float = QUEUE_TIMEOUT_S):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout_s = queue_timeout_s
+        self.in_flight = 0
+        self.queued = 0
+        self._slots = asyncio.Semaphore(max_in_flight)
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._slots.locked():
+            if self.queued >= self.max_queued:
+                metrics.REPORTS.labels("rejected").inc()
+                raise Overloaded(f"Server busy: {self.in_flight} reports running and {self.queued} queued",
+                                 retry_after_s=int(self.queue_timeout_s))
+            self.queued += 1
+            metrics.REPORTS_QUEUED.inc()
+            try:
+                with timing.stage("admission.queue"):
+                    await asyncio.wait_for(self._slots.acquire(), self.queue_timeout_s)
+            except asyncio.TimeoutError:
+                metrics.REPORTS.labels("rejected").inc()
+                raise Overloaded(f"Server busy: no report slot freed up within {self.queue_timeout_s:.0f}s",
+                                 retry_after_s=int(self.queue_timeout_s))
+            finally:
+                self.queued -= 1
+                metrics.REPORTS_QUEUED.dec()
+        else:
+            await self._slots.acquire()
+        self.in_flight += 1
+        metrics.REPORTS_IN_FLIGHT.inc()
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            metrics.REPORTS_IN_FLIGHT.dec()
+            self._slots.release()
+
+
+# The controller's semaphore belongs to one event loop
+_controller: AdmissionController = None
+_controller_loop = None
+
+
+def get_controller() -> AdmissionController:
+    global _controller, _controller_loop
+    loop = asyncio.get_running_loop()
+    if _controller is None or _controller_loop is not loop:
+        _controller, _controller_loop = AdmissionController(), loop
+    return _controller
+
+
+async def _wait_for_disconnect(request) -> None:
+    # The body has already been read by the time the handler runs, so the next ASGI message is the disconnect.
+    # (request.is_disconnected() only peeks, which never sees it through BaseHTTPMiddleware's receive wrapper.)
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request, coro):
+    """
+    Runs coro as its own task and cancels it - and with it every task, gather and LLM call
+    it started - as soon as request's client disconnects. Executor jobs already running
+    finish in their thread, but their results are dropped and queued ones never start.
+    """
+    task = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        logger.info(f"Client disconnected from {request.url.path} - cancelling its report")
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        metrics.REPORTS.labels("cancelled").inc()
+        raise ClientDisconnected(request.url.path)
+    finally:
+        # also covers this handler itself being cancelled (e.g. server shutdown)
+        for pending in (task, watcher):
+            if not pending.done():
+                pending.cancel()
@@ -0,0 +1,216 @@
+'''
+Analytic mode - turns a natural language question into a read-only DuckDB query over the reference tables, runs it in a sandbox and has the LLM narrate only the (small) result set
+'''
+import asyncio
+import logging
+import os
+import re
+import threading
+
+import duckdb
+import pandas as pd
+from langchain.prompts import PromptTemplate
+
+from backend import broadsqlasync
+from backend import context_encoder
+from backend import resources
+
+logger = logging.getLogger(__name__)
+
+ANALYTIC_TABLES = ["mcc_mnc_table", "mideye_mobile_network_list", "traforama_isp_list"]
+
+MAX_RESULT_ROWS = int(os.environ.get("ANALYTIC_MAX_ROWS", "200"))
+QUERY_TIMEOUT_S = float(os.environ.get("ANALYTIC_QUERY_TIMEOUT", "5"))
+SQL_ATTEMPTS = 2  # one retry, with the validation/execution error fed back to the LLM
+
+_sandbox = None
+_sandbox_lock = threading.Lock()
+
+
+class UnsafeQueryError(ValueError):
+    """Raised when generated SQL is not a single read-only query over the allowed tables."""
+
+
+# ----------------------------------------
+# Sandbox: in-memory copy of the reference tables, no file or network access
+# ----------------------------------------
+def get_sandbox(tables: list[str] = ANALYTIC_TABLES) -> duckdb.DuckDBPyConnection:
+    """
+    Returns an in-memory DuckDB holding copies of the given tables, with external access
+    disabled and configuration locked so generated SQL can neither read files nor undo that.
+    """
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is None:
+            sandbox = duckdb.connect(":memory:")
+            for table in tables:
+                sandbox.register("_src", resources.get_con().cursor().execute(f"SELECT * FROM {table}").df())
+                sandbox.execute(f"CREATE TABLE {table} AS SELECT * FROM _src")
+                sandbox.unregister("_src")
+            sandbox.execute("SET enable_external_access = false")
+            sandbox.execute("SET memory_limit = '256MB'")
+            sandbox.execute("SET threads = 2")
+            sandbox.execute("SET lock_configuration = true")
+            logger.info(f"Analytic sandbox built with tables: {tables}")
+            _sandbox = sandbox
+        return _sandbox
+
+
+def reset_sandbox() -> None:
+    """Drops the sandbox so the next query re-copies the tables (call after re-ingestion)."""
+    global _sandbox
+    with _sandbox_lock:
+        if _sandbox is not None:
+            _sandbox.close()
+        _sandbox = None
+
+
+def get_schemas(tables: list[str] = ANALYTIC_TABLES) -> str:
+    sandbox = get_sandbox().cursor()
+    lines = []
+    for table in tables:
+        columns = sandbox.execute(f"DESCRIBE {table}").fetchall()
+        lines.append(f"{table}(" + ", ".join(f'"{name}" {dtype}' for name, dtype, *_ in columns) + ")")
+        sample = sandbox.execute(f"SELECT * FROM {table} LIMIT 2").fetchall()
+        lines.extend(f"  e.g. {row}" for row in sample)
+    return "\n".join(lines)
+
+
+# ----------------------------------------
+# Validation + execution
+# ----------------------------------------
+def validate_sql(sql: str, allowed_tables: list[str] = ANALYTIC_TABLES) -> str:
+    """
+    Checks that sql is exactly one SELECT statement that only reads allowed_tables.
+    Returns the statement with any trailing semicolon (and comment after it) removed, or raises UnsafeQueryError.
+    """
+    sandbox = get_sandbox().cursor()
+    try:
+        statements = sandbox.extract_statements(sql)
+    except duckdb.Error as e:
+        raise UnsafeQueryError(f"Could not parse SQL: {e}") from e
+    if len(statements) != 1:
+        raise UnsafeQueryError(f"Expected exactly one statement, got {len(statements)}")
+    if statements[0].type != duckdb.StatementType.SELECT:
+        raise UnsafeQueryError(f"Only SELECT queries are allowed, got {statements[0].type.name}")
+    try:
+        tables = sandbox.get_table_names(sql)
+    except duckdb.Error as e:
+        raise UnsafeQueryError(f"Query references unavailable objects: {e}") from e
+    disallowed = set(tables) - set(allowed_tables)
+    if disallowed:
+        raise UnsafeQueryError(f"Query references tables outside {allowed_tables}: {sorted(disallowed)}")
+    # the tokenizer skips comments and quoted text, so a ';' token here is a real statement terminator
+    tokens = duckdb.tokenize(sql)
+    while tokens and sql[tokens[-1][0]] == ";":
+        sql = sql[:tokens.pop()[0]]
+    return sql.strip()
+
+
+def _run_query(cursor: duckdb.DuckDBPyConnection, sql: str):
+    # on lines of their own, so a trailing -- comment in sql can't swallow the closing parenthesis
+    result = cursor.execute(f"SELECT * FROM (\n{sql}\n) AS q LIMIT {MAX_RESULT_ROWS + 1}")
+    columns = [d[0] for d in result.description]
+    return columns, result.fetchall()
+
+
+async def run_sandboxed(sql: str) -> tuple[list[str], list[tuple], bool]:
+    """
+    Runs a validated query in the sandbox with a row cap and timeout.
+    Returns (columns, rows, truncated).
+    """
+    cursor = get_sandbox().cursor()
+    try:
+        columns, rows = await asyncio.wait_for(asyncio.to_thread(_run_query, cursor, sql), QUERY_TIMEOUT_S)
+    except asyncio.TimeoutError:
+        cursor.interrupt()
+        raise TimeoutError(f"Analytic query exceeded {QUERY_TIMEOUT_S}s")
+    finally:
+        cursor.close()
+    truncated = len(rows) > MAX_RESULT_ROWS
+    return columns, rows[:MAX_RESULT_ROWS], truncated
+
+
+# ----------------------------------------
+# LLM steps
+# ----------------------------------------
+async def generate_sql(user_query: str, schemas: str, previous_error: str = "") -> str:
+    retry_note = f"\nYour previous query failed with: {previous_error}\nFix it.\n" if previous_error else ""
+    prompt = PromptTemplate.from_template(
+        """
+You write DuckDB SQL. The database has these tables (column names containing spaces must be double-quoted):
+
+{schemas}
+
+Country names are spelled differently across tables (e.g. "United States" vs "USA"), so prefer
+ILIKE or IN lists with common spellings when filtering on Country. In traforama_isp_list,
+"Providers" is a single comma-separated string per country.
+{retry_note}
+Write ONE read-only SELECT query that answers: "{user_query}"
+Return only the SQL, no explanation.
+"""
+    ).format(schemas=schemas, user_query=user_query, retry_note=retry_note)
+    raw = await broadsqlasync.query_llm(prompt)
+    return re.sub(r"^```(?:sql|duckdb)?\n|```$", "", raw.strip()).strip()
+
+
+async def narrate_result(user_query: str, sql: str, columns: list[str], rows: list[tuple], truncated: bool) -> str:
+    result_df = pd.DataFrame(rows, columns=columns)
+    # exact aggregates - encode_table would merge equal columns and rows and hoist constant ones
+    result_context = context_encoder.encode_rows(result_df, "Query result")
+    if truncated:
+        result_context += f"\n… result capped at {MAX_RESULT_ROWS} rows"
+    prompt = PromptTemplate.from_template(
+        """
+The user asked: "{user_query}"
+
+It was answered by running this SQL over the telecom reference tables:
+{sql}
+
+Exact result (a `cols:` line names the columns, then one `|`-delimited line per row):
+{result}
+
+Write a concise Markdown answer based only on this result. Quote the numbers exactly and
+include a small table if the result has several rows.
+"""
+    ).format(user_query=user_query, sql=sql, result=result_context)
+    return await broadsqlasync.query_llm(prompt)
+
+
+# ----------------------------------------
+# Main analytic pipeline
+# ----------------------------------------
+async def analytic_pipeline(user_query: str, table_names: list[str] = ANALYTIC_TABLES) -> dict:
+    """
+    Question -> SQL -> sandboxed execution -> narration. Returns the answer together with the
+    SQL and raw result so callers can show their work.
+    """
+    logger.info(f"Starting analytic pipeline for query: {user_query}")
+    table_names = [t for t in table_names if t in ANALYTIC_TABLES]
+    schemas = await asyncio.to_thread(get_schemas, table_names)
+
+    error = ""
+    for attempt in range(1, SQL_ATTEMPTS + 1):
+        sql = await generate_sql(user_query, schemas, error)
+        logger.info(f"Analytic SQL (attempt {attempt}): {sql}")
+        try:
+            sql = validate_sql(sql, table_names)
+            columns, rows, truncated = await run_sandboxed(sql)
+            break
+        except (UnsafeQueryError, TimeoutError, duckdb.Error) as e:
+            logger.warning(f"Analytic SQL attempt {attempt} failed: {e}")
+            error = str(e)
+    else:
+        raise UnsafeQueryError(f"Could not produce a valid query after {SQL_ATTEMPTS} attempts: {error}")
+
+    answer = await narrate_result(user_query, sql, columns, rows, truncated)
+    return {"answer": answer, "sql": sql, "columns": columns, "rows": [list(r) for r in rows], "truncated": truncated}
+
+
+if __name__ == "__main__":
+    async def main():
+        result = await analytic_pipeline("Which countries have more than 5 mobile network operators?")
+        print(result["sql"])
+        print(result["answer"])
+
+    asyncio.run(main())
@@ -5,12 +5,19 @@ import logging
 import httpx  # <-- Changed from 'requests' to 'httpx'
 import json
 import asyncio
+import os
+
+from backend import limiter
+from backend import metrics
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 logger = logging.getLogger(__name__)
 
 CF_API_TOKEN = "JUabJp8XMB3gnrm7qZ3ldrvWkoEDme8oWIHRLsuB"  # Ideally from env
 
+# Overridable so benchmarks can point the pipeline at a local stand-in
+CF_RADAR_API_URL = os.environ.get("CF_RADAR_API_URL", "https://api.cloudflare.com/client/v4/radar")
+
 HEADERS = {
     "Authorization": f"Bearer {CF_API_TOKEN}",
     "Content-Type": "application/json"
@@ -28,6 +35,29 @@ ENDPOINTS = {
     "domain_popularity": "/ranking/top",
 }
 
+# Closes a report missing metrics that failed to fetch - such a report is used, but not cached (see is_complete)
+MISSING_MARKER = "_Unavailable metrics (fetch failed):"
+
+# One pooled client per event loop - building an AsyncClient per call creates a fresh SSL context,
+# which blocked the event loop for ~100 ms per Radar fetch under load (see loop_monitor.py)
+_client: httpx.AsyncClient = None
+_client_loop = None
+
+
+def get_client() -> httpx.AsyncClient:
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop or _client.is_closed:
+        _client, _client_loop = httpx.AsyncClient(timeout=30.0), loop
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.aclose()
+    _client = None
+
 #added parameter to control entries in a ranked data type
 async def fetch_and_format_markdown(
     country: str = "",
@@ -36,114 +66,134 @@ async def fetch_and_format_markdown(
 ) -> str:
     """
     Fetches each metric in ENDPOINTS asynchronously and builds one Markdown report string.
+    Metrics that fail are left out and listed on a closing MISSING_MARKER line.
     """
     md_lines = [
         f"# Cloudflare Radar Summary (Country: {country or 'Global'}, Range: {date_range})",
         ""
     ]
 
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        for metric, path in ENDPOINTS.items():
-            url = f"https://api.cloudflare.com/client/v4/radar{path}"
-            params = {"format": "json", "dateRange": date_range}
-            if country:
-                params["location"] = country
-
-            if metric == "domain_popularity":
-                params["name"] = "top"
-                params["limit"] = rank_limit
-            
-            
-
-            logger.info(f"Fetching {metric} for country {country}...")
-            try:
-                resp = await client.get(url, headers=HEADERS, params=params)
-                resp.raise_for_status()
-                body = resp.json()
-
-                if not body.get("success"):
-                    logger.error(f"  ↳ {metric}: API error {body.get('errors')}")
-                    continue
-
-                data = body["result"]
-                title = metric.replace("_", " ").title()
-                md_lines.append(f"## {title}")
-                md_lines.append("")
-                logging.info(f"DATA TYPES: {data}")
-                # 1) summary_0 as before...
-                if "summary_0" in data:
-                    summary = data["summary_0"]
-                    if isinstance(summary, list):
-                        md_lines.append("| Category | Share   | Requests |")
-                        md_lines.append("|---|---:|---:|")
-                        for item in summary:
-                            name = item.get("name", "")
-                            share = item.get("share", 0.0) * 100 \
-                                if isinstance(item.get("share"), (int,float)) else item.get("share")
-                            reqs  = item.get("requests", 0)
-                            share_str = f"{share:.2f}%" if isinstance(share, float) else str(share)
-                            md_lines.append(f"| {name} | {share_str:>7s} | {reqs:>8d} |")
-                        md_lines.append("")
-                    elif isinstance(summary, dict):
-                        md_lines.append("| Category | Value |")
-                        md_lines.append("|---|---:|")
-                        for cat, val in summary.items():
-                            md_lines.append(f"| {cat} | {val} |")
-                        md_lines.append("")
-                    else:
-                        md_lines.append("```json")
-                        md_lines.append(json.dumps(summary, indent=2))
-                        md_lines.append("```")
-                        md_lines.append("")
-
-                # 2) CLEAN domain_popularity formatting
-                elif metric == "domain_popularity":
-                    top_list = data.get("top") or data.get("top_0")
-                    if isinstance(top_list, list):
-                        md_lines.append("| Rank | Domain                | Categories                         |")
-                        md_lines.append("|---:|:----------------------|:-----------------------------------|")
-                        for item in top_list:
-                            rank   = item.get("rank", "")
-                            domain = item.get("domain", "")
-                            cats   = item.get("categories", [])
-                            names  = ", ".join(c.get("name","") for c in cats)
-                            md_lines.append(f"| {rank:>2d} | {domain:22s} | {names:35s} |")
-                        md_lines.append("")
-                    else:
-                        logger.warning(f"  ↳ {metric}: no 'top' list found, falling back to raw JSON")
-                        md_lines.append("```json")
-                        md_lines.append(json.dumps(data, indent=2))
-                        md_lines.append("```")
-                        md_lines.append("")
-
-                # 3) any other "top" endpoints get a raw dump
-                elif "top" in data:
-                    logger.warning(f"  ↳ {metric}: unexpected 'top' shape; dumping raw JSON.")
+    failed = []
+    client = get_client()
+    for metric, path in ENDPOINTS.items():
+        url = f"{CF_RADAR_API_URL}{path}"
+        params = {"format": "json", "dateRange": date_range}
+        if country:
+            params["location"] = country
+
+        if metric == "domain_popularity":
+            params["name"] = "top"
+            params["limit"] = rank_limit
+        
+        
+
+        logger.info(f"Fetching {metric} for country {country}...")
+        try:
+            async with limiter.limit("radar"):
+                with metrics.upstream(url):
+                    resp = await client.get(url, headers=HEADERS, params=params)
+                    resp.raise_for_status()
+            body = resp.json()
+
+            if not body.get("success"):
+                logger.error(f"  ↳ {metric}: API error {body.get('errors')}")
+                failed.append(metric)
+                continue
+
+            data = body["result"]
+            title = metric.replace("_", " ").title()
+            md_lines.append(f"## {title}")
+            md_lines.append("")
+            logging.debug(f"DATA TYPES: {data}")
+            # 1) summary_0 as before...
+            if "summary_0" in data:
+                summary = data["summary_0"]
+                if isinstance(summary, list):
+                    md_lines.append("| Category | Share | Requests |")
+                    md_lines.append("|---|---:|---:|")
+                    for item in summary:
+                        name = item.get("name", "")
+                        share = item.get("share", 0.0) * 100 \
+                            if isinstance(item.get("share"), (int,float)) else item.get("share")
+                        reqs  = item.get("requests", 0)
+                        share_str = f"{share:.2f}%" if isinstance(share, float) else str(share)
+                        md_lines.append(f"| {name} | {share_str} | {reqs} |")
+                    md_lines.append("")
+                elif isinstance(summary, dict):
+                    md_lines.append("| Category | Value |")
+                    md_lines.append("|---|---:|")
+                    for cat, val in summary.items():
+                        md_lines.append(f"| {cat} | {val} |")
+                    md_lines.append("")
+                else:
                     md_lines.append("```json")
-                    md_lines.append(json.dumps(data["top"], indent=2))
+                    md_lines.append(json.dumps(summary, separators=(",", ":")))
                     md_lines.append("```")
                     md_lines.append("")
 
+            # 2) CLEAN domain_popularity formatting
+            elif metric == "domain_popularity":
+                top_list = data.get("top") or data.get("top_0")
+                if isinstance(top_list, list):
+                    md_lines.append("| Rank | Domain | Categories |")
+                    md_lines.append("|---:|:---|:---|")
+                    for item in top_list:
+                        rank   = item.get("rank", "")
+                        domain = item.get("domain", "")
+                        cats   = item.get("categories", [])
+                        names  = ", ".join(c.get("name","") for c in cats)
+                        # no column padding - the table is only read by the LLM and padding costs tokens
+                        md_lines.append(f"| {rank} | {domain} | {names} |")
+                    md_lines.append("")
                 else:
-                    # fallback for unknown shapes
-                    logger.warning(f"  ↳ {metric}: Unknown data shape; dumping raw JSON.")
+                    logger.warning(f"  ↳ {metric}: no 'top' list found, falling back to raw JSON")
                     md_lines.append("```json")
-                    md_lines.append(json.dumps(data, indent=2))
+                    md_lines.append(json.dumps(data, separators=(",", ":")))
                     md_lines.append("```")
                     md_lines.append("")
 
-            except httpx.HTTPStatusError as e:
-                logger.warning(f"  ↳ {metric}: HTTP {e.response.status_code} – skipping")
-            except httpx.RequestError as e:
-                logger.error(f"  ↳ {metric}: Request error: {e}")
-            except json.JSONDecodeError as e:
-                logger.error(f"  ↳ {metric}: JSON decode error: {e}")
-            except Exception:
-                logger.exception(f"  ↳ {metric}: unexpected failure")
+            # 3) any other "top" endpoints get a raw dump
+            elif "top" in data:
+                logger.warning(f"  ↳ {metric}: unexpected 'top' shape; dumping raw JSON.")
+                md_lines.append("```json")
+                md_lines.append(json.dumps(data["top"], separators=(",", ":")))
+                md_lines.append("```")
+                md_lines.append("")
 
+            else:
+                # fallback for unknown shapes
+                logger.warning(f"  ↳ {metric}: Unknown data shape; dumping raw JSON.")
+                md_lines.append("```json")
+                md_lines.append(json.dumps(data, separators=(",", ":")))
+                md_lines.append("```")
+                md_lines.append("")
+
+        except limiter.CircuitOpen:
+            # Radar is down - fail the whole country now rather than once per metric
+            raise
+        except httpx.HTTPStatusError as e:
+            logger.warning(f"  ↳ {metric}: HTTP {e.response.status_code} – skipping")
+            failed.append(metric)
+        except httpx.RequestError as e:
+            logger.error(f"  ↳ {metric}: Request error: {e}")
+            failed.append(metric)
+        except json.JSONDecodeError as e:
+            logger.error(f"  ↳ {metric}: JSON decode error: {e}")
+            failed.append(metric)
+        except Exception:
+            logger.exception(f"  ↳ {metric}: unexpected failure")
+            failed.append(metric)
+
+    if failed:
+        md_lines.append(f"{MISSING_MARKER} {', '.join(failed)}_")
     return "\n".join(md_lines)
 
 
+def is_complete(markdown: str) -> bool:
+    """Whether a fetch_and_format_markdown report has every metric - partial ones must not be cached."""
+    return MISSING_MARKER not in markdown
+
+
 # --- Example usage ---
 if __name__ == "__main__":
     async def main():
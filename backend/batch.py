@@ -0,0 +1,177 @@
+'''
+Batch reports - builds many reports at once (e.g. a weekly run over every country group) without fetching the same data twice. Every report's countries are resolved up front, the union of their OONI, Radar and datacenters.com fetches is fetched once each under per-source concurrency limits, and only then do the reports fan out to their per-report summaries, served from those results.
+
+    python -m backend.batch reports.json                  # JSON list of report requests (or JSON lines)
+    python -m backend.batch reports.json --out out.json
+'''
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+from backend import datacenter
+from backend import deadline
+from backend import final_truly_async as fta
+from backend import metrics
+from backend import prefetch
+from backend.country_code_converter import get_alpha2_from_country_name
+
+logger = logging.getLogger(__name__)
+
+# Upstream requests in flight at once per source, across the whole batch
+BATCH_FETCH_CONCURRENCY = int(os.environ.get("BATCH_FETCH_CONCURRENCY", "8"))
+# Reports summarized at once once the data is in (their LLM calls are also capped by the LLM limiter)
+BATCH_REPORT_CONCURRENCY = int(os.environ.get("BATCH_REPORT_CONCURRENCY", "4"))
+
+
+def normalize(request: dict) -> dict:
+    """A report request with ReportRequest's defaults filled in."""
+    request = {"only_anomalies": False, "horizon": 30, "deadline_ms": None, **request}
+    request["only_anomalies"] = bool(request["only_anomalies"])
+    return request
+
+
+def countries_args(request: dict) -> dict | None:
+    """How the pipeline keys a report's country resolution (see final_truly_async.resolve_countries_once)."""
+    return {"query": request["user_query"], "table": request["sql_tables"][0]} if request["sql_tables"] else None
+
+
+def fetch_plan(request: dict, countries: list[str]) -> list[tuple[str, dict]]:
+    """The (kind, args) fetches one report's sections will make - args exactly as the fetch wrappers key them."""
+    fetches = [("datacenter", {"keyword": country}) for country in countries]
+    alpha2s = [a for a in (get_alpha2_from_country_name(c) or "" for c in countries) if a]
+    for alpha2 in alpha2s:
+        for test_name in request["test_names"]:
+            fetches.append(("ooni", {"test_name": test_name, "horizon": request["horizon"], "country": alpha2,
+                                     "only_anomalies": request["only_anomalies"]}))
+        fetches.append(("radar", {"country": alpha2, "date_range": f"{request['horizon']}d"}))
+    return fetches
+
+
+def fetcher(kind: str, args: dict):
+    if kind == "ooni":
+        return lambda: fta.async_scrape_ooni_explorer_wrapper(**args)
+    if kind == "radar":
+        return lambda: fta.async_fetch_and_format_markdown_wrapper(**args)
+    return lambda: datacenter.scrape_keyword(**args)
+
+
+async def fetch_all(fetches: dict[str, tuple[str, dict]]) -> dict:
+    """Runs each distinct fetch once, at most BATCH_FETCH_CONCURRENCY per source at a time; failures are kept as results."""
+    limits = {kind: asyncio.Semaphore(BATCH_FETCH_CONCURRENCY) for kind, _ in fetches.values()}
+    results = {}
+
+    async def fetch_one(key: str, kind: str, args: dict) -> None:
+        async with limits[kind]:
+            try:
+                results[key] = await fetcher(kind, args)()
+            except Exception as e:
+                logger.warning(f"[batch] {key} failed: {e}")
+                results[key] = e
+
+    await asyncio.gather(*(fetch_one(key, kind, args) for key, (kind, args) in fetches.items()))
+    return results
+
+
+async def build_one(request: dict, limit: asyncio.Semaphore) -> dict:
+    async with limit:
+        try:
+            with deadline.start(request["deadline_ms"]) as budget:
+                report = await fta.combined_pipeline(
+                    user_query=request["user_query"],
+                    sql_tables=request["sql_tables"],
+                    test_names=request["test_names"],
+                    only_anomalies=request["only_anomalies"],
+                    horizon=request["horizon"],
+                )
+        except Exception as e:
+            logger.exception(f"[batch] report for {request['user_query']!r} failed")
+            metrics.REPORTS.labels("error").inc()
+            return {"user_query": request["user_query"], "success": False, "error": str(e)}
+        timed_out = budget.timed_out if budget else []
+        metrics.REPORTS.labels("partial" if timed_out else "success").inc()
+        return {"user_query": request["user_query"], "success": True, "report": report, "timed_out": timed_out}
+
+
+async def run_batch(requests: list[dict]) -> dict:
+    """
+    Builds a report for every request, fetching each distinct upstream key once.
+    Returns the reports (in request order) and how many fetches the deduplication saved.
+    """
+    requests = [normalize(r) for r in requests]
+    started = time.perf_counter()
+
+    # 1) Resolve every report's countries
+    country_keys = {prefetch.fetch_key("countries", args): args for args in map(countries_args, requests) if args}
+    resolved = await asyncio.gather(
+        *(fta.resolve_countries(args["query"], args["table"]) for args in country_keys.values()), return_exceptions=True
+    )
+    results = dict(zip(country_keys, resolved))
+
+    # 2) The union of the fetches all reports need
+    fetches = {}
+    requested = {}
+    for r in requests:
+        args = countries_args(r)
+        countries = results[prefetch.fetch_key("countries", args)] if args else []
+        if isinstance(countries, Exception):
+            continue
+        for kind, args in fetch_plan(r, countries):
+            requested[kind] = requested.get(kind, 0) + 1
+            fetches[prefetch.fetch_key(kind, args)] = (kind, args)
+    unique = {}
+    for kind, _ in fetches.values():
+        unique[kind] = unique.get(kind, 0) + 1
+    logger.info(f"[batch] {len(requests)} reports need {sum(requested.values())} fetches, {len(fetches)} distinct")
+
+    # 3) Fetch each key once
+    fetch_started = time.perf_counter()
+    results.update(await fetch_all(fetches))
+    fetch_seconds = time.perf_counter() - fetch_started
+
+    # 4) Build the reports from the fetched data
+    limit = asyncio.Semaphore(BATCH_REPORT_CONCURRENCY)
+    with prefetch.using(results):
+        reports = await asyncio.gather(*(build_one(r, limit) for r in requests))
+
+    return {
+        "reports": reports,
+        "fetches": {kind: {"requested": requested[kind], "fetched": unique[kind]} for kind in requested},
+        "fetch_seconds": round(fetch_seconds, 3),
+        "total_seconds": round(time.perf_counter() - started, 3),
+    }
+
+
+# ----------------------------------------
+# CLI
+# ----------------------------------------
+def load_requests(path: str) -> list[dict]:
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+async def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Build many reports, fetching shared upstream data once.")
+    parser.add_argument("requests", help="JSON list (or JSON lines) of report requests")
+    parser.add_argument("--out", help="write the results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    result = await run_batch(load_requests(args.requests))
+    for kind, counts in result["fetches"].items():
+        logger.info(f"[batch] {kind}: {counts['fetched']} fetched for {counts['requested']} requested")
+    output = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
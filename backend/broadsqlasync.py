@@ -3,46 +3,38 @@ Takes user's natural language query -> list of countries -> filtering the SQL ta
 '''
 
 import pandas as pd
-import duckdb
 import logging
 import os
 from langchain.prompts import PromptTemplate
 import re
 import ast
 import asyncio
+from backend import context_encoder
+from backend import deadline
+from backend import operators
+from backend import resources
+from backend import section_cache
+from backend import singleflight
+from backend import snapshot
+from backend import timing
 # --- Init ---
-import os
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Connect to DuckDB database
-db_path = os.path.join(os.path.dirname(__file__), "bryan.db")
-con = duckdb.connect(db_path)
-
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-load_dotenv(os.path.join(project_root, '.env'))
-
-open_ai_api_key = os.environ.get("OPENAI_API_KEY")
-if not open_ai_api_key:
-    raise ValueError("OpenAI environment variable not set in .env file.")
-
-llm = ChatOpenAI(
-    model="gpt-4.1-nano",  
-    openai_api_key=open_ai_api_key,
-  
-)
 # ----------------------------------------
 # Async query wrapper
 # ----------------------------------------
 # Changed to async def
-async def query_llm(agent_input: str, model=llm) -> str:
+async def query_llm(agent_input: str, model=None) -> str:
+    model = model or resources.get_llm()  # resolved at call time so the shared client can be swapped
     logger.info(f"Calling LLM with prompt for parsing country list...")
-    response = await model.ainvoke(agent_input) # <-- Use ainvoke for async
+    args = {"model": getattr(model, "model_name", ""), "prompt": agent_input}
+    with timing.stage("llm"):
+        content = await deadline.bounded(snapshot.call("llm", args, lambda: singleflight.call(
+            "llm", args, lambda: section_cache.cached_llm(args, lambda: resources.ainvoke(agent_input, model)) # <-- Use ainvoke for async
+        )), "LLM call")
     logger.info(f"LLM Response received.") # Removed full response log for brevity
-    return response.content.strip()
+    return content.strip()
 
 
 # Step 2: Select top relevant row values
@@ -96,7 +88,7 @@ def filter_df(df: pd.DataFrame, column: str, values: list[str]) -> pd.DataFrame:
     return df[df[column].isin(values)]
 
 # ----------------------------------------
-# Step 4: Format to markdown for LLM (no change, already synchronous)
+# Step 4: Format to markdown (kept for display - LLM prompts use context_encoder instead)
 # ----------------------------------------
 def df_to_markdown(df: pd.DataFrame) -> str:
     logger.info(f"Converting filtered DataFrame with {len(df)} rows to markdown")
@@ -110,7 +102,8 @@ async def answer_question(user_query: str, context_md: str) -> str:
     logger.info("Generating final detailed report from LLM using gathered context")
     prompt = PromptTemplate.from_template(
         """
-You are an expert data analyst and technical writer. You have the following raw table data:
+You are an expert data analyst and technical writer. You have the following raw table data.
+{format_note}
 
 {context}
 
@@ -136,7 +129,7 @@ If you lack data to address a sub-question, simply omit that part.
 
 ---
 """
-    ).format(context=context_md, user_query=user_query)
+    ).format(context=context_md, user_query=user_query, format_note=context_encoder.FORMAT_NOTE)
 
     return await query_llm(prompt) # <-- Use await
 
@@ -144,19 +137,19 @@ If you lack data to address a sub-question, simply omit that part.
 # ----------------------------------------
 # Main pipeline (now async, needs to be called with asyncio.run or await)
 # ----------------------------------------
+def read_table(table: str) -> pd.DataFrame:
+    return resources.get_con().cursor().execute(f"SELECT * FROM {table}").df()
+
 async def sql_rag_pipeline(user_query: str, table_names: list[str]) -> str:
     logger.info(f"Starting SQL-RAG pipeline for query: {user_query}")
-    all_markdown = []
+    filtered_tables = []
     countries_list = []
     count = 0
 
-    # Execute DuckDB queries synchronously, but LLM calls will be async
-    # If DuckDB queries become a bottleneck for concurrent execution
-    # you would wrap `con.execute().df()` in `await run_blocking_in_executor(...)`
-    # from your main pipeline.
+    # DuckDB queries run in worker threads (each on its own cursor) so they don't block the event loop
     for table in table_names:
         logger.info(f"Processing table: {table}")
-        df = con.execute(f"SELECT * FROM {table}").df() # Still synchronous
+        df = await asyncio.to_thread(read_table, table)
         if df.empty:
             logger.warning(f"Table '{table}' is empty, skipping.")
             continue
@@ -164,14 +157,19 @@ async def sql_rag_pipeline(user_query: str, table_names: list[str]) -> str:
         if count == 0:
             values = await extract_relevant_rows(df, user_query) # <-- Await
             countries_list = values
+            if await asyncio.to_thread(operators.has_operators_table, resources.get_con().cursor()):
+                # operators were merged across all tables at ingestion - no need to send each table
+                merged = await asyncio.to_thread(operators.get_operators, resources.get_con().cursor(), countries_list, table_names)
+                filtered_tables.append(("Table: operators", merged))
+                break
         else:
             values = countries_list
         filtered_df = filter_df(df, column, values)
-        md = df_to_markdown(filtered_df)
-        all_markdown.append(f"### Table: {table}\n{md}")
+        filtered_tables.append((f"Table: {table}", filtered_df))
         count += 1
 
-    context_md = "\n\n".join(all_markdown) or "No relevant data found."
+    # Compact, token-budgeted encoding instead of padded markdown (see context_encoder)
+    context_md = await asyncio.to_thread(context_encoder.encode_tables, filtered_tables) if filtered_tables else "No relevant data found."
     logger.info("Context aggregation completed.")
 
     # Final answer step
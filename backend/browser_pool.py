@@ -0,0 +1,122 @@
+'''
+Shared Playwright browser for the scrapers - one Chromium launch reused across pages, warm browser contexts, non-essential resources (images, fonts, stylesheets, media) blocked and a cap on concurrent pages
+
+    async with browser_pool.page() as page:
+        await page.goto(url)
+'''
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+BROWSER_MAX_PAGES = int(os.environ.get("BROWSER_MAX_PAGES", "4"))
+BROWSER_HEADLESS = os.environ.get("BROWSER_HEADLESS", "1") != "0"  # set to 0 for debugging
+
+# Request types the scrapers never need - their tables come from the DOM, which scripts build
+BLOCKED_RESOURCE_TYPES = frozenset({"image", "font", "stylesheet", "media"})
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+
+
+class BrowserPool:
+    """
+    Lazily launches one Chromium and hands out pages from a small set of warm contexts.
+    At most max_pages pages are open at once; further callers wait for a free slot.
+    """
+
+    def __init__(self, max_pages: int = BROWSER_MAX_PAGES, headless: bool = BROWSER_HEADLESS,
+                 blocked_resource_types: frozenset = BLOCKED_RESOURCE_TYPES):
+        self.max_pages = max_pages
+        self.headless = headless
+        self.blocked_resource_types = blocked_resource_types
+        self._playwright = None
+        self._browser = None
+        self._idle_contexts = []
+        self._start_lock = asyncio.Lock()
+        self._slots = asyncio.Semaphore(max_pages)
+        self.launches = 0
+
+    async def _ensure_browser(self):
+        async with self._start_lock:
+            if self._browser is None or not self._browser.is_connected():
+                if self._playwright is None:
+                    # only ingestion needs a browser, so the API doesn't pay for importing playwright
+                    from playwright.async_api import async_playwright
+                    self._playwright = await async_playwright().start()
+                logger.info(f"Launching shared browser (headless: {self.headless}, max pages: {self.max_pages})")
+                self._browser = await self._playwright.chromium.launch(headless=self.headless)
+                self._idle_contexts = []
+                self.launches += 1
+        return self._browser
+
+    async def _block_resources(self, route):
+        if route.request.resource_type in self.blocked_resource_types:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _acquire_context(self):
+        if self._idle_contexts:
+            return self._idle_contexts.pop()
+        browser = await self._ensure_browser()
+        context = await browser.new_context(user_agent=USER_AGENT)
+        if self.blocked_resource_types:
+            await context.route("**/*", self._block_resources)
+        return context
+
+    @asynccontextmanager
+    async def page(self):
+        """Yields a fresh page in a warm context; the page is closed and the context kept on exit."""
+        async with self._slots:
+            context = await self._acquire_context()
+            page = await context.new_page()
+            try:
+                yield page
+            finally:
+                await page.close()
+                if self._browser is not None and self._browser.is_connected():
+                    self._idle_contexts.append(context)
+
+    async def close(self):
+        for context in self._idle_contexts:
+            await context.close()
+        self._idle_contexts = []
+        if self._browser is not None:
+            await self._browser.close()
+            logger.info("Shared browser closed.")
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+
+# ----------------------------------------
+# Process-wide pool
+# ----------------------------------------
+_pool: BrowserPool = None
+_pool_loop = None
+
+
+def get_pool() -> BrowserPool:
+    """The shared pool for the running event loop (Playwright objects can't cross loops)."""
+    global _pool, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool_loop is not loop:
+        _pool, _pool_loop = BrowserPool(), loop
+    return _pool
+
+
+@asynccontextmanager
+async def page():
+    async with get_pool().page() as p:
+        yield p
+
+
+async def shutdown() -> None:
+    """Closes the shared browser; the next page() launches a new one."""
+    global _pool
+    if _pool is not None and _pool_loop is asyncio.get_running_loop():
+        await _pool.close()
+    _pool = None
@@ -0,0 +1,233 @@
+'''
+Shared cache for upstream fetches and LLM output - results are stored under namespaced keys with a TTL in one of three backends, so a fetch or summary made by one uvicorn worker or replica is reused by all of them instead of each keeping its own cold in-process copy
+
+    CACHE_BACKEND=memory                    # per-process LRU (the default); off disables caching
+    CACHE_BACKEND=disk                      # SQLite file shared by every process on the host (CACHE_PATH)
+    CACHE_BACKEND=redis                     # any Redis-protocol server, shared by every replica (CACHE_URL)
+    CACHE_URL=redis://localhost:6379/0
+    CACHE_PATH=backend/cache.sqlite
+'''
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import orjson
+import pandas as pd
+import zstandard
+from cachetools import TLRUCache
+
+from backend import metrics
+from backend import snapshot
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("off", "memory", "disk", "redis")
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()
+CACHE_URL = os.environ.get("CACHE_URL", "redis://localhost:6379/0")
+CACHE_PATH = os.environ.get("CACHE_PATH", os.path.join(os.path.dirname(__file__), "cache.sqlite"))
+# Entries kept by the memory backend
+CACHE_MAX_ENTRIES = int(os.environ.get("CACHE_MAX_ENTRIES", "4096"))
+# Prefixed to every key - bump it when cached value formats change, or to keep deployments sharing a Redis apart
+CACHE_PREFIX = os.environ.get("CACHE_PREFIX", "comms:v1")
+# A slow shared cache must not slow reports down - past this a lookup counts as a miss
+CACHE_TIMEOUT_S = float(os.environ.get("CACHE_TIMEOUT_S", "0.5"))
+# Serialized values at least this large are zstd-compressed
+COMPRESS_MIN_BYTES = 512
+ZSTD_LEVEL = 3
+# The disk backend drops expired rows every this many writes
+PURGE_EVERY_WRITES = 500
+
+if CACHE_BACKEND not in BACKENDS:
+    raise ValueError(f"CACHE_BACKEND must be one of {BACKENDS}, got '{CACHE_BACKEND}'")
+
+
+# ----------------------------------------
+# Serialization - fetchers return markdown strings, (markdown, count, count) tuples or DataFrames
+# ----------------------------------------
+# One type byte ahead of the payload: j(son), t(uple as a JSON list), f(rame as split-oriented JSON); upper case when zstd-compressed
+def dumps(value) -> bytes:
+    if isinstance(value, pd.DataFrame):
+        kind, payload = b"f", value.to_json(orient="split", index=False).encode()
+    else:
+        kind, payload = (b"t" if isinstance(value, tuple) else b"j"), orjson.dumps(value)
+    if len(payload) >= COMPRESS_MIN_BYTES:
+        return kind.upper() + zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload)
+    return kind + payload
+
+
+def loads(data: bytes):
+    kind, payload = data[:1], data[1:]
+    if kind.isupper():
+        kind, payload = kind.lower(), zstandard.ZstdDecompressor().decompress(payload)
+    if kind == b"f":
+        return pd.read_json(io.BytesIO(payload), orient="split", dtype=False)
+    value = orjson.loads(payload)
+    return tuple(value) if kind == b"t" else value
+
+
+# ----------------------------------------
+# Backends
+# ----------------------------------------
+class MemoryBackend:
+    """Per-process LRU with a TTL per entry - values are kept as they are, not serialized."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self._entries = TLRUCache(maxsize=max_entries, ttu=lambda key, entry, now: entry[0], timer=time.monotonic)
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        return None if entry is None else entry[1]
+
+    async def set(self, key: str, value, ttl_s: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl_s, value)
+
+    async def close(self) -> None:
+        pass
+
+
+class DiskBackend:
+    """SQLite file in WAL mode - any number of readers and one writer at a time, across processes."""
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+
+    def _con(self) -> sqlite3.Connection:
+        # sqlite connections belong to the thread that opened them - one per executor thread
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = sqlite3.connect(self.path, timeout=CACHE_TIMEOUT_S)
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)")
+            self._local.con = con
+        return con
+
+    def _get(self, key: str):
+        row = self._con().execute("SELECT value FROM cache WHERE key = ? AND expires_at > ?", [key, time.time()]).fetchone()
+        return None if row is None else loads(row[0])
+
+    def _set(self, key: str, value, ttl_s: float) -> None:
+        data = dumps(value)
+        con = self._con()
+        with con:
+            con.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", [key, data, time.time() + ttl_s])
+            self._writes += 1
+            if self._writes % PURGE_EVERY_WRITES == 0:
+                con.execute("DELETE FROM cache WHERE expires_at <= ?", [time.time()])
+
+    async def get(self, key: str):
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value, ttl_s: float) -> None:
+        await asyncio.to_thread(self._set, key, value, ttl_s)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisBackend:
+    """Any Redis-protocol server (Redis, Valkey, KeyDB, ...) - expiry is left to the server."""
+
+    def __init__(self, url: str = CACHE_URL):
+        import redis.asyncio  # only needed with CACHE_BACKEND=redis
+
+        self.url = url
+        self._redis = redis.asyncio
+        # the client's connections belong to one event loop - kept per loop
+        self._client = None
+        self._client_loop = None
+
+    def _get_client(self):
+        loop = asyncio.get_running_loop()
+        if self._client_loop is not loop:
+            # RESP2 - spoken by every Redis-compatible server, old or new
+            self._client = self._redis.from_url(
+                self.url, protocol=2, socket_timeout=CACHE_TIMEOUT_S, socket_connect_timeout=CACHE_TIMEOUT_S
+            )
+            self._client_loop = loop
+        return self._client
+
+    async def get(self, key: str):
+        data = await self._get_client().get(key)
+        return None if data is None else loads(data)
+
+    async def set(self, key: str, value, ttl_s: float) -> None:
+        await self._get_client().set(key, dumps(value), px=max(1, int(ttl_s * 1000)))
+
+    async def close(self) -> None:
+        if self._client is not None and self._client_loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = self._client_loop = None
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = {"memory": MemoryBackend, "disk": DiskBackend, "redis": RedisBackend}[CACHE_BACKEND]()
+        logger.info(f"[cache] using the {CACHE_BACKEND} backend")
+    return _backend
+
+
+async def close() -> None:
+    if _backend is not None:
+        await _backend.close()
+
+
+# ----------------------------------------
+# Lookups
+# ----------------------------------------
+def cache_key(namespace: str, args: dict | str) -> str:
+    """Namespaced key for args - a dict of call arguments, or an already computed fingerprint."""
+    if not isinstance(args, str):
+        args = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()[:32]
+    return f"{CACHE_PREFIX}:{namespace}:{args}"
+
+
+async def get(namespace: str, args: dict | str):
+    """The cached value, or None on a miss - including when the cache is off or unreachable."""
+    if CACHE_BACKEND == "off":
+        return None
+    try:
+        return await asyncio.wait_for(get_backend().get(cache_key(namespace, args)), CACHE_TIMEOUT_S)
+    except Exception as e:
+        metrics.CACHE_ERRORS.labels("get").inc()
+        logger.warning(f"[cache] {namespace} lookup failed: {type(e).__name__}: {e}")
+        return None
+
+
+async def put(namespace: str, args: dict | str, value, ttl_s: float) -> None:
+    if CACHE_BACKEND == "off" or ttl_s <= 0:
+        return
+    try:
+        await asyncio.wait_for(get_backend().set(cache_key(namespace, args), value, ttl_s), CACHE_TIMEOUT_S)
+    except Exception as e:
+        metrics.CACHE_ERRORS.labels("set").inc()
+        logger.warning(f"[cache] {namespace} write failed: {type(e).__name__}: {e}")
+
+
+async def cached(namespace: str, args: dict | str, compute, ttl_s: float, keep=None):
+    """
+    Returns the cached value for (namespace, args), or awaits compute() and caches its result
+    unless keep(result) is false. Inside a record/replay session it always computes.
+    """
+    # a record/replay session must see every upstream call
+    if not snapshot.active():
+        value = await get(namespace, args)
+        metrics.cache_lookup(namespace, value is not None)
+        if value is not None:
+            return value
+    value = await compute()
+    if keep is None or keep(value):
+        await put(namespace, args, value, ttl_s)
+    return value
@@ -0,0 +1,298 @@
+'''
+Compact, token-budgeted encoding of tables for LLM prompts - replaces padded tabulate markdown with delimited rows grouped by country
+'''
+import logging
+import os
+from functools import lru_cache
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Token budget per report section (SQL tables, Radar blocks, ...). Override with CONTEXT_TOKEN_BUDGET.
+DEFAULT_SECTION_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "6000"))
+
+DELIMITER = "|"
+
+# How many dropped groups/tables an "omitted for budget" line names, so it stays cheap to reserve
+MAX_OMITTED_NAMES = 8
+
+# Short explanation of the encoding, meant to be pasted into prompts that consume it
+FORMAT_NOTE = (
+    "Tables are encoded compactly: a `cols:` line names the columns, each row is `|`-delimited, "
+    "rows are grouped under `## <Country>` headings, and values shared by a whole table or group "
+    "are listed once in `[...]` instead of being repeated on every row. "
+    "Lines starting with `…` mark rows that were truncated to fit the context budget."
+)
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")  # tokenizer used by the gpt-4.1 family
+    except Exception as e:
+        # tiktoken downloads its BPE files on first use - fall back to a heuristic when offline
+        logger.warning(f"tiktoken unavailable, estimating tokens from length instead: {e}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """
+    Counts LLM tokens in text. Uses tiktoken when available, otherwise ~4 characters per token.
+    """
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _clean_cell(value) -> str:
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return ""
+    return str(value).replace(DELIMITER, "/").replace("\n", " ").strip()
+
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """Stringifies cells, then drops empty columns, duplicate columns and duplicate rows."""
+    df = df.astype(object).map(_clean_cell)
+    df = df.loc[:, (df != "").any(axis=0)]
+    df = df.T.drop_duplicates().T  # columns carrying identical values (e.g. a copied code column)
+    return df.drop_duplicates().reset_index(drop=True)
+
+
+def _constants(df: pd.DataFrame, exclude: set[str]) -> dict[str, str]:
+    return {
+        col: df[col].iloc[0]
+        for col in df.columns
+        if col not in exclude and len(df) > 1 and df[col].nunique() == 1 and df[col].iloc[0] != ""
+    }
+
+
+def _format_constants(constants: dict[str, str]) -> str:
+    return "[" + "; ".join(f"{k}={v}" for k, v in constants.items()) + "]" if constants else ""
+
+
+def _truncation_marker(omitted: pd.DataFrame) -> str:
+    marker = f"… +{len(omitted)} more rows truncated"
+    if len(omitted.columns):
+        col = omitted.columns[0]
+        marker += f" ({col}: {omitted[col].nunique()} distinct)"
+    return marker
+
+
+def encode_rows(df: pd.DataFrame, name: str) -> str:
+    """
+    Encodes every row and column of df as it is - no deduplication, constant hoisting or column
+    dropping - for small results whose exact values matter (e.g. aggregates that happen to be equal).
+    """
+    header = f"### {name}"
+    if df.empty:
+        return f"{header}\ncols: {DELIMITER.join(map(str, df.columns))}\n(no rows)"
+    cells = df.astype(object).map(_clean_cell)
+    lines = [header, "cols: " + DELIMITER.join(_clean_cell(c) for c in df.columns)]
+    lines.extend(DELIMITER.join(row) for row in cells.itertuples(index=False, name=None))
+    return "\n".join(lines)
+
+
+def _lines_cost(text: str) -> int:
+    return sum(count_tokens(line) + 1 for line in text.splitlines())
+
+
+def _allot(costs: list[int], budget_tokens: int) -> list[int]:
+    """
+    Splits budget_tokens across parts whose full costs are given: parts costing no more than an
+    equal share of what is left get their full cost, and the budget they leave over is shared
+    equally by the parts that do not fit. Returns each part's allotment, in order.
+    """
+    allotments = [0] * len(costs)
+    remaining = max(0, budget_tokens)
+    pending = sorted(range(len(costs)), key=lambda i: costs[i])
+    while pending:
+        share = remaining // len(pending)
+        if costs[pending[0]] > share:
+            # nothing left fits whole - the rest split what remains equally
+            for i in pending:
+                allotments[i] = share
+            break
+        i = pending.pop(0)
+        allotments[i] = costs[i]
+        remaining -= costs[i]
+    return allotments
+
+
+def _fit(costs: list[int], minimums: list[int], budget_tokens: int, omitted_cost) -> dict[int, int]:
+    """
+    Allots budget_tokens across parts (see _allot), dropping parts that can't get even their
+    minimum - the last such part first - until the rest fit. omitted_cost(dropped) is what the
+    line naming the dropped parts costs, and is reserved out of the budget before allotting.
+    Returns {kept part: allotment}.
+    """
+    kept = list(range(len(costs)))
+    while True:
+        dropped = [i for i in range(len(costs)) if i not in kept]
+        budget = budget_tokens - (omitted_cost(dropped) if dropped else 0)
+        allotments = dict(zip(kept, _allot([costs[i] for i in kept], budget)))
+        too_small = [i for i in kept if costs[i] > allotments[i] and minimums[i] > allotments[i]]
+        if not too_small:
+            return allotments
+        kept.remove(too_small[-1])
+
+
+def _omitted_line(count: int, what: str, names: list[str] | None = None) -> str:
+    line = f"… {count} {what} omitted for budget"
+    if not names:
+        return line
+    line += ": " + ", ".join(names[:MAX_OMITTED_NAMES])
+    return line + (f" (+{len(names) - MAX_OMITTED_NAMES} more)" if len(names) > MAX_OMITTED_NAMES else "")
+
+
+def _encode_table(df: pd.DataFrame, name: str, budget_tokens: int | None, group_column: str) -> str:
+    header = f"### {name}"
+    if df.empty:
+        return f"{header}\n(no rows)"
+
+    df = _prepare(df)
+    grouped = group_column in df.columns
+    table_constants = _constants(df, exclude={group_column} if grouped else set())
+    df = df.drop(columns=list(table_constants))
+
+    lines = [header]
+    if table_constants:
+        lines.append(_format_constants(table_constants))
+    groups = sorted(df.groupby(group_column, sort=False), key=lambda g: g[0]) if grouped else [(None, df)]
+    # columns constant inside every group (e.g. a country's dialing code) move to the group heading
+    hoisted = [
+        col for col in df.columns
+        if grouped and len(df) > len(groups) and col != group_column
+        and all(g[col].nunique() == 1 for _, g in groups)
+    ]
+    row_columns = [c for c in df.columns if c not in hoisted and not (grouped and c == group_column)]
+    lines.append("cols: " + DELIMITER.join(row_columns))
+    used = sum(count_tokens(line) + 1 for line in lines)
+
+    # every group's heading and rows, and what the group costs in full
+    rendered = []
+    for group_name, group_df in groups:
+        heading = []
+        if grouped:
+            group_constants = {col: group_df[col].iloc[0] for col in hoisted if group_df[col].iloc[0] != ""}
+            heading.append(f"## {group_name} {_format_constants(group_constants)}".rstrip())
+        group_df = group_df[row_columns]
+        rows = [DELIMITER.join(r).rstrip(DELIMITER) for r in group_df.itertuples(index=False, name=None)]
+        heading_cost = sum(count_tokens(line) + 1 for line in heading)
+        row_costs = [count_tokens(row) + 1 for row in rows]
+        rendered.append((group_name, group_df, heading, heading_cost, rows, row_costs))
+    costs = [heading_cost + sum(row_costs) for _, _, _, heading_cost, _, row_costs in rendered]
+    # a truncated group still needs its heading and a `…` marker
+    minimums = [heading_cost + count_tokens(_truncation_marker(group_df)) + 1
+                for _, group_df, _, heading_cost, _, _ in rendered]
+    allotments = dict(enumerate(costs))
+    if budget_tokens is not None:
+        # groups that can't fit even their heading are dropped, so the others get their share
+        allotments = _fit(costs, minimums, budget_tokens - used, lambda dropped: _lines_cost(
+            _omitted_line(len(dropped), "groups", [str(rendered[i][0]) for i in dropped])
+        ))
+
+    dropped_groups = []
+    for i, (group_name, group_df, heading, heading_cost, rows, row_costs) in enumerate(rendered):
+        if i not in allotments:
+            dropped_groups.append(str(group_name))
+            continue
+        allotment = allotments[i]
+        if costs[i] <= allotment:
+            lines.extend(heading + rows)
+            continue
+        group_cost, kept = minimums[i], 0
+        for row_cost in row_costs:
+            if group_cost + row_cost > allotment:
+                break
+            group_cost += row_cost
+            kept += 1
+        lines.extend(heading + rows[:kept])
+        lines.append(_truncation_marker(group_df.iloc[kept:]))
+
+    if dropped_groups:
+        lines.append(_omitted_line(len(dropped_groups), "groups", dropped_groups))
+    return "\n".join(lines)
+
+
+def encode_table(
+    df: pd.DataFrame,
+    name: str,
+    budget_tokens: int = DEFAULT_SECTION_BUDGET,
+    group_column: str = "Country",
+) -> str:
+    """
+    Encodes one table as compact delimited rows grouped by group_column, within budget_tokens.
+
+    Groups are emitted in sorted order. Every group that fits in an equal share of the budget is
+    kept whole, and what the small groups leave over is shared by the large ones (see _allot), so
+    truncation is deterministic and no single country can crowd out the others. Truncated groups
+    end with a `…` marker summarizing what was dropped, and groups that can't fit even their
+    heading are named on a closing line whose cost is reserved up front. Only a budget smaller
+    than the table's heading and `cols:` line is exceeded.
+    """
+    text = _encode_table(df, name, budget_tokens, group_column)
+    logger.info(f"Encoded '{name}' ({len(df)} rows) into ~{count_tokens(text)} tokens (budget {budget_tokens})")
+    return text
+
+
+def encode_tables(
+    tables: list[tuple[str, pd.DataFrame]],
+    budget_tokens: int = DEFAULT_SECTION_BUDGET,
+    group_column: str = "Country",
+) -> str:
+    """
+    Encodes several tables into one context block, splitting budget_tokens across them the way
+    encode_table splits a table across its groups: tables that fit are kept whole, and tables
+    that can't fit even their heading are left out and named on a closing line.
+    """
+    # costed per line, the way _encode_table charges its lines against a budget
+    costs = [_lines_cost(_encode_table(df, name, None, group_column)) for name, df in tables]
+    # a table's heading, columns and its groups-omitted line
+    minimums = [_lines_cost(_encode_table(df, name, 0, group_column)) for name, df in tables]
+    # blocks are joined by a blank line
+    allotments = _fit(costs, minimums, budget_tokens - 2 * max(0, len(tables) - 1), lambda dropped: _lines_cost(
+        _omitted_line(len(dropped), "tables", [tables[i][0] for i in dropped])
+    ))
+    parts = [encode_table(df, name, allotments[i], group_column) for i, (name, df) in enumerate(tables) if i in allotments]
+    if len(parts) < len(tables):
+        omitted = [name for i, (name, _) in enumerate(tables) if i not in allotments]
+        parts.append(_omitted_line(len(omitted), "tables", omitted))
+    return "\n\n".join(parts)
+
+
+def fit_blocks(blocks: list[str], budget_tokens: int = DEFAULT_SECTION_BUDGET) -> str:
+    """
+    Joins pre-rendered text blocks (e.g. one Radar report per country) within budget_tokens.
+    Blocks that fit are kept whole, the others share the leftover budget and are cut at a line
+    boundary; blocks that can't fit even their first line and truncation marker are left out and
+    counted on a closing line.
+    """
+    block_lines = [block.splitlines() for block in blocks]
+    line_costs = [[count_tokens(line) + 1 for line in lines] for lines in block_lines]
+    markers = [count_tokens(f"… +{len(lines)} more lines truncated") + 1 for lines in block_lines]
+    # a truncated block still needs its first (heading) line and the marker
+    minimums = [costs[0] + marker if costs else 0 for costs, marker in zip(line_costs, markers)]
+    allotments = _fit([sum(costs) for costs in line_costs], minimums, budget_tokens - 2 * max(0, len(blocks) - 1),
+                      lambda dropped: _lines_cost(_omitted_line(len(dropped), "blocks")))
+    fitted = []
+    for i, (lines, costs) in enumerate(zip(block_lines, line_costs)):
+        if i not in allotments:
+            continue
+        share = allotments[i]
+        if sum(costs) <= share:
+            fitted.append("\n".join(lines))
+            continue
+        marker_cost = markers[i]
+        kept, cost = 0, marker_cost
+        for line_cost in costs:
+            if cost + line_cost > share:
+                break
+            cost += line_cost
+            kept += 1
+        fitted.append("\n".join(lines[:kept] + [f"… +{len(lines) - kept} more lines truncated"]))
+    if len(fitted) < len(blocks):
+        fitted.append(_omitted_line(len(blocks) - len(fitted), "blocks"))
+    return "\n\n".join(fitted)
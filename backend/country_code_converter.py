@@ -33,3 +33,45 @@ def get_country_name_from_alpha2(alpha2_code):
     except KeyError:
         return None
 
+
+# --- Country name spellings used by the scraped tables -> the MCC table's spelling ---
+# The MCC/MNC table is the reference list the LLM picks countries from, so everything is mapped onto it
+COUNTRY_ALIASES = {
+    "Antigua & Barbuda": "Antigua and Barbuda",
+    "Belorus": "Belarus",
+    "Bosnia-Herzegovina": "Bosnia and Herzegovina",
+    "Congo, Democratic Republic": "Democratic Republic of Congo",
+    "Cote d’Ivoire": "Ivory Coast",
+    "Dominican Rebuplic": "Dominican Republic",
+    "French Westindies": "Guadeloupe and Martinique and French Guiana",
+    "Hashemite Kingdom of Jordan": "Jordan",
+    "Hongkong": "Hong Kong",
+    "Korea": "South Korea",
+    "Kyrgyz Republic": "Kyrgyzstan",
+    "Lao": "Laos",
+    "Luxemburg": "Luxembourg",
+    "Macau": "Macao",
+    "Macedonia (F.Y.R.o.M.)": "North Macedonia",
+    "Moldavia": "Moldova",
+    "Palestine": "Palestinian Territory",
+    "Palestinian Authority": "Palestinian Territory",
+    "Republic of Korea": "South Korea",
+    "Reunion (La)": "Reunion",
+    "S:t Lucia": "Saint Lucia",
+    "S:t Vincent & The Grenadines": "Saint Vincent and the Grenadines",
+    "Serbia and Montenegro": "Serbia",
+    "Slovak Rebublic": "Slovakia",
+    "Slovak Republic": "Slovakia",
+    "Trinidad & Tobago": "Trinidad and Tobago",
+    "Turkey": "Turkiye",
+    "United States of America": "United States",
+    "USA": "United States",
+}
+
+def canonical_country(country_name):
+    if not country_name:
+        return country_name
+    name = country_name.strip()
+    # Mideye splits India into circles, e.g. "India / Kerala"
+    name = name.split(" / ")[0]
+    return COUNTRY_ALIASES.get(name, name)
@@ -2,7 +2,6 @@
 Scrapes from datacenters.com - this is the hardest scraping task - hard website to scrape + can get backoff or timeout errors
 '''
 import asyncio
-from bs4 import BeautifulSoup
 import pandas as pd
 import logging
 from urllib.parse import urljoin
@@ -11,12 +10,53 @@ import socket
 from scraperapi_sdk import ScraperAPIClient
 from dotenv import load_dotenv
 
+from backend import extract
+from backend import hedge
+from backend import limiter
+from backend import metrics
+from backend import prefetch
+from backend import section_cache
+from backend import singleflight
+from backend import snapshot
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 # Load environment variables from .env in the project root directory
 project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 load_dotenv(os.path.join(project_root, '.env'))
-    
+
+COLUMNS = ["Name", "Type", "Address", "Link"]
+
+# Overridable so benchmarks can point the pipeline at a local stand-in
+SCRAPERAPI_ENDPOINT = os.environ.get("SCRAPERAPI_ENDPOINT", "https://api.scraperapi.com")
+
+# Listing cards are <a> tags with this (long) Tailwind class list
+CARD_XPATH = "//a[" + extract.has_class(
+    "flex", "flex-col", "gap-2", "rounded", "border", "border-gray-100", "p-2",
+    "hover:border-teal-300", "hover:shadow-lg", "hover:shadow-teal-600/40",
+) + "]"
+NAME_XPATH = ".//div[normalize-space(@class)='text font-medium hover:text-purple']"
+GRAY_XPATH = ".//div[normalize-space(@class)='text-xs text-gray-500']"
+
+def iter_datacenter_cards(html_content: str, url: str):
+    """Yields one {Name, Type, Address, Link} dict per listing card on a datacenters.com results page."""
+    name_divs = extract.xpath(NAME_XPATH)
+    gray_xpath = extract.xpath(GRAY_XPATH)
+    for card in extract.xpath(CARD_XPATH)(extract.parse_html(html_content)):
+        link = urljoin(url, card.get("href", ""))
+        names = name_divs(card)
+        gray_divs = gray_xpath(card)
+        yield {
+            "Name": extract.text(names[0]) if names else "",
+            "Type": extract.text(gray_divs[0]) if len(gray_divs) > 0 else "",
+            "Address": extract.text(gray_divs[1]) if len(gray_divs) > 1 else "",
+            "Link": link,
+        }
+
+def filter_to_country(df: pd.DataFrame, keyword: str) -> pd.DataFrame:
+    """Keeps the listings whose address ends in the searched country."""
+    return df[extract.address_country(df["Address"]) == keyword.lower()]
+
 async def scrape_datacenter_cards_df(keyword: str) -> pd.DataFrame:
     web_format_keyword = keyword.replace(" ", "%20")
     url = f"https://www.datacenters.com/locations?query={web_format_keyword}"
@@ -25,42 +65,37 @@ async def scrape_datacenter_cards_df(keyword: str) -> pd.DataFrame:
         api_key = os.environ.get("SCRAPERAPI_KEY")
         if not api_key:
             raise ValueError("SCRAPERAPI_KEY environment variable not set in .env file.")
-        client = ScraperAPIClient(api_key)
+        client = ScraperAPIClient(api_key, api_endpoint=SCRAPERAPI_ENDPOINT)
         logging.info(f"Beginning Scraping Datacenter with Keyword: {keyword}")
         # Use render=True to enable JS rendering
-        html_content = client.get(url=url, params={"render": False})
-        soup = BeautifulSoup(html_content, "html.parser")
+        # the ScraperAPI SDK is synchronous - run it (and the parse) in threads so keywords are fetched concurrently
+        # hedge.call runs it under the "scraperapi" limiter
+        async def fetch_page() -> str:
+            with metrics.upstream(SCRAPERAPI_ENDPOINT):
+                request = asyncio.ensure_future(asyncio.to_thread(client.get, url=url, params={"render": False}))
+                # a cancelled fetch (a losing hedge, a disconnected client) returns at once, but its thread can't
+                # be interrupted - the request keeps its limiter slot until the thread really ends
+                limiter.hold_until(request)
+                return await asyncio.shield(request)
 
-        card_sel = (
-            "a.flex.flex-col.gap-2.rounded.border.border-gray-100."
-            "p-2.hover\\:border-teal-300.hover\\:shadow-lg.hover\\:shadow-teal-600\\/40"
-        )
-        rows = []
-        for card in soup.select(card_sel):
-            href = card.get("href", "")
-            link = urljoin(url, href)
-            name_div = card.find("div", class_="text font-medium hover:text-purple")
-            name = name_div.get_text(strip=True) if name_div else ""
-            gray_divs = card.find_all("div", class_="text-xs text-gray-500")
-            dc_type = gray_divs[0].get_text(strip=True) if len(gray_divs) > 0 else ""
-            address = gray_divs[1].get_text(strip=True) if len(gray_divs) > 1 else ""
-            rows.append({"Name": name, "Type": dc_type, "Address": address, "Link": link})
-
-        df = pd.DataFrame(rows)
+        html_content = await hedge.call("scraperapi", fetch_page)
+        df = await asyncio.to_thread(lambda: pd.DataFrame(iter_datacenter_cards(html_content, url)))
         logging.info(f"[{keyword}] scraped {len(df)} rows before filtering")
 
         if df.empty or "Address" not in df.columns:
             logging.warning(f"[{keyword}] No usable data found — skipping filtering.")
-            return pd.DataFrame(columns=["Name", "Type", "Address", "Link"])
+            return pd.DataFrame(columns=COLUMNS)
 
         # filter by country
-        df["_country"] = df["Address"].apply(lambda a: a.split(",")[-1].strip().lower())
-        df.loc[df["_country"] == "usa", "_country"] = "united states"
-        df = df[df["_country"] == keyword.lower()].drop(columns=["_country"])
+        df = filter_to_country(df, keyword)
         logging.info(f"[{keyword}] {len(df)} rows remain after filtering to country == '{keyword}'")
 
         return df
 
+    except limiter.CircuitOpen as e:
+        # ScraperAPI is down - fail fast (the section reports it and is not cached) instead of logging every keyword
+        logging.warning(f"[{keyword}] {e}")
+        raise
     except Exception as e:
         logging.error("==== Error Summary ====")
         logging.error(f"URL: {url}")
@@ -76,17 +111,28 @@ async def scrape_datacenter_cards_df(keyword: str) -> pd.DataFrame:
         ], ignore_index=True)
 
 
+async def scrape_keyword(keyword: str) -> pd.DataFrame:
+    args = {"keyword": keyword}
+    # a failed scrape comes back as a frame with an "error" column - shown in the report, but not cached
+    return await prefetch.call("datacenter", args, lambda: snapshot.call("datacenter", args, lambda: singleflight.call(
+        "datacenter", args, lambda: section_cache.cached_fetch(
+            "datacenter", args, lambda: scrape_datacenter_cards_df(keyword), keep=lambda df: "error" not in df.columns
+        )
+    )))
+
 async def scrape_all(keywords: list[str]) -> pd.DataFrame:
-    tasks = [scrape_datacenter_cards_df(k) for k in keywords]
-    dfs = await asyncio.gather(*tasks)
+    dfs = await asyncio.gather(*(scrape_keyword(k) for k in keywords))
     combined = pd.concat(dfs, ignore_index=True)
     deduped = combined.drop_duplicates(subset=["Link"])
     logging.info(f"Combined {len(combined)} rows → {len(deduped)} unique rows")
     return deduped
 
+async def scrape_and_markdown(keywords: list[str]) -> str:
+    df = await scrape_all(keywords)
+    return await asyncio.to_thread(df.to_markdown, index=False)
+
 def run_scrape_and_markdown(keywords: list[str]) -> str:
-    df: pd.DataFrame = asyncio.run(scrape_all(keywords))
-    return df.to_markdown(index=False)
+    return asyncio.run(scrape_and_markdown(keywords))
 
 if __name__ == "__main__":
     keys = ["iran", "pakistan", "united states"]
@@ -0,0 +1,160 @@
+'''
+Latency budgets for reports - a request's deadline_ms is split across the pipeline's stages (country resolution, then each section, and within a section its fetches and its LLM call) and every fetcher and LLM call is bounded by what is left, so one hung upstream costs a section, not the whole report. Sections still running when the report is due are detached: they finish in the background under a looser limit and fill the section cache for the next request. Cached fetches that overrun their share are detached the same way, so the fetch cache still gets their result.
+'''
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+# How the budget is split: country resolution gets this share of it, each section the rest, and
+# a section's fetches this share of what the section has left (its LLM call gets the remainder)
+COUNTRIES_SHARE = float(os.environ.get("DEADLINE_COUNTRIES_SHARE", "0.25"))
+FETCH_SHARE = float(os.environ.get("DEADLINE_FETCH_SHARE", "0.6"))
+# Kept back to stitch and send the report once the sections are due
+STITCH_RESERVE_S = 0.05
+# Limit for detached work finishing in the background
+BACKGROUND_S = float(os.environ.get("DEADLINE_BACKGROUND_S", "120"))
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """A bounded call ran out of budget."""
+
+
+class Deadline:
+    """
+    A point in time some work must finish by. Children get a share of their parent's time
+    and never outlive it - unless the parent is detached, which lifts the limit for the
+    whole subtree to BACKGROUND_S.
+    """
+
+    def __init__(self, seconds: float, parent: "Deadline" = None):
+        self.budget_ms = round(seconds * 1000)
+        self.expires_at = time.monotonic() + seconds
+        self.parent = parent
+        self._detached = False
+        # stages that missed the deadline, recorded on the request's root deadline
+        self.timed_out: list[str] = []
+
+    @property
+    def detached(self) -> bool:
+        return self._detached or (self.parent is not None and self.parent.detached)
+
+    def remaining(self) -> float:
+        own = self.expires_at - time.monotonic()
+        if self.parent is None:
+            return own
+        if self.parent.detached:
+            return self.parent.remaining()
+        return min(own, self.parent.remaining())
+
+    def child(self, share: float = 1.0) -> "Deadline":
+        return Deadline(max(0.0, self.remaining()) * share, parent=self)
+
+    def detach(self, seconds: float = BACKGROUND_S) -> None:
+        """Lets work under this deadline run on (for up to seconds) after the request has stopped waiting for it."""
+        self.expires_at = time.monotonic() + seconds
+        self._detached = True
+        self.parent = None
+
+    def root(self) -> "Deadline":
+        return self if self.parent is None else self.parent.root()
+
+    def mark_timed_out(self, stage: str) -> None:
+        self.root().timed_out.append(stage)
+        metrics.DEADLINE_EXCEEDED.labels(stage).inc()
+        logger.warning(f"[deadline] {stage} not ready in time - returning without it")
+
+
+_current: ContextVar[Deadline] = ContextVar("deadline", default=None)
+
+
+def current() -> Deadline:
+    return _current.get()
+
+
+@contextmanager
+def start(deadline_ms: int = None):
+    """Sets the request's deadline for the enclosed block; yields it (None when there is no budget)."""
+    if not deadline_ms:
+        yield None
+        return
+    budget = Deadline(deadline_ms / 1000)
+    token = _current.set(budget)
+    try:
+        yield budget
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(share: float = 1.0):
+    """Runs the block under a child deadline with share of the time left (no-op without a deadline)."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    budget = parent.child(share)
+    token = _current.set(budget)
+    try:
+        yield budget
+    finally:
+        _current.reset(token)
+
+
+def spawn(coro, share: float = 1.0) -> tuple[asyncio.Task, Deadline]:
+    """Starts coro as a task under its own child deadline, so it can be detached on its own."""
+    with stage(share) as budget:
+        return asyncio.ensure_future(coro), budget
+
+
+# Work detached from its request (late sections, timed-out fetches), running on to fill the caches - kept referenced until it finishes
+_background: set[asyncio.Task] = set()
+
+
+def finish_in_background(what: str, task: asyncio.Task, budget: Deadline) -> None:
+    """Detaches budget and lets task - the work running under it - finish in the background, logging how it ends."""
+    budget.detach()
+    _background.add(task)
+
+    def done(t: asyncio.Task) -> None:
+        _background.discard(t)
+        if t.cancelled():
+            return
+        if t.exception() is not None:
+            logger.warning(f"[deadline] {what} failed in the background: {t.exception()}")
+        else:
+            logger.info(f"[deadline] {what} finished in the background - cached for the next request")
+
+    task.add_done_callback(done)
+
+
+async def bounded(awaitable, what: str, detach: bool = False):
+    """
+    Awaits awaitable, raising DeadlineExceeded once the current deadline passes. The deadline
+    is re-read on every wake-up, so work that gets detached meanwhile carries on under the
+    background limit. On timeout the work is cancelled - or, with detach=True (cached fetches),
+    left to finish under the background limit so its result still reaches the cache.
+    """
+    budget = _current.get()
+    if budget is None:
+        return await awaitable
+    # its own deadline, so detaching it doesn't lift the limit for the caller's other work
+    task, own = spawn(awaitable)
+    try:
+        while not task.done():
+            remaining = own.remaining()
+            if remaining <= 0:
+                if detach:
+                    finish_in_background(what, task, own)
+                raise DeadlineExceeded(f"{what} timed out")
+            await asyncio.wait({task}, timeout=remaining)
+        return task.result()
+    finally:
+        if not task.done() and not own.detached:
+            task.cancel()
@@ -0,0 +1,88 @@
+'''
+Shared HTML extraction and cleaning for the scrapers - lxml with precompiled XPath selectors, rows yielded as a stream, and vectorized pandas cleaning steps that replace per-row Python loops
+'''
+from functools import lru_cache
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+from lxml import etree
+from lxml import html as lxml_html
+
+# Text the same way BeautifulSoup's get_text(strip=True) sees it: every text node stripped and
+# concatenated, skipping comments and script/style/template contents
+_TEXT_NODES = etree.XPath("descendant-or-self::text()[not(parent::script or parent::style or parent::template)]")
+
+# Cleaning rules shared by the scrapers
+COUNTRY_REPLACEMENTS = {"United States of America": "United States"}
+ADDRESS_COUNTRY_REPLACEMENTS = {"usa": "united states"}
+
+
+# ----------------------------------------
+# Parsing + selectors
+# ----------------------------------------
+def parse_html(markup: str) -> etree._Element:
+    """Parses a page or fragment (e.g. Playwright's inner_html) into an lxml tree; empty markup gives an empty document."""
+    if not markup or not markup.strip():
+        return lxml_html.document_fromstring("<html></html>")
+    return lxml_html.document_fromstring(markup)
+
+
+@lru_cache(maxsize=None)
+def xpath(expression: str) -> etree.XPath:
+    """Compiled XPath, compiled once per expression for the life of the process."""
+    return etree.XPath(expression)
+
+
+def has_class(*classes: str) -> str:
+    """XPath predicate for elements carrying all the given classes, like the CSS selector `.a.b`."""
+    return " and ".join(f"contains(concat(' ', normalize-space(@class), ' '), ' {c} ')" for c in classes)
+
+
+def first(element: etree._Element, expression: str):
+    """First match of expression under element, or None."""
+    matches = xpath(expression)(element)
+    return matches[0] if matches else None
+
+
+def text(element) -> str:
+    """Equivalent of BeautifulSoup's get_text(strip=True); "" for a missing element."""
+    if element is None:
+        return ""
+    return "".join(t.strip() for t in _TEXT_NODES(element))
+
+
+def iter_rows(container: etree._Element, row_xpath: str = ".//tr", cell_xpath: str = ".//td") -> Iterator[list[str]]:
+    """Yields the cell texts of each row under container, one row at a time."""
+    cells = xpath(cell_xpath)
+    for row in xpath(row_xpath)(container):
+        yield [text(cell) for cell in cells(row)]
+
+
+# ----------------------------------------
+# Vectorized cleaning
+# ----------------------------------------
+def forward_fill_blank(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """
+    Replaces "" cells in column with the value above them (rows that continue the previous
+    country). Only "" is filled - missing (None) cells are left alone - and a leading "" stays "".
+    """
+    values = df[column].to_numpy()
+    blank = values == ""
+    if not blank.any():
+        return df
+    source = np.where(blank, -1, np.arange(len(values)))
+    source = np.maximum.accumulate(source)
+    filled = np.where(source >= 0, values[np.maximum(source, 0)], values)
+    df[column] = filled
+    return df
+
+
+def normalize_country(series: pd.Series) -> pd.Series:
+    """Maps source-specific country spellings onto the ones the reference tables use."""
+    return series.replace(COUNTRY_REPLACEMENTS)
+
+
+def address_country(addresses: pd.Series) -> pd.Series:
+    """Lowercased country from the last comma-separated part of each address ("..., USA" -> "united states")."""
+    return addresses.str.split(",").str[-1].str.strip().str.lower().replace(ADDRESS_COUNTRY_REPLACEMENTS)
@@ -0,0 +1,227 @@
+'''
+Per-country fact sheets materialized at ingestion time - the telecom/ISP report section is assembled from these instead of being regenerated by the LLM on every report
+'''
+import hashlib
+import json
+import logging
+import os
+import time
+
+import duckdb
+import pandas as pd
+
+from backend import operators
+from backend.country_code_converter import canonical_country
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "bryan.db")
+
+# Bump when the sheet layout changes so every sheet is regenerated on the next build
+SHEET_VERSION = 3
+
+SOURCE_TABLES = ["mcc_mnc_table", "mideye_mobile_network_list", "traforama_isp_list"]
+
+
+def _source_rows(con: duckdb.DuckDBPyConnection) -> dict[str, pd.DataFrame]:
+    """Source rows per table, each with a `_country` column in the MCC table's spelling."""
+    frames = {}
+    for table in SOURCE_TABLES:
+        df = con.execute(f"SELECT * FROM {table}").df().fillna("")
+        df = df[~df["Country"].str.startswith("*")]
+        df["_country"] = df["Country"].map(canonical_country)
+        frames[table] = df
+    return frames
+
+
+def source_hash(country_rows: dict[str, pd.DataFrame], merged: bool = False) -> str:
+    """
+    Content hash of one country's source rows - order-independent, so re-scrapes that only reorder
+    rows match. merged records whether the sheet was built from the operators table.
+    """
+    digest = hashlib.sha256(f"v{SHEET_VERSION}:{'merged' if merged else 'raw'}".encode())
+    for table in SOURCE_TABLES:
+        df = country_rows[table].drop(columns=["_country"])
+        digest.update(table.encode())
+        for row in sorted("\x1f".join(map(str, r)) for r in df.itertuples(index=False, name=None)):
+            digest.update(row.encode("utf-8"))
+            digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def build_sheet(country: str, country_rows: dict[str, pd.DataFrame], merged: pd.DataFrame = None) -> dict:
+    """Structured fact sheet for one country. merged is that country's slice of the operators table, if built."""
+    mcc = country_rows["mcc_mnc_table"]
+    mideye = country_rows["mideye_mobile_network_list"]
+    traforama = country_rows["traforama_isp_list"]
+
+    if merged is not None and not merged.empty:
+        rows = merged[["Operator", "Kind", "Codes", "Also Known As"]].itertuples(index=False, name=None)
+        mobile, isps, isp_names = [], [], set()
+        for name, kind, codes, also_known_as in rows:
+            # "isp+mobile" operators appear on both lists
+            if "mobile" in kind:
+                mobile.append({"name": name, "codes": codes.split(", ") if codes else [], "also_known_as": also_known_as})
+            if "isp" in kind:
+                isps.append(name)
+                isp_names.update([name, also_known_as])
+        check_isps(country, traforama, isp_names)
+    else:
+        codes: dict[str, set] = {}
+        for name, mcc_code, mnc_code in zip(mcc["Network Operator"], mcc["Mobile Country Code"], mcc["Mobile Network Code"]):
+            codes.setdefault(name, set()).add(f"{mcc_code}-{mnc_code}")
+        for name, code in zip(mideye["Operator"], mideye["Network Code"]):
+            codes.setdefault(name, set()).update([code] if code else [])
+        mobile = [{"name": n, "codes": sorted(c), "also_known_as": ""} for n, c in sorted(codes.items())]
+        isps = sorted({p for providers in traforama["Providers"] for p in operators.split_providers(providers)})
+
+    return {
+        "country": country,
+        "iso_code": next(iter(mcc["ISO Country Code"].str.upper()), ""),
+        "dialing_code": next(iter(mcc["Country Code"]), ""),
+        "mobile_country_codes": sorted(set(mcc["Mobile Country Code"])),
+        "mobile_operators": mobile,
+        "isps": isps,
+        "counts": {
+            "mobile_operators": len(mobile),
+            "isps": len(isps),
+            "mcc_mnc_codes": len(mcc),
+        },
+    }
+
+
+def check_isps(country: str, traforama: pd.DataFrame, isp_names: set[str]) -> bool:
+    """
+    Whether every provider traforama_isp_list lists for the country is covered by the sheet's ISPs,
+    by name or alias - logs the ones that are missing, which would undercount the ISPs.
+    isp_names holds the ISP names and their comma-joined alias lists.
+    """
+    # aliases may themselves contain commas ("Telia Lietuva, AB"), so match whole words in the normalized text
+    covered = " | ".join(f" {operators.normalize_name(n)} " for n in isp_names)
+    providers = {p for providers in traforama["Providers"] for p in operators.split_providers(providers)}
+    missing = sorted(p for p in providers if f" {operators.normalize_name(p)} " not in covered)
+    if missing:
+        logger.warning(
+            f"[factsheets] {country}: sheet covers {len(providers) - len(missing)} of {len(providers)} "
+            f"traforama_isp_list providers, missing {', '.join(missing[:5])}{' …' if len(missing) > 5 else ''}"
+        )
+    return not missing
+
+
+def render_sheet(sheet: dict) -> str:
+    """Markdown for one sheet, in the shape the SQL report section used to ask the LLM for."""
+    lines = [f"### {sheet['country']}"]
+    details = []
+    if sheet["iso_code"]:
+        details.append(f"ISO: {sheet['iso_code']}")
+    if sheet["dialing_code"]:
+        details.append(f"Dialing code: +{sheet['dialing_code']}")
+    if sheet["mobile_country_codes"]:
+        details.append(f"MCC: {', '.join(sheet['mobile_country_codes'])}")
+    if details:
+        lines.append(" · ".join(details))
+    lines.append("")
+    lines.append(f"**Mobile Network Operators** ({sheet['counts']['mobile_operators']})")
+    for op in sheet["mobile_operators"]:
+        entry = f"- {op['name']}"
+        if op["codes"]:
+            entry += f" — MCC-MNC {', '.join(op['codes'])}"
+        if op["also_known_as"]:
+            entry += f" (also listed as {op['also_known_as']})"
+        lines.append(entry)
+    if not sheet["mobile_operators"]:
+        lines.append("- None listed")
+    lines.append("")
+    lines.append(f"**Internet Service Providers** ({sheet['counts']['isps']})")
+    lines.extend(f"- {isp}" for isp in sheet["isps"])
+    if not sheet["isps"]:
+        lines.append("- None listed")
+    return "\n".join(lines)
+
+
+# ----------------------------------------
+# Ingestion step
+# ----------------------------------------
+def build_fact_sheets(con: duckdb.DuckDBPyConnection) -> int:
+    """
+    Refreshes country_fact_sheets. Only countries whose source-row hash changed (or that are new)
+    are regenerated; countries that disappeared from every source are removed.
+    Run after operators.build_operators_table. Returns the number of regenerated sheets.
+    """
+    start = time.perf_counter()
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS country_fact_sheets (
+            country TEXT PRIMARY KEY,
+            source_hash TEXT,
+            sheet_json TEXT,
+            sheet_md TEXT,
+            updated_at TIMESTAMP
+        )
+    """)
+    existing = dict(con.execute("SELECT country, source_hash FROM country_fact_sheets").fetchall())
+    frames = _source_rows(con)
+    has_merged = operators.has_operators_table(con)
+    countries = sorted(set().union(*(set(df["_country"]) for df in frames.values())) - {""})
+
+    changed = []
+    for country in countries:
+        country_rows = {table: df[df["_country"] == country] for table, df in frames.items()}
+        digest = source_hash(country_rows, has_merged)
+        if existing.get(country) == digest:
+            continue
+        merged = operators.get_operators(con, [country]) if has_merged else None
+        sheet = build_sheet(country, country_rows, merged)
+        changed.append((country, digest, json.dumps(sheet), render_sheet(sheet)))
+
+    removed = sorted(set(existing) - set(countries))
+    con.execute("BEGIN TRANSACTION")
+    try:
+        if changed:
+            con.executemany(
+                "INSERT OR REPLACE INTO country_fact_sheets VALUES (?, ?, ?, ?, current_timestamp)", changed
+            )
+        if removed:
+            con.execute("DELETE FROM country_fact_sheets WHERE country IN (SELECT unnest(?))", [removed])
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+
+    logger.info(
+        f"Fact sheets: {len(changed)} regenerated, {len(countries) - len(changed)} unchanged, "
+        f"{len(removed)} removed in {time.perf_counter() - start:.2f}s"
+    )
+    return len(changed)
+
+
+def has_fact_sheets(con: duckdb.DuckDBPyConnection) -> bool:
+    return con.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = 'country_fact_sheets'"
+    ).fetchone()[0] > 0
+
+
+def get_fact_sheets(con: duckdb.DuckDBPyConnection, countries: list[str]) -> dict[str, str]:
+    """Rendered sheets for the given countries, keyed by country."""
+    return dict(con.execute(
+        "SELECT country, sheet_md FROM country_fact_sheets WHERE country IN (SELECT unnest(?))",
+        [[canonical_country(c) for c in countries]],
+    ).fetchall())
+
+
+def assemble_sql_section(con: duckdb.DuckDBPyConnection, countries: list[str]) -> str:
+    """The telecom/ISP report section for the selected countries, straight from the stored sheets."""
+    sheets = get_fact_sheets(con, countries)
+    parts = []
+    for country in sorted({canonical_country(c) for c in countries}):
+        parts.append(sheets.get(country) or f"### {country}\nNo operator or ISP data in the reference tables.")
+    return "\n\n".join(parts) or "No SQL data found."
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    con = duckdb.connect(DB_PATH)
+    try:
+        operators.build_operators_table(con)
+        build_fact_sheets(con)
+    finally:
+        con.close()
@@ -3,40 +3,44 @@ Orchestration pipeline from all the scrapers, SQL handlers and LLM calls - this
 '''
 import os
 import logging
-import duckdb
 from backend import broadsqlasync
 from backend import asynccloudflare
-from backend.datacenter import run_scrape_and_markdown 
+from backend import cache
+from backend import context_encoder
+from backend import deadline
+from backend import factsheets
+from backend import metrics
+from backend import operators
+from backend import prefetch
+from backend import resources
+from backend import section_cache
+from backend import singleflight
+from backend import snapshot
+from backend import timing
+from backend.datacenter import scrape_and_markdown
 from backend.ooni import scrape_ooni_explorer   
 from backend.country_code_converter import get_alpha2_from_country_name
 from langchain.prompts import PromptTemplate
 import asyncio
-import concurrent.futures  
-from dotenv import load_dotenv
+import contextvars
+import functools
 
 # --- Init ---
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Connect to DuckDB database
-DB_PATH = os.path.join(os.path.dirname(__file__), "bryan.db")
-con = duckdb.connect(DB_PATH)
+# Map-reduce kicks in when a query resolves to at least this many countries (e.g. "Africa")
+MAP_REDUCE_MIN_COUNTRIES = int(os.environ.get("MAP_REDUCE_MIN_COUNTRIES", "8"))
+RADAR_CHUNK_SIZE = int(os.environ.get("RADAR_CHUNK_SIZE", "4"))
 
-from langchain_openai import ChatOpenAI
-import os
-
-project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-load_dotenv(os.path.join(project_root, '.env'))
-
-open_ai_api_key = os.environ.get("OPENAI_API_KEY")
-if not open_ai_api_key:
-    raise ValueError("OpenAI environment variable not set in .env file.")
+# Follows a report's stages ("countries" and each section) - set by the job workers (see jobs.py)
+# and called with (stage, state), state being "running", "done", "failed" or "timed_out"
+progress_listener: contextvars.ContextVar = contextvars.ContextVar("progress_listener", default=None)
 
-llm = ChatOpenAI(
-    model="gpt-4.1-nano",  # This is the GPT-4.1 "Turbo" model
-    openai_api_key=open_ai_api_key,
-  
-)
+def report_progress(stage: str, state: str) -> None:
+    listener = progress_listener.get()
+    if listener is not None:
+        listener(stage, state)
 
 # ----------------------------------------
 # Async-compatible Data Fetchers & LLM Callers
@@ -44,32 +48,63 @@ llm = ChatOpenAI(
 
 async def run_blocking_in_executor(func, *args, **kwargs):
     loop = asyncio.get_running_loop()
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        return await loop.run_in_executor(executor, func, *args, **kwargs)
+    # run_in_executor does not carry contextvars over - copy them so the thread sees this request's snapshot/timings
+    context = contextvars.copy_context()
+    # the loop's shared default pool - a pool per call spawned (and joined) a thread on the event loop each time
+    return await loop.run_in_executor(None, functools.partial(context.run, func, *args, **kwargs))
 
 async def async_run_scrape_and_markdown_wrapper(countries_list: list[str]) -> str:
     logger.info(f"[DC] Asynchronously scraping data centers for: {countries_list}")
-    return await run_blocking_in_executor(run_scrape_and_markdown, countries_list)
+    with timing.stage("dc.fetch"):
+        return await deadline.bounded(scrape_and_markdown(countries_list), "datacenters.com scrape")
 
 async def async_scrape_ooni_explorer_wrapper(test_name: str, horizon: int, country: str, only_anomalies: bool) -> tuple[str, int, int]:
-    return await scrape_ooni_explorer(
-        test_name=test_name,
-        horizon=horizon,
-        country=country,
-        only_anomalies=only_anomalies
-    )
+    with timing.stage("ooni.fetch"):
+        args = {"test_name": test_name, "horizon": horizon, "country": country, "only_anomalies": only_anomalies}
+        return await prefetch.call("ooni", args, lambda: deadline.bounded(
+            snapshot.call("ooni", args, lambda: singleflight.call("ooni", args, lambda: section_cache.cached_fetch(
+                "ooni", args, lambda: scrape_ooni_explorer(**args)
+            ))),
+            "OONI fetch", detach=True
+        ))
 
 async def async_fetch_and_format_markdown_wrapper(country: str = "", date_range: str = "30d") -> str:
     logger.info(f"[CF] Directly awaiting async Radar data for country: {country}")
-    return await asynccloudflare.fetch_and_format_markdown(country=country, date_range=date_range)
+    with timing.stage("radar.fetch"):
+        args = {"country": country, "date_range": date_range}
+        return await prefetch.call("radar", args, lambda: deadline.bounded(
+            snapshot.call("radar", args, lambda: singleflight.call("radar", args, lambda: section_cache.cached_fetch(
+                "radar", args, lambda: asynccloudflare.fetch_and_format_markdown(**args), keep=asynccloudflare.is_complete
+            ))),
+            "Radar fetch", detach=True
+        ))
+
+async def call_llm(prompt: str) -> str:
+    # the LLM limiter (see limiter.py) caps how many calls hit the API at once - waiting for it is timed as llm.queue
+    return await resources.ainvoke(prompt, stage="llm")
+
+async def invoke_llm(prompt: str) -> str:
+    args = {"model": resources.LLM_MODEL, "prompt": prompt}
+    # reports summarizing the same data at the same time share one call (see singleflight.py),
+    # and the answer is reused by later reports and other workers (see cache.py)
+    content = await deadline.bounded(
+        snapshot.call("llm", args, lambda: singleflight.call(
+            "llm", args, lambda: section_cache.cached_llm(args, lambda: call_llm(prompt))
+        )),
+        "LLM call"
+    )
+    return content.strip()
 
 # --- Section-specific LLM callers ---
 
 async def answer_sql_section(user_query: str, sql_context: str) -> str:
     prompt = PromptTemplate.from_template(
         """
-You are a telecom market analyst.  Below are three raw tables listing
-mobile network operators and ISPs for various countries:
+You are a telecom market analyst.  Below are tables listing mobile network
+operators and ISPs for various countries - either the raw source tables, or a
+single `operators` table that already merges them (its Kind column says whether
+an entry is a mobile operator, an ISP, or both).
+{format_note}
 
 {sql_context}
 
@@ -81,9 +116,8 @@ Produce a summary by country in Markdown.  For each country:
 
 Make sure each country section is consistent and neatly bullet-listed.
 """
-    ).format(sql_context=sql_context)
-    resp = await llm.ainvoke(prompt)
-    return resp.content.strip()
+    ).format(sql_context=sql_context, format_note=context_encoder.FORMAT_NOTE)
+    return await invoke_llm(prompt)
 
 async def answer_dc_section(dc_context: str) -> str:
     prompt = PromptTemplate.from_template(
@@ -102,8 +136,7 @@ You are a global infrastructure specialist.  Below is a raw Markdown table of da
 4. Ensure every row is correctly formatted and sorted alphabetically by country.
 """
     ).format(dc_context=dc_context)
-    resp = await llm.ainvoke(prompt)
-    return resp.content.strip()
+    return await invoke_llm(prompt)
 
 # --- UPDATED answer_ooni_section to expect Country & Test columns ---
 async def answer_ooni_section(ooni_context: str) -> str:
@@ -122,8 +155,7 @@ You are a network measurement expert.  Below is raw OONI Explorer data, with eac
 - After the table, add a bullet list **“High-anomaly alerts”** listing any country/test whose anomaly rate exceeds 5%.  
 """
     ).format(ooni_context=ooni_context)
-    resp = await llm.ainvoke(prompt)
-    return resp.content.strip()
+    return await invoke_llm(prompt)
 
 async def answer_radar_section(radar_context: str, date_range: str) -> str:
     print(f"RADAR CONTEXT TO LLM {radar_context}")
@@ -158,110 +190,345 @@ The data is a series of metrics for each country, including Device Type, IP Vers
 {radar_context}
 """
     ).format(radar_context=radar_context, date_range=date_range)
-    resp = await llm.ainvoke(prompt)
-    return resp.content.strip()
+    return await invoke_llm(prompt)
+
+# --- Map-reduce for many-country reports ---
+
+# Radar metrics the section renders as one table each, with a column per country
+RADAR_METRICS = ("Device Type", "IP Version", "HTTP Version", "TLS Version", "OS")
+
+async def map_reduce(contexts: list[str], map_fn, reduce_fn=None) -> str:
+    """
+    Runs map_fn over each context concurrently (bounded by the LLM limiter), then reduce_fn over the
+    partial answers in order - by default they are just joined, for partials that don't overlap.
+    Each partial answer is an LLM call on its own context, so the LLM cache (see
+    section_cache.cached_llm) summarizes a country shared by two reports only once.
+    """
+    partials = await asyncio.gather(*(map_fn(context) for context in contexts))
+    if reduce_fn is None:
+        return "\n\n".join(partials)
+    return await reduce_fn(list(partials))
+
+def encode_per_country(sql_frames: list, countries: list[str]) -> list[str]:
+    contexts = []
+    for country in sorted(set(countries)):
+        frames = [(table, df[df["Country"] == country]) for table, df in sql_frames]
+        contexts.append(context_encoder.encode_tables(frames))
+    return contexts
+
+async def answer_sql_section_map_reduce(user_query: str, sql_frames: list, countries: list[str]) -> str:
+    # pandas-heavy - keep it off the event loop
+    contexts = await run_blocking_in_executor(encode_per_country, sql_frames, countries)
+    logger.info(f"[SQL] Map-reduce over {len(contexts)} countries")
+    # each partial is one `### Country` block, so joining them is the whole reduce
+    return await map_reduce(contexts, lambda ctx: answer_sql_section(user_query, ctx))
+
+def split_metric_tables(markdown: str) -> tuple[list[str], str]:
+    """Pulls the per-metric tables (first header cell a RADAR_METRICS name) out of one chunk's answer; returns them and the rest."""
+    lines = markdown.splitlines()
+    tables, rest = [], []
+    i = 0
+    while i < len(lines):
+        if not lines[i].lstrip().startswith("|"):
+            rest.append(lines[i])
+            i += 1
+            continue
+        end = i
+        while end < len(lines) and lines[end].lstrip().startswith("|"):
+            end += 1
+        table = lines[i:end]
+        first_cell = table[0].strip().strip("|").split("|")[0].strip().strip("*").strip()
+        if first_cell in RADAR_METRICS:
+            tables.append("\n".join(table))
+            # drop the table's own heading too, e.g. "### Device Type"
+            while rest and not rest[-1].strip():
+                rest.pop()
+            if rest and rest[-1].lstrip().startswith("#") and any(m in rest[-1] for m in RADAR_METRICS):
+                rest.pop()
+        else:
+            rest.extend(table)
+        i = end
+    return tables, "\n".join(rest).strip()
 
-# ----------------------------------------
-# Main Asynchronous Pipeline
-# ----------------------------------------
-async def async_combined_pipeline(
-    user_query: str,
-    sql_tables: list[str],
-    test_names: list[str],
-    only_anomalies: bool = False,
-    horizon: int = 30
-) -> str:
-    report_parts = {}
-
-    # 1) SQL Context
-    sql_blocks = []
-    countries_list: list[str] = []
-    async def get_sql_data():
-        nonlocal countries_list
-        for i, table in enumerate(sql_tables):
+async def answer_radar_reduce(metric_tables: list[str]) -> str:
+    prompt = PromptTemplate.from_template(
+        """
+You are a web-traffic analyst.  Below are Markdown tables of Cloudflare Radar metrics, several tables per
+metric because the countries were summarized in groups:
+
+{metric_tables}
+
+**Task**
+- Merge them into exactly one Markdown table per metric (Device Type, IP Version, HTTP Version, TLS Version, OS).
+- The first column is the metric's categories, then one column per country, in the order the countries first appear.
+- Keep every value exactly as given; leave a cell empty when a country has no value for that category.
+- Output only the merged tables, each under a `### <Metric>` heading.
+"""
+    ).format(metric_tables="\n\n".join(metric_tables))
+    return await invoke_llm(prompt)
+
+async def merge_radar_partials(partials: list[str]) -> str:
+    """Reduce for Radar chunks: one LLM call merges the per-metric tables, the per-country domain tables are kept as they are."""
+    metric_tables, rests = [], []
+    for partial in partials:
+        tables, rest = split_metric_tables(partial)
+        metric_tables.extend(tables)
+        if rest:
+            rests.append(rest)
+    if not metric_tables:
+        return "\n\n".join(partials)
+    return "\n\n".join([await answer_radar_reduce(metric_tables), *rests])
+
+async def answer_radar_section_map_reduce(radar_blocks: list[tuple[str, str]], date_range: str) -> str:
+    contexts = []
+    for i in range(0, len(radar_blocks), RADAR_CHUNK_SIZE):
+        chunk = radar_blocks[i:i + RADAR_CHUNK_SIZE]
+        contexts.append(context_encoder.fit_blocks([block for _, block in chunk]))
+    logger.info(f"[Radar] Map-reduce over {len(contexts)} chunks of up to {RADAR_CHUNK_SIZE} countries")
+    return await map_reduce(contexts, lambda ctx: answer_radar_section(ctx, date_range), merge_radar_partials)
+
+# --- Per-section builders: each fetches its own inputs, so a memoized section skips its fetches too ---
+
+async def run_db(func, *args):
+    """Runs func(cursor, *args) in a worker thread, timed as the "db" stage."""
+    # executor threads must not share the connection - each query gets its own cursor
+    with timing.stage("db"):
+        return await run_blocking_in_executor(func, resources.get_con().cursor(), *args)
+
+def read_table(con, table: str):
+    return con.execute(f"SELECT * FROM {table}").df()
+
+async def resolve_countries(user_query: str, first_table: str) -> list[str]:
+    # The LLM country pick only depends on the query and the reference data, so memoize it alongside the sections
+    version = await run_db(section_cache.reference_data_version)
+    key = section_cache.fingerprint("countries", {"query": user_query, "table": first_table, "data": version})
+
+    async def pick_countries() -> list[str]:
+        logger.info(f"[SQL] Querying table: {first_table}")
+        df = await run_db(read_table, first_table)
+        return await broadsqlasync.extract_relevant_rows(df, user_query)
+
+    return await cache.cached("countries", key, pick_countries, section_cache.SECTION_CACHE_TTL, keep=bool)
+
+async def resolve_countries_once(user_query: str, first_table: str) -> list[str]:
+    # a batch resolves every report's countries up front (see batch.py)
+    args = {"query": user_query, "table": first_table}
+    return await prefetch.call("countries", args, lambda: resolve_countries(user_query, first_table))
+
+async def build_sql_section(user_query: str, sql_tables: list[str], countries_list: list[str]) -> tuple[str, bool]:
+    # sheets cover all three reference tables, so only use them when the report asks for all three
+    if set(factsheets.SOURCE_TABLES) <= set(sql_tables) and await run_db(factsheets.has_fact_sheets):
+        # precomputed at ingestion (see factsheets.py) - no LLM call needed
+        return await run_db(factsheets.assemble_sql_section, countries_list), True
+
+    sql_frames = []
+    if await run_db(operators.has_operators_table):
+        # merged once at ingestion (see operators.py) - one deduplicated list per country
+        merged = await run_db(operators.get_operators, countries_list, sql_tables)
+        sql_frames.append(("operators", merged))
+    else:
+        for table in sql_tables:
             logger.info(f"[SQL] Querying table: {table}")
-            df = await run_blocking_in_executor(con.execute, f"SELECT * FROM {table}")
-            df = df.df()
-            if i == 0:
-                countries = await broadsqlasync.extract_relevant_rows(df, user_query)
-                countries_list.extend(countries)
-            filtered = broadsqlasync.filter_df(df, "Country", countries_list)
-            sql_blocks.append(f"### {table}\n{broadsqlasync.df_to_markdown(filtered)}")
-        return "\n\n".join(sql_blocks) or "No SQL data found."
-    sql_context = await get_sql_data()
-
-    # Kick off Data Center scrape
-    dc_task = asyncio.create_task(async_run_scrape_and_markdown_wrapper(countries_list))
-
-    # Collect OONI tasks with context
-    ooni_tasks: list[tuple[str,str,asyncio.Task]] = []
+            df = await run_db(read_table, table)
+            sql_frames.append((table, broadsqlasync.filter_df(df, "Country", countries_list)))
+
+    if len(countries_list) >= MAP_REDUCE_MIN_COUNTRIES:
+        return await answer_sql_section_map_reduce(user_query, sql_frames, countries_list), True
+    sql_context = await run_blocking_in_executor(context_encoder.encode_tables, sql_frames) if sql_frames else "No SQL data found."
+    return await answer_sql_section(user_query, sql_context), True
+
+async def build_dc_section(countries_list: list[str]) -> tuple[str, bool]:
+    # a single fetch, so no fetch share - cutting it short would leave nothing to summarize; past the
+    # report's deadline the whole section is detached instead and the scrape finishes in the background
+    try:
+        dc_result = await async_run_scrape_and_markdown_wrapper(countries_list)
+    except Exception as e:
+        return f"Error: {e}", False
+    return await answer_dc_section(dc_result), True
+
+def fetch_timeout_note(stage: str, results: list) -> str:
+    """Flags a section summarized without the fetches that ran out of their share of the deadline."""
+    timed_out = sum(isinstance(r, deadline.DeadlineExceeded) for r in results)
+    if not timed_out:
+        return ""
+    deadline.current().mark_timed_out(stage)
+    return f"\n\n_Partial: {timed_out} of {len(results)} fetches timed out and are not included._"
+
+async def build_ooni_section(countries_list: list[str], test_names: list[str], horizon: int, only_anomalies: bool) -> tuple[str, bool]:
+    ooni_jobs: list[tuple[str, str, str]] = []
     for test_name in test_names:
         for country in countries_list:
             alpha2 = get_alpha2_from_country_name(country) or ""
             if not alpha2: continue
-            task = asyncio.create_task(
-                async_scrape_ooni_explorer_wrapper(test_name, horizon, alpha2, only_anomalies)
-            )
-            ooni_tasks.append((test_name, country, task))
-
-    # Collect Radar tasks
-    date_range = f"{horizon}d"
-    radar_tasks: list[asyncio.Task] = []
-    for country in countries_list:
-        alpha2 = get_alpha2_from_country_name(country) or ""
-        if alpha2:
-            radar_tasks.append(
-                asyncio.create_task(
-                    async_fetch_and_format_markdown_wrapper(alpha2, date_range)
-                )
-            )
-
-    # 2) Generate SQL section
-    sql_ans = await answer_sql_section(user_query, sql_context)
-    report_parts["sql"] = f"## Telecommunications and ISP Summary\n{sql_ans}"
-    logger.info("Generated SQL section.")
-
-    # 3) Wait for DC, OONI & Radar in parallel
-    logger.info("Starting concurrent fetch for DC, OONI, Radar.")
-    dc_result, ooni_results, radar_results = await asyncio.gather(
-        dc_task,
-        asyncio.gather(*(t for _,_,t in ooni_tasks), return_exceptions=True),
-        asyncio.gather(*radar_tasks, return_exceptions=True),
-        return_exceptions=True
-    )
-
-    # 4) Data Centers section
-    if isinstance(dc_result, Exception):
-        report_parts["dc"] = f"## Data Centers\nError: {dc_result}"
-    else:
-        dc_ans = await answer_dc_section(dc_result)
-        report_parts["dc"] = f"## Data Centers\n{dc_ans}"
-
-    # 5) Process OONI: build a labeled markdown context
+            ooni_jobs.append((test_name, country, alpha2))
+    # fetches get a share of the section's budget so there is time left to summarize whatever arrived
+    with deadline.stage(deadline.FETCH_SHARE):
+        ooni_results = await asyncio.gather(
+            *(async_scrape_ooni_explorer_wrapper(test_name, horizon, alpha2, only_anomalies) for test_name, _, alpha2 in ooni_jobs),
+            return_exceptions=True
+        )
+
+    # Build a labeled markdown context
+    complete = True
     ooni_lines = ["| Country | Test | Anomalies | Accessible |"]
-    for (test_name, country, _), result in zip(ooni_tasks, ooni_results):
+    for (test_name, country, _), result in zip(ooni_jobs, ooni_results):
         if isinstance(result, Exception):
             logger.warning(f"OONI {test_name}/{country} failed: {result}")
+            complete = False
         else:
             md_table, anomalies, accessible = result
             # assume md_table is single-table; we just record counts here
             ooni_lines.append(f"| {country} | {test_name.title()} | {anomalies} | {accessible} |")
     ooni_context = "\n".join(ooni_lines) if len(ooni_lines)>1 else "No OONI data found."
-    ooni_ans = await answer_ooni_section(ooni_context)
-    report_parts["ooni"] = f"## Communications Tests (OONI Explorer)\n{ooni_ans}"
+    return await answer_ooni_section(ooni_context) + fetch_timeout_note("ooni.fetch", ooni_results), complete
 
-    # 6) Process Radar
+async def build_radar_section(countries_list: list[str], horizon: int) -> tuple[str, bool]:
+    date_range = f"{horizon}d"
+    radar_countries = [(c, get_alpha2_from_country_name(c) or "") for c in countries_list]
+    radar_countries = [(c, alpha2) for c, alpha2 in radar_countries if alpha2]
+    with deadline.stage(deadline.FETCH_SHARE):
+        radar_results = await asyncio.gather(
+            *(async_fetch_and_format_markdown_wrapper(alpha2, date_range) for _, alpha2 in radar_countries),
+            return_exceptions=True
+        )
+
+    complete = True
     radar_blocks = []
-    for res in radar_results:
+    for (country, _), res in zip(radar_countries, radar_results):
         if isinstance(res, Exception):
             logger.warning(f"Radar fetch failed: {res}")
+            complete = False
         else:
-            radar_blocks.append(res)
-    radar_context = "\n\n".join(radar_blocks) or "No Radar data found."
-    radar_ans = await answer_radar_section(radar_context, date_range)
-    report_parts["radar"] = f"## Device and Domain Data (Cloudflare Radar)\n{radar_ans}"
+            # some metrics failed - use what arrived, but don't cache the section on it
+            complete = complete and asynccloudflare.is_complete(res)
+            radar_blocks.append((country, res))
+    if len(countries_list) >= MAP_REDUCE_MIN_COUNTRIES and radar_blocks:
+        answer = await answer_radar_section_map_reduce(radar_blocks, date_range)
+        return answer + fetch_timeout_note("radar.fetch", radar_results), complete
+    radar_context = context_encoder.fit_blocks([b for _, b in radar_blocks]) if radar_blocks else "No Radar data found."
+    return await answer_radar_section(radar_context, date_range) + fetch_timeout_note("radar.fetch", radar_results), complete
+
+async def timed_section(section: str, inputs: dict, compute) -> str:
+    report_progress(section, "running")
+    try:
+        with timing.stage(f"section.{section}"), metrics.llm_call(section):
+            answer = await section_cache.cached_section(section, inputs, compute)
+    except Exception:
+        report_progress(section, "failed")
+        raise
+    report_progress(section, "done")
+    return answer
+
+# ----------------------------------------
+# Deadlines
+# ----------------------------------------
+async def wait_within_deadline(due: deadline.Deadline, stages: dict[str, tuple[asyncio.Task, deadline.Deadline]]) -> dict:
+    """
+    Waits for each stage's task until due (less the time kept back to stitch the report). Stages
+    still running then are marked timed out, detached and map to None; with no deadline this waits
+    for everything. A stage failing for any other reason cancels the rest and raises, like gather.
+    """
+    tasks = {task for task, _ in stages.values()}
+    timeout = None if due is None else max(0.0, due.remaining() - deadline.STITCH_RESERVE_S)
+    try:
+        await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_EXCEPTION)
+    except asyncio.CancelledError:
+        for task in tasks:
+            task.cancel()
+        raise
+    failed = [t for t in tasks if t.done() and not t.cancelled() and t.exception() is not None
+              and not isinstance(t.exception(), deadline.DeadlineExceeded)]
+    if failed:
+        for task in tasks:
+            task.cancel()
+        raise failed[0].exception()
+
+    results = {}
+    for name, (task, budget) in stages.items():
+        if task.done() and task.exception() is None:
+            results[name] = task.result()
+            continue
+        due.mark_timed_out(name)
+        report_progress(name, "timed_out")
+        if not task.done():
+            deadline.finish_in_background(name, task, budget)
+        results[name] = None
+    return results
+
+def timed_out_notice(deadline_ms: int) -> str:
+    return (f"_Timed out: not ready within this report's {deadline_ms} ms deadline. "
+            "It is still being built and will be served from cache by the next report._")
 
-    # 7) Stitch report
+# ----------------------------------------
+# Main Asynchronous Pipeline
+# ----------------------------------------
+async def async_combined_pipeline(
+    user_query: str,
+    sql_tables: list[str],
+    test_names: list[str],
+    only_anomalies: bool = False,
+    horizon: int = 30
+) -> str:
+    # With a deadline (see deadline.py) every stage runs under its share of the budget and the
+    # report is returned on time with whatever sections are ready; without one this waits for everything
+    budget = deadline.current()
+    headings = {
+        "sql": "## Telecommunications and ISP Summary",
+        "dc": "## Data Centers",
+        "ooni": "## Communications Tests (OONI Explorer)",
+        "radar": "## Device and Domain Data (Cloudflare Radar)",
+    }
+
+    # 1) Resolve countries from the first reference table
+    async def countries_stage() -> list[str]:
+        report_progress("countries", "running")
+        with timing.stage("countries"), metrics.llm_call("countries"):
+            countries = await resolve_countries_once(user_query, sql_tables[0]) if sql_tables else []
+        report_progress("countries", "done")
+        return countries
+
+    countries_task, countries_budget = deadline.spawn(countries_stage(), deadline.COUNTRIES_SHARE)
+    resolved = await wait_within_deadline(countries_budget, {"countries": (countries_task, countries_budget)})
+    if resolved["countries"] is None:
+        # nothing can be built without the countries - return the empty report on time
+        return "\n\n".join(f"{heading}\n{timed_out_notice(budget.budget_ms)}" for heading in headings.values())
+    countries_list = resolved["countries"]
+    countries = sorted(set(countries_list))
+
+    # 2) Build all sections concurrently; each is memoized on the fingerprint of its own inputs,
+    #    so only sections whose countries, source data version or prompt version changed are recomputed
+    reference_version = await run_db(section_cache.reference_data_version)
+    logger.info("Building SQL, DC, OONI and Radar sections concurrently.")
+    sections = {
+        "sql": deadline.spawn(timed_section(
+            "sql",
+            {"countries": countries, "tables": sorted(sql_tables), "data": reference_version},
+            lambda: build_sql_section(user_query, sql_tables, countries_list),
+        )),
+        "dc": deadline.spawn(timed_section(
+            "dc",
+            {"countries": countries, "data": section_cache.datacenter_data_version()},
+            lambda: build_dc_section(countries_list),
+        )),
+        "ooni": deadline.spawn(timed_section(
+            "ooni",
+            {"countries": countries, "tests": sorted(test_names), "horizon": horizon,
+             "only_anomalies": bool(only_anomalies), "data": section_cache.ooni_data_version()},
+            lambda: build_ooni_section(countries_list, test_names, horizon, only_anomalies),
+        )),
+        "radar": deadline.spawn(timed_section(
+            "radar",
+            {"countries": countries, "horizon": horizon, "data": section_cache.radar_data_version()},
+            lambda: build_radar_section(countries_list, horizon),
+        )),
+    }
+    answers = await wait_within_deadline(budget, sections)
+
+    # 3) Stitch report
+    report_parts = {
+        name: f"{headings[name]}\n{answer if answer is not None else timed_out_notice(budget.budget_ms)}"
+        for name, answer in answers.items()
+    }
     return "\n\n".join(report_parts.values())
 
 # ----------------------------------------
@@ -0,0 +1,153 @@
+'''
+Hedged requests - the slow tail of an idempotent upstream GET (datacenters.com via ScraperAPI, OONI) is usually one slow request, not a slow upstream. If a request hasn't answered by HEDGE_PERCENTILE of that upstream's recent latencies, a duplicate is sent, the first to succeed wins and the other is cancelled.
+Hedges spend from a budget that grows by HEDGE_BUDGET per call, so they add at most that share of extra requests. Each attempt holds its own slot in the upstream's limiter, and is timed from when it gets it - a request queued behind the rate limit isn't a slow request.
+
+    HEDGE_PERCENTILE=95     # hedge a request once it is slower than this share of recent ones
+    HEDGE_BUDGET=0.1        # duplicate requests per call, at most
+    HEDGE_MIN_SAMPLES=20    # recent latencies needed before hedging an upstream
+'''
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+
+from backend import limiter
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", "0.1"))
+HEDGE_MIN_SAMPLES = int(os.environ.get("HEDGE_MIN_SAMPLES", "20"))
+# Recent successful request latencies kept per upstream
+HEDGE_WINDOW = 200
+# Unspent budget saved up, at most - caps a burst of hedges after a quiet spell
+HEDGE_MAX_SAVED = 10.0
+
+
+class Attempt:
+    """One fetch() run under the upstream's limiter slot, timed from when the slot is held - waiting for it isn't upstream latency."""
+
+    def __init__(self, name: str, fetch):
+        self.sent = asyncio.Event()
+        self.sent_at: float | None = None
+        self.task = asyncio.ensure_future(self._run(name, fetch))
+
+    async def _run(self, name: str, fetch):
+        async with limiter.limit(name):
+            self.sent_at = time.perf_counter()
+            self.sent.set()
+            return await fetch()
+
+    async def wait_sent(self) -> None:
+        """Returns once the request is sent, or the attempt ended before it could be (e.g. an open circuit)."""
+        sent = asyncio.ensure_future(self.sent.wait())
+        try:
+            await asyncio.wait({self.task, sent}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sent.cancel()
+
+    def elapsed(self, now: float) -> float | None:
+        return None if self.sent_at is None else now - self.sent_at
+
+
+class Hedger:
+    """Recent latencies and hedge budget for one upstream."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: deque[float] = deque(maxlen=HEDGE_WINDOW)
+        self.budget = 0.0
+
+    def delay(self) -> float | None:
+        """How long to wait before hedging, or None while there are too few samples."""
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))]
+
+    def spend(self) -> bool:
+        if self.budget < 1:
+            return False
+        self.budget -= 1
+        return True
+
+    def record(self, attempt: Attempt, now: float) -> None:
+        elapsed = attempt.elapsed(now)
+        if elapsed is not None:
+            self.latencies.append(elapsed)
+
+    async def call(self, fetch):
+        """Awaits fetch() under the upstream's limiter, racing a second fetch() against it if the first is slow."""
+        self.budget = min(HEDGE_MAX_SAVED, self.budget + HEDGE_BUDGET)
+        delay = self.delay()
+        primary = Attempt(self.name, fetch)
+        attempts = [primary]
+        try:
+            # the hedge delay runs from when the request is sent, not from when it queued for a slot
+            await primary.wait_sent()
+            done, _ = await asyncio.wait({primary.task}, timeout=delay)
+            if done:
+                result = primary.task.result()
+                self.record(primary, time.perf_counter())
+                metrics.HEDGES.labels(self.name, "none").inc()
+                return result
+            if not self.spend():
+                metrics.HEDGES.labels(self.name, "skipped").inc()
+                result = await primary.task
+                self.record(primary, time.perf_counter())
+                return result
+
+            logger.debug(f"[hedge] {self.name} request slower than {delay:.3f}s - sending a duplicate")
+            hedge = Attempt(self.name, fetch)
+            attempts.append(hedge)
+            pending = {a.task for a in attempts}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((a for a in attempts if a.task in done and not a.task.exception()), None)
+                if winner is not None:
+                    break
+            else:
+                # both failed - surface the original request's error
+                raise primary.task.exception()
+
+            now = time.perf_counter()
+            loser = primary if winner is hedge else hedge
+            self.record(winner, now)
+            # the loser was at least this slow - keep it in the window so the percentile doesn't drift down
+            self.record(loser, now)
+            metrics.HEDGES.labels(self.name, "won" if winner is hedge else "lost").inc()
+            return winner.task.result()
+        finally:
+            for attempt in attempts:
+                if not attempt.task.done():
+                    attempt.task.cancel()
+
+
+# Latency windows and budgets per upstream - plain data, shared by every event loop
+_hedgers: dict[str, Hedger] = {}
+
+
+def get_hedger(name: str) -> Hedger:
+    if name not in _hedgers:
+        _hedgers[name] = Hedger(name)
+    return _hedgers[name]
+
+
+async def call(name: str, fetch):
+    """
+    Awaits fetch() - one idempotent request to upstream name - under that upstream's limiter
+    (see limiter.py), hedged with a duplicate fetch() in a slot of its own if it is slow.
+    fetch must be safe to run twice at once; the losing request is cancelled.
+    """
+    return await get_hedger(name).call(fetch)
+
+
+def states() -> dict[str, dict]:
+    """Current hedge delay and saved budget per upstream, for /debug/upstreams."""
+    return {
+        name: {"hedge_after_s": None if (d := h.delay()) is None else round(d, 3), "hedge_budget": round(h.budget, 2),
+               "samples": len(h.latencies)}
+        for name, h in _hedgers.items()
+    }
@@ -0,0 +1,323 @@
+'''
+Single ingestion command for the reference tables - scrapes MCC, Mideye and Traforama concurrently, bulk loads into a staging schema, validates, swaps the live tables in one transaction and records timings.
+Sources whose extracted content hashes the same as last time (or that answer 304 Not Modified) are not re-parsed or re-loaded.
+
+    python -m backend.ingest                       # refresh every source once
+    python -m backend.ingest --sources mcc mideye  # refresh some sources
+    python -m backend.ingest --every 24            # keep refreshing every 24 hours
+    python -m backend.ingest --force               # reload even if the content is unchanged
+'''
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass
+
+import duckdb
+import pandas as pd
+
+from backend import browser_pool
+from backend import factsheets
+from backend import mcc
+from backend import mideye
+from backend import operators
+from backend import traforama
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "bryan.db")
+
+# Refuse a swap that would shrink a live table by more than this fraction
+MAX_SHRINK = 0.1
+
+METADATA_TABLE = "ingestion_metadata"
+
+
+@dataclass
+class Source:
+    name: str
+    table: str
+    fetch_content: object  # async (validators) -> (extracted markup or None if not modified, new validators)
+    parse: object  # markup -> pd.DataFrame
+    columns: list[str]
+    min_rows: int
+
+
+SOURCES = {
+    "mcc": Source(
+        "mcc", mcc.TABLE_NAME, mcc.fetch_content, mcc.parse_content,
+        ["Mobile Country Code", "Mobile Network Code", "ISO Country Code", "Country", "Country Code", "Network Operator"],
+        mcc.EXPECTED_ROWS,
+    ),
+    "mideye": Source(
+        "mideye", mideye.TABLE_NAME, mideye.fetch_content, mideye.parse_content,
+        ["Country", "Operator", "Network Code", "Display Text"],
+        mideye.MIN_ROWS,
+    ),
+    "traforama": Source(
+        "traforama", traforama.TABLE_NAME, traforama.fetch_content, traforama.parse_content,
+        ["Country", "Providers"],
+        traforama.MIN_ROWS,
+    ),
+}
+
+
+class ValidationError(ValueError):
+    """Raised when scraped data should not replace the live table."""
+
+
+def _ensure_metadata_tables(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute("CREATE SCHEMA IF NOT EXISTS staging")
+    con.execute("""
+        CREATE TABLE IF NOT EXISTS ingestion_runs (
+            run_id TEXT,
+            source TEXT,
+            started_at TIMESTAMP,
+            fetch_seconds DOUBLE,
+            load_seconds DOUBLE,
+            row_count INTEGER,
+            status TEXT,
+            error TEXT
+        )
+    """)
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {METADATA_TABLE} (
+            source TEXT PRIMARY KEY,
+            table_name TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            row_count INTEGER,
+            checked_at TIMESTAMP,
+            changed_at TIMESTAMP
+        )
+    """)
+
+
+def _table_exists(con: duckdb.DuckDBPyConnection, table: str) -> bool:
+    return con.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_schema = 'main' AND table_name = ?", [table]
+    ).fetchone()[0] > 0
+
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_metadata(con: duckdb.DuckDBPyConnection) -> dict[str, dict]:
+    """{source: {etag, last_modified, content_hash, row_count, checked_at, changed_at}} for ingested sources."""
+    if not _table_exists(con, METADATA_TABLE):
+        return {}
+    result = con.execute(f"SELECT * FROM {METADATA_TABLE}")
+    columns = [d[0] for d in result.description]
+    return {row[0]: dict(zip(columns, row)) for row in result.fetchall()}
+
+
+def content_versions(con: duckdb.DuckDBPyConnection, source_names: list[str] = None) -> dict[str, str]:
+    """
+    Content hash of each source as last loaded, for downstream caches to use as a data version.
+    Sources that were never loaded through ingest.py are missing from the result.
+    """
+    metadata = get_metadata(con)
+    return {name: metadata[name]["content_hash"] for name in (source_names or SOURCES) if name in metadata}
+
+
+def validate(con: duckdb.DuckDBPyConnection, source: Source, df: pd.DataFrame) -> None:
+    if list(df.columns) != source.columns:
+        raise ValidationError(f"{source.name}: expected columns {source.columns}, got {list(df.columns)}")
+    if len(df) < source.min_rows:
+        raise ValidationError(f"{source.name}: {len(df)} rows, expected at least {source.min_rows}")
+    if _table_exists(con, source.table):
+        live_rows = con.execute(f"SELECT count(*) FROM main.{source.table}").fetchone()[0]
+        if len(df) < live_rows * (1 - MAX_SHRINK):
+            raise ValidationError(f"{source.name}: {len(df)} rows would replace {live_rows} live rows")
+
+
+def load_staging(con: duckdb.DuckDBPyConnection, source: Source, df: pd.DataFrame) -> None:
+    """
+    Bulk loads a scraped DataFrame into staging.<table> (all columns TEXT, like the live tables).
+    Missing cells stay NULL, as they were when the scrapers COPYed their CSVs in.
+    """
+    # astype("string") would store missing cells as the text '<NA>'
+    con.register("_scraped", df.astype(object).where(df.notna(), None))
+    columns = ", ".join(f'CAST("{c}" AS TEXT) AS "{c}"' for c in df.columns)
+    try:
+        con.execute(f"CREATE OR REPLACE TABLE staging.{source.table} AS SELECT {columns} FROM _scraped")
+    finally:
+        con.unregister("_scraped")
+
+
+def swap_tables(con: duckdb.DuckDBPyConnection, tables: list[str], metadata_rows: list[list] = ()) -> None:
+    """
+    Replaces the live tables with their staged copies atomically - readers see all or none of the new data.
+    metadata_rows are upserted into ingestion_metadata in the same transaction, so a recorded
+    content hash always describes the live table.
+    """
+    con.execute("BEGIN TRANSACTION")
+    try:
+        for table in tables:
+            con.execute(f"CREATE OR REPLACE TABLE main.{table} AS SELECT * FROM staging.{table}")
+        if metadata_rows:
+            con.executemany(
+                f"INSERT OR REPLACE INTO {METADATA_TABLE} VALUES (?, ?, ?, ?, ?, ?, current_timestamp, current_timestamp)",
+                metadata_rows,
+            )
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    for table in tables:
+        con.execute(f"DROP TABLE IF EXISTS staging.{table}")
+
+
+async def _timed_fetch(source: Source, validators: dict) -> tuple[str | None, dict, float]:
+    start = time.perf_counter()
+    content, validators = await source.fetch_content(validators)
+    return content, validators, time.perf_counter() - start
+
+
+def _read_state(con: duckdb.DuckDBPyConnection, sources: list[Source]) -> tuple[dict[str, dict], dict[str, bool]]:
+    """(ingestion metadata, {source: live table exists}) - creating the metadata tables if needed."""
+    _ensure_metadata_tables(con)
+    return get_metadata(con), {s.name: _table_exists(con, s.table) for s in sources}
+
+
+def _load_fetched(con: duckdb.DuckDBPyConnection, run_id: str, started_at: pd.Timestamp, sources: list[Source],
+                  fetched: list, metadata: dict[str, dict], live: dict[str, bool], force: bool) -> dict[str, str]:
+    """Parses, validates, stages and swaps the fetched sources, then rebuilds the derived tables. Blocking."""
+    statuses: dict[str, str] = {}
+    staged, records, metadata_rows, unchanged = [], [], [], []
+    for source, result in zip(sources, fetched):
+        if isinstance(result, Exception):
+            logger.error(f"[ingest {run_id}] {source.name}: fetch failed: {result}")
+            statuses[source.name] = "failed"
+            records.append([run_id, source.name, started_at, None, None, 0, "failed", str(result)])
+            continue
+        content, new_validators, fetch_seconds = result
+        load_start = time.perf_counter()
+        digest = content_hash(content) if content is not None else None
+        previous = metadata.get(source.name, {})
+        if not force and live[source.name] and (content is None or digest == previous.get("content_hash")):
+            logger.info(f"[ingest {run_id}] {source.name}: content unchanged - skipping parse and load")
+            statuses[source.name] = "unchanged"
+            unchanged.append(source.name)
+            records.append([run_id, source.name, started_at, fetch_seconds, 0.0, previous.get("row_count"), "unchanged", None])
+            continue
+        rows = 0
+        try:
+            df = source.parse(content)
+            rows = len(df)
+            validate(con, source, df)
+            load_staging(con, source, df)
+            staged.append(source)
+            metadata_rows.append([
+                source.name, source.table, new_validators.get("etag", ""),
+                new_validators.get("last_modified", ""), digest, rows,
+            ])
+            statuses[source.name] = "swapped"
+            error = None
+        except ValidationError as e:
+            logger.error(f"[ingest {run_id}] {e} - keeping the live table")
+            statuses[source.name] = "rejected"
+            error = str(e)
+        except Exception as e:
+            # markup that no longer parses (a site layout change) costs this source, not the whole run
+            logger.exception(f"[ingest {run_id}] {source.name}: parse or load failed - keeping the live table")
+            statuses[source.name] = "failed"
+            error = f"{type(e).__name__}: {e}"
+        records.append([
+            run_id, source.name, started_at, fetch_seconds, time.perf_counter() - load_start,
+            rows, statuses[source.name], error,
+        ])
+
+    if unchanged:
+        con.execute(
+            f"UPDATE {METADATA_TABLE} SET checked_at = current_timestamp WHERE source IN (SELECT unnest(?))",
+            [unchanged],
+        )
+    if staged:
+        swap_start = time.perf_counter()
+        swap_tables(con, [s.table for s in staged], metadata_rows)
+        operators.build_operators_table(con)
+        factsheets.build_fact_sheets(con)
+        logger.info(f"[ingest {run_id}] Swapped {[s.table for s in staged]} and rebuilt derived tables "
+                    f"in {time.perf_counter() - swap_start:.2f}s")
+
+    con.executemany("INSERT INTO ingestion_runs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", records)
+    return statuses
+
+
+async def run_ingestion(source_names: list[str] = None, db_path: str = DB_PATH, force: bool = False) -> dict[str, str]:
+    """
+    Refreshes the given sources (default: all). Returns {source: status}, where status is
+    "swapped", "unchanged", "rejected" or "failed". A source is "unchanged" when the server
+    answered 304 or its extracted content hashes the same as the live table's; it is then
+    neither parsed nor reloaded (force=True reloads anyway). Derived tables (operators, fact
+    sheets) are rebuilt whenever at least one source was swapped.
+    The database work runs in worker threads on its own connection, so the API's event loop
+    keeps serving while the scheduler ingests.
+    """
+    sources = [SOURCES[name] for name in (source_names or SOURCES)]
+    run_id = uuid.uuid4().hex[:12]
+    started_at = pd.Timestamp.now(tz="UTC").tz_localize(None)
+
+    con = await asyncio.to_thread(duckdb.connect, db_path)
+    try:
+        metadata, live = await asyncio.to_thread(_read_state, con, sources)
+        # conditional requests only make sense while the table they validate is still there
+        validators = {
+            s.name: {"etag": metadata[s.name]["etag"], "last_modified": metadata[s.name]["last_modified"]}
+            if s.name in metadata and live[s.name] and not force else {}
+            for s in sources
+        }
+
+        logger.info(f"[ingest {run_id}] Fetching {[s.name for s in sources]} concurrently")
+        try:
+            # browser-based sources share one Chromium launch for the whole run
+            fetched = await asyncio.gather(*(_timed_fetch(s, validators[s.name]) for s in sources), return_exceptions=True)
+        finally:
+            await browser_pool.shutdown()
+
+        statuses = await asyncio.to_thread(_load_fetched, con, run_id, started_at, sources, fetched, metadata, live, force)
+    finally:
+        con.close()
+
+    logger.info(f"[ingest {run_id}] Done: {statuses}")
+    return statuses
+
+
+async def run_scheduler(interval_hours: float, source_names: list[str] = None, db_path: str = DB_PATH, on_refresh=None) -> None:
+    """
+    Runs ingestion now and then every interval_hours, until cancelled. on_refresh(statuses) is
+    called after each run (the API uses it to drop caches built on the old tables).
+    """
+    while True:
+        try:
+            statuses = await run_ingestion(source_names, db_path)
+            if on_refresh and "swapped" in statuses.values():
+                on_refresh(statuses)
+        except Exception:
+            logger.exception("Scheduled ingestion failed")
+        await asyncio.sleep(interval_hours * 3600)
+
+
+async def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Refresh the MCC, Mideye and Traforama reference tables.")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), help="sources to refresh (default: all)")
+    parser.add_argument("--db", default=DB_PATH, help="DuckDB file to load into")
+    parser.add_argument("--every", type=float, metavar="HOURS", help="keep running, refreshing every HOURS")
+    parser.add_argument("--force", action="store_true", help="parse and reload even if the content is unchanged")
+    args = parser.parse_args(argv)
+
+    if args.every:
+        await run_scheduler(args.every, args.sources, args.db)
+    else:
+        await run_ingestion(args.sources, args.db, force=args.force)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(main())
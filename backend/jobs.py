@@ -0,0 +1,283 @@
+'''
+Report jobs - POST /reports queues a report and returns its id at once, a pool of worker tasks builds queued reports in the background, and status, per-section progress and the finished report are kept in the report_jobs table of bryan.db, so clients poll GET /reports/{id} instead of holding a connection open for the whole pipeline, and a finished report can be fetched again by id at any time.
+Jobs interrupted by a restart are picked up again when the workers start.
+'''
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+import duckdb
+
+from backend import admission
+from backend import final_truly_async as fta
+from backend import resources
+
+logger = logging.getLogger(__name__)
+
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", "2"))
+MAX_QUEUED_JOBS = int(os.environ.get("MAX_QUEUED_JOBS", "100"))
+# A job interrupted this many times (e.g. it keeps crashing the process) is failed instead of requeued
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETENTION_DAYS = int(os.environ.get("JOB_RETENTION_DAYS", "30"))
+# Workers also poll, in case a wake-up is missed
+POLL_INTERVAL_S = 5.0
+
+JOBS_TABLE = "report_jobs"
+
+
+# ----------------------------------------
+# Job table
+# ----------------------------------------
+def _ensure_jobs_table(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(f"""
+        CREATE TABLE IF NOT EXISTS {JOBS_TABLE} (
+            job_id TEXT PRIMARY KEY,
+            request_key TEXT,
+            request TEXT,
+            status TEXT,
+            progress TEXT,
+            report TEXT,
+            timed_out TEXT,
+            timings TEXT,
+            error TEXT,
+            attempts INTEGER,
+            created_at TIMESTAMP,
+            started_at TIMESTAMP,
+            finished_at TIMESTAMP
+        )
+    """)
+
+
+def request_key(request: dict) -> str:
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def insert_job(con: duckdb.DuckDBPyConnection, request: dict) -> tuple[str, str]:
+    """Queues request unless an identical one is already queued or running; returns (job id, status)."""
+    key = request_key(request)
+    active = con.execute(
+        f"SELECT job_id, status FROM {JOBS_TABLE} WHERE request_key = ? AND status IN ('queued', 'running') "
+        "ORDER BY created_at LIMIT 1", [key]
+    ).fetchone()
+    if active:
+        return active
+    queued = con.execute(f"SELECT count(*) FROM {JOBS_TABLE} WHERE status = 'queued'").fetchone()[0]
+    if queued >= MAX_QUEUED_JOBS:
+        raise admission.Overloaded(f"Job queue full: {queued} reports waiting", retry_after_s=60)
+    job_id = uuid.uuid4().hex
+    con.execute(
+        f"INSERT INTO {JOBS_TABLE} (job_id, request_key, request, status, progress, attempts, created_at) "
+        "VALUES (?, ?, ?, 'queued', '{}', 0, current_timestamp)",
+        [job_id, key, json.dumps(request)],
+    )
+    return job_id, "queued"
+
+
+def claim_next(con: duckdb.DuckDBPyConnection) -> tuple[str, dict] | None:
+    """Marks the oldest queued job running and returns (job id, request), or None when the queue is empty."""
+    row = con.execute(f"""
+        UPDATE {JOBS_TABLE} SET status = 'running', started_at = current_timestamp, attempts = attempts + 1
+        WHERE job_id = (SELECT job_id FROM {JOBS_TABLE} WHERE status = 'queued' ORDER BY created_at LIMIT 1)
+        RETURNING job_id, request
+    """).fetchone()
+    return (row[0], json.loads(row[1])) if row else None
+
+
+def save_progress(con: duckdb.DuckDBPyConnection, job_id: str, progress: dict) -> None:
+    con.execute(f"UPDATE {JOBS_TABLE} SET progress = ? WHERE job_id = ?", [json.dumps(progress), job_id])
+
+
+def finish_job(con: duckdb.DuckDBPyConnection, job_id: str, progress: dict, result: dict) -> None:
+    con.execute(f"""
+        UPDATE {JOBS_TABLE}
+        SET status = ?, progress = ?, report = ?, timed_out = ?, timings = ?, error = ?, finished_at = current_timestamp
+        WHERE job_id = ?
+    """, [
+        "done" if result.get("success") else "failed",
+        json.dumps(progress),
+        result.get("report"),
+        json.dumps(result.get("timed_out", [])),
+        json.dumps(result.get("timings", {})),
+        result.get("error"),
+        job_id,
+    ])
+
+
+def requeue_interrupted(con: duckdb.DuckDBPyConnection) -> tuple[int, int]:
+    """Jobs left running by a previous process go back on the queue, or fail after JOB_MAX_ATTEMPTS; returns (requeued, failed)."""
+    failed = con.execute(f"""
+        UPDATE {JOBS_TABLE} SET status = 'failed', error = 'Interrupted too many times', finished_at = current_timestamp
+        WHERE status = 'running' AND attempts >= ?
+        RETURNING job_id
+    """, [JOB_MAX_ATTEMPTS]).fetchall()
+    requeued = con.execute(f"""
+        UPDATE {JOBS_TABLE} SET status = 'queued', progress = '{{}}', started_at = NULL
+        WHERE status = 'running'
+        RETURNING job_id
+    """).fetchall()
+    return len(requeued), len(failed)
+
+
+def purge_old_jobs(con: duckdb.DuckDBPyConnection) -> None:
+    con.execute(
+        f"DELETE FROM {JOBS_TABLE} WHERE status IN ('done', 'failed') "
+        f"AND finished_at < current_timestamp - INTERVAL {JOB_RETENTION_DAYS} DAY"
+    )
+
+
+def load_job(con: duckdb.DuckDBPyConnection, job_id: str) -> dict | None:
+    row = con.execute(f"""
+        SELECT job_id, status, progress, report, timed_out, timings, error, attempts, created_at, started_at, finished_at
+        FROM {JOBS_TABLE} WHERE job_id = ?
+    """, [job_id]).fetchone()
+    if row is None:
+        return None
+    job_id, status, progress, report, timed_out, timings, error, attempts, created_at, started_at, finished_at = row
+    job = {
+        "job_id": job_id,
+        "status": status,
+        "progress": json.loads(progress or "{}"),
+        "attempts": attempts,
+        "created_at": created_at.isoformat() if created_at else None,
+        "started_at": started_at.isoformat() if started_at else None,
+        "finished_at": finished_at.isoformat() if finished_at else None,
+    }
+    if status == "done":
+        job.update(report=report, timed_out=json.loads(timed_out or "[]"), timings=json.loads(timings or "{}"))
+    elif status == "failed":
+        job["error"] = error
+    return job
+
+
+async def _db(func, *args):
+    # executor threads must not share the connection - each call gets its own cursor
+    return await asyncio.to_thread(func, resources.get_con().cursor(), *args)
+
+
+# ----------------------------------------
+# Workers
+# ----------------------------------------
+class RunningJob:
+    """Collects one job's per-stage progress from the pipeline and writes it to its row as it changes."""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.progress: dict[str, str] = {}
+        self.finished = False
+        self._lock = asyncio.Lock()
+        self._writes: set[asyncio.Task] = set()
+
+    def on_progress(self, stage: str, state: str) -> None:
+        # sections that time out and then finish in the background are not in the report
+        if self.finished or self.progress.get(stage) == "timed_out":
+            return
+        self.progress[stage] = state
+        task = asyncio.get_running_loop().create_task(self._write())
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def _write(self) -> None:
+        # serialized, and each write stores the latest progress - a late write can't roll it back
+        async with self._lock:
+            if not self.finished:
+                await _db(save_progress, self.job_id, dict(self.progress))
+
+    async def finish(self, result: dict) -> None:
+        async with self._lock:
+            self.finished = True
+            await _db(finish_job, self.job_id, dict(self.progress), result)
+
+
+class JobQueue:
+    """Queues report requests in the job table and runs them on REPORT_WORKERS worker tasks with run_report(request)."""
+
+    def __init__(self, run_report, workers: int = REPORT_WORKERS):
+        self.run_report = run_report
+        self.workers = workers
+        self._wake = asyncio.Event()
+        self._claim_lock = asyncio.Lock()
+        # insert_job checks for an active duplicate and then inserts - two submits must not interleave
+        self._submit_lock = asyncio.Lock()
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self) -> None:
+        await _db(_ensure_jobs_table)
+        await _db(purge_old_jobs)
+        requeued, failed = await _db(requeue_interrupted)
+        if requeued or failed:
+            logger.info(f"[jobs] resuming {requeued} interrupted report jobs ({failed} failed after {JOB_MAX_ATTEMPTS} attempts)")
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._work(i)) for i in range(self.workers)]
+        self._wake.set()
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        # jobs cancelled mid-run go back on the queue for the next start
+        requeued, _ = await _db(requeue_interrupted)
+        if requeued:
+            logger.info(f"[jobs] {requeued} unfinished report jobs left queued for the next start")
+
+    async def submit(self, request: dict) -> dict:
+        async with self._submit_lock:
+            job_id, status = await _db(insert_job, request)
+        self._wake.set()
+        return {"job_id": job_id, "status": status, "url": f"/reports/{job_id}"}
+
+    async def get(self, job_id: str) -> dict | None:
+        return await _db(load_job, job_id)
+
+    async def _claim(self) -> tuple[str, dict] | None:
+        async with self._claim_lock:
+            return await _db(claim_next)
+
+    async def _work(self, worker: int) -> None:
+        while True:
+            claimed = await self._claim()
+            if claimed is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            job_id, request = claimed
+            logger.info(f"[jobs] worker {worker} building report {job_id} for {request.get('user_query')!r}")
+            job = RunningJob(job_id)
+            token = fta.progress_listener.set(job.on_progress)
+            try:
+                result = await self.run_report(request)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"[jobs] report {job_id} failed")
+                result = {"success": False, "error": str(e)}
+            finally:
+                fta.progress_listener.reset(token)
+            await job.finish(result)
+
+
+# The queue's events belong to one event loop - started and stopped by the API's lifespan hook
+_queue: JobQueue = None
+
+
+async def start(run_report) -> JobQueue:
+    global _queue
+    _queue = JobQueue(run_report)
+    await _queue.start()
+    return _queue
+
+
+async def stop() -> None:
+    if _queue is not None:
+        await _queue.stop()
+
+
+def get_queue() -> JobQueue:
+    if _queue is None:
+        raise RuntimeError("Report job workers are not running")
+    return _queue
@@ -0,0 +1,302 @@
+'''
+Per-upstream rate limiting and circuit breaking - every request to OONI, Cloudflare Radar, ScraperAPI and the LLM API goes through its upstream's limiter:
+- a token bucket caps the request rate
+- an adaptive concurrency limit halves on 429s, 5xx and timeouts and creeps back up on successes (AIMD)
+- a circuit breaker fails calls fast once an upstream keeps failing, then lets single probe requests through (half-open) until one succeeds
+
+Per upstream (NAME = OONI, RADAR, SCRAPERAPI, LLM):
+
+    NAME_RATE_PER_S=10          # sustained requests per second
+    NAME_BURST=20               # requests allowed at once after a quiet spell
+    NAME_MAX_CONCURRENCY=16     # ceiling for the adaptive concurrency limit
+    LLM_CONCURRENCY=4           # the LLM's starting limit - it grows towards the ceiling while the API keeps up
+    BREAKER_FAILURES=5          # consecutive failures that open the circuit
+    BREAKER_OPEN_S=30           # how long it stays open before a probe (doubles while probes fail)
+'''
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from backend import metrics
+from backend import timing
+
+logger = logging.getLogger(__name__)
+
+# (requests per second, burst, max concurrency) - Cloudflare's API allows 1200 requests per 5 minutes,
+# ScraperAPI's plans few concurrent requests, OpenAI's lowest paid tier 500 requests per minute
+DEFAULT_LIMITS = {
+    "ooni": (10.0, 20, 16),
+    "radar": (4.0, 24, 24),
+    "scraperapi": (5.0, 5, 5),
+    "llm": (8.0, 16, 16),
+}
+# Where the adaptive limit starts, if below the ceiling - map-reduce fans out one LLM call per country/chunk,
+# so the LLM starts conservatively and earns the rest
+STARTING_CONCURRENCY = {"llm": int(os.environ.get("LLM_CONCURRENCY", "4"))}
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_OPEN_S = float(os.environ.get("BREAKER_OPEN_S", "30"))
+BREAKER_MAX_OPEN_S = 300.0
+# One multiplicative decrease per this many seconds - a burst of 429s is one signal, not twenty
+DECREASE_COOLDOWN_S = 1.0
+
+# Errors that say the upstream is unhealthy, by class name - the clients' own exception types
+# (httpx, aiohttp, openai) are matched without importing them here
+TRANSIENT_ERRORS = {
+    "TimeoutException", "TransportError", "APITimeoutError", "APIConnectionError",
+    "ClientConnectionError", "ClientPayloadError", "ServerDisconnectedError",
+}
+
+CIRCUIT_STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+
+class CircuitOpen(RuntimeError):
+    """The upstream's circuit is open - the call was not made."""
+
+    def __init__(self, upstream: str, retry_in_s: float):
+        super().__init__(f"{upstream} is unavailable (circuit open, next probe in {retry_in_s:.1f}s)")
+        self.upstream = upstream
+
+
+class UpstreamError(RuntimeError):
+    """An upstream answered with an error status."""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+def status_of(error: BaseException) -> int | None:
+    """HTTP status behind an exception or anything it wraps (httpx, requests, openai, UpstreamError)."""
+    while error is not None:
+        for candidate in (error, getattr(error, "response", None)):
+            status = getattr(candidate, "status_code", None) or getattr(candidate, "status", None)
+            if isinstance(status, int):
+                return status
+        error = error.__cause__ or error.__context__
+    return None
+
+
+def is_unhealthy(error: BaseException) -> bool:
+    """429, 5xx, timeouts and connection failures - not client errors like 404."""
+    status = status_of(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    while error is not None:
+        if isinstance(error, (OSError, asyncio.TimeoutError)):
+            return True
+        if any(cls.__name__ in TRANSIENT_ERRORS for cls in type(error).__mro__):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class _Turn:
+    """One request's turn in a limiter, as set up by UpstreamLimiter.slot."""
+    __slots__ = ("until",)
+
+    def __init__(self):
+        # a future the turn outlives its block for (see hold_until)
+        self.until: asyncio.Future | None = None
+
+
+# The turn held by the enclosing limiter.limit() block, if any
+_turn: ContextVar[_Turn] = ContextVar("limiter_turn", default=None)
+# Releases waiting on requests that outlived their block - kept referenced until they run
+_releases: set[asyncio.Task] = set()
+
+
+class UpstreamLimiter:
+    """Token bucket, AIMD concurrency limit and circuit breaker for one upstream."""
+
+    def __init__(self, name: str, rate_per_s: float, burst: float, max_concurrency: int, starting_concurrency: int = None):
+        self.name = name
+        self.rate_per_s = rate_per_s
+        self.burst = max(1.0, burst)
+        self.max_concurrency = max_concurrency
+        self._tokens = self.burst
+        self._refilled_at = time.monotonic()
+        # adaptive concurrency
+        self.limit = float(max(1, min(starting_concurrency or max_concurrency, max_concurrency)))
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._changed = asyncio.Condition()
+        # circuit breaker
+        self.state = "closed"
+        self.failures = 0
+        self.open_s = BREAKER_OPEN_S
+        self._opened_at = 0.0
+        self._probing = False
+        metrics.UPSTREAM_CONCURRENCY_LIMIT.labels(name).set(self.limit)
+        metrics.UPSTREAM_CIRCUIT_STATE.labels(name).set(0)
+
+    # --- circuit breaker ---
+    def _set_state(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"[limiter] {self.name} circuit {self.state} -> {state}")
+        self.state = state
+        metrics.UPSTREAM_CIRCUIT_STATE.labels(self.name).set(CIRCUIT_STATES[state])
+
+    def _admit(self) -> bool:
+        """Raises CircuitOpen unless the call may go ahead; returns whether it is the half-open probe."""
+        if self.state == "open":
+            retry_in = self._opened_at + self.open_s - time.monotonic()
+            if retry_in > 0:
+                metrics.UPSTREAM_REJECTED.labels(self.name).inc()
+                raise CircuitOpen(self.name, retry_in)
+            self._set_state("half_open")
+        if self.state == "half_open":
+            if self._probing:
+                metrics.UPSTREAM_REJECTED.labels(self.name).inc()
+                raise CircuitOpen(self.name, 0)
+            self._probing = True
+            return True
+        return False
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._set_state("open")
+
+    # --- rate and concurrency ---
+    async def _take_token(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_s)
+            self._refilled_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate_per_s)
+
+    async def _acquire(self) -> None:
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def _release(self) -> None:
+        async with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def _release_when_done(self, future: asyncio.Future) -> None:
+        if not future.cancelled():
+            future.exception()  # nobody awaits it any more - mark its error retrieved
+        task = asyncio.ensure_future(self._release())
+        _releases.add(task)
+        task.add_done_callback(_releases.discard)
+
+    def _set_limit(self, limit: float) -> None:
+        self.limit = limit
+        metrics.UPSTREAM_CONCURRENCY_LIMIT.labels(self.name).set(limit)
+
+    # --- outcomes ---
+    def _succeeded(self, probe: bool) -> None:
+        self.failures = 0
+        if probe:
+            self._probing = False
+            self.open_s = BREAKER_OPEN_S
+            self._set_state("closed")
+        # additive increase: about +1 per limit's worth of successful calls
+        if self.limit < self.max_concurrency:
+            self._set_limit(min(self.max_concurrency, self.limit + 1 / self.limit))
+
+    def _failed(self, probe: bool) -> None:
+        now = time.monotonic()
+        if now - self._decreased_at >= DECREASE_COOLDOWN_S:
+            self._decreased_at = now
+            self._set_limit(max(1.0, self.limit / 2))
+        self.failures += 1
+        if probe:
+            self._probing = False
+            self.open_s = min(self.open_s * 2, BREAKER_MAX_OPEN_S)
+            self._open()
+        elif self.state == "closed" and self.failures >= BREAKER_FAILURES:
+            self._open()
+
+    @asynccontextmanager
+    async def slot(self, queue_stage: str = None):
+        """
+        Holds one request's turn; an exception from the block counts against the upstream if it is_unhealthy().
+        queue_stage names the timing stage (see timing.py) the wait for the turn is recorded under.
+        """
+        probe = self._admit()
+        acquired = False
+        turn = _Turn()
+        token = _turn.set(turn)
+        try:
+            with timing.stage(queue_stage) if queue_stage else nullcontext():
+                await self._take_token()
+                await self._acquire()
+            acquired = True
+            yield
+        except asyncio.CancelledError:
+            if probe:
+                self._probing = False
+            raise
+        except Exception as e:
+            if is_unhealthy(e):
+                self._failed(probe)
+            else:
+                self._succeeded(probe)
+            raise
+        else:
+            self._succeeded(probe)
+        finally:
+            _turn.reset(token)
+            if acquired:
+                if turn.until is not None and not turn.until.done():
+                    # the request is still running (e.g. in a thread) - its turn ends when it does
+                    turn.until.add_done_callback(self._release_when_done)
+                else:
+                    await self._release()
+
+
+# Limiters hold asyncio primitives bound to one event loop - kept per loop
+_limiters: dict[str, UpstreamLimiter] = {}
+_limiters_loop = None
+
+
+def get_limiter(name: str) -> UpstreamLimiter:
+    global _limiters, _limiters_loop
+    loop = asyncio.get_running_loop()
+    if _limiters_loop is not loop:
+        _limiters, _limiters_loop = {}, loop
+    if name not in _limiters:
+        rate, burst, concurrency = DEFAULT_LIMITS.get(name, (10.0, 20, 16))
+        prefix = name.upper()
+        rate = float(os.environ.get(f"{prefix}_RATE_PER_S", rate))
+        _limiters[name] = UpstreamLimiter(
+            name,
+            rate,
+            float(os.environ.get(f"{prefix}_BURST", max(burst, rate))),
+            int(os.environ.get(f"{prefix}_MAX_CONCURRENCY", concurrency)),
+            STARTING_CONCURRENCY.get(name),
+        )
+    return _limiters[name]
+
+
+def limit(name: str, queue_stage: str = None):
+    """async with limiter.limit("ooni"): ... - one request to that upstream (see UpstreamLimiter.slot)."""
+    return get_limiter(name).slot(queue_stage)
+
+
+def hold_until(future: asyncio.Future) -> None:
+    """
+    Keeps the enclosing limiter.limit() turn taken until future is done, even if the block exits
+    first (cancelled) - for requests that can't be interrupted, like a blocking client in a thread.
+    """
+    turn = _turn.get()
+    if turn is not None:
+        turn.until = future
+
+
+def states() -> dict[str, dict]:
+    """Current limit, in-flight count and circuit state per upstream, for /debug/upstreams."""
+    return {
+        name: {"state": l.state, "concurrency_limit": round(l.limit, 2), "in_flight": l.in_flight,
+               "consecutive_failures": l.failures}
+        for name, l in _limiters.items()
+    }
@@ -0,0 +1,118 @@
+'''
+Event-loop lag monitor - a heartbeat task measures how late the loop wakes it (exported as a Prometheus histogram), and a watchdog thread dumps the loop thread's stack whenever a single callback blocks it past a threshold, so stalls that serialize concurrent requests can be found and moved off the loop
+
+    LOOP_MONITOR=1                   # lag metrics + stall stacks (cheap enough for production)
+    LOOP_MONITOR=debug               # additionally asyncio debug mode, which names every slow callback
+    LOOP_BLOCK_THRESHOLD_MS=100
+'''
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR = os.environ.get("LOOP_MONITOR", "1").lower()
+LOOP_LAG_INTERVAL_S = float(os.environ.get("LOOP_LAG_INTERVAL_MS", "50")) / 1000
+LOOP_BLOCK_THRESHOLD_S = float(os.environ.get("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+STALL_HISTORY = 50
+STACK_LIMIT = 40  # innermost frames kept per stall
+LAG_WINDOW_S = 10  # event_loop_lag_recent_max_seconds covers this many seconds
+
+
+class LoopMonitor:
+    """Heartbeat task on the loop plus a watchdog thread that samples the loop thread's stack when it stalls."""
+
+    def __init__(self, threshold_s: float = LOOP_BLOCK_THRESHOLD_S, interval_s: float = LOOP_LAG_INTERVAL_S):
+        self.threshold_s = threshold_s
+        self.interval_s = interval_s
+        self.stalls: deque[dict] = deque(maxlen=STALL_HISTORY)
+        self._recent_lags: deque[float] = deque(maxlen=max(1, int(LAG_WINDOW_S / interval_s)))
+        self._last_beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._stop = threading.Event()
+        self._watchdog = None
+
+    # --- on the loop ---
+    async def _heartbeat(self) -> None:
+        while True:
+            scheduled = time.monotonic()
+            await asyncio.sleep(self.interval_s)
+            now = time.monotonic()
+            lag = max(0.0, now - scheduled - self.interval_s)
+            self._last_beat = now
+            self._recent_lags.append(lag)
+            metrics.LOOP_LAG.observe(lag)
+            metrics.LOOP_LAG_RECENT_MAX.set(max(self._recent_lags))
+
+    # --- on the watchdog thread ---
+    def _watch(self) -> None:
+        reported_beat = None
+        while not self._stop.wait(self.threshold_s / 2):
+            beat = self._last_beat
+            # the heartbeat is due interval_s after the last beat - anything beyond that is the loop being blocked
+            blocked = time.monotonic() - beat - self.interval_s
+            if blocked < self.threshold_s or beat == reported_beat:
+                continue
+            # one report per stall: the stack of whatever is running on the loop right now
+            reported_beat = beat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT)) if frame else "<no frame>"
+            self.stalls.append({"at": time.time(), "blocked_ms": round(blocked * 1000, 1), "stack": stack})
+            metrics.LOOP_STALLS.inc()
+            logger.warning(f"[loop] event loop blocked for {blocked * 1000:.0f} ms+ in:\n{stack}")
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        if LOOP_MONITOR == "debug":
+            # asyncio then logs "Executing <Handle ...> took N seconds" for every slow callback
+            loop.set_debug(True)
+            loop.slow_callback_duration = self.threshold_s
+        self._last_beat = time.monotonic()
+        self._task = loop.create_task(self._heartbeat())
+        self._stop.clear()
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info(f"Event loop monitor started (threshold {self.threshold_s * 1000:.0f} ms, mode {LOOP_MONITOR})")
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    def recent_stalls(self) -> list[dict]:
+        return list(self.stalls)
+
+
+_monitor: LoopMonitor = None
+
+
+def start() -> LoopMonitor:
+    """Starts monitoring the running loop unless LOOP_MONITOR=0."""
+    global _monitor
+    if LOOP_MONITOR in ("0", "off"):
+        return None
+    _monitor = LoopMonitor()
+    _monitor.start()
+    return _monitor
+
+
+async def stop() -> None:
+    if _monitor is not None:
+        await _monitor.stop()
+
+
+def recent_stalls() -> list[dict]:
+    return _monitor.recent_stalls() if _monitor is not None else []
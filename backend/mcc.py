@@ -2,41 +2,37 @@
 Scrapes tables from MCC website into SQL tables - makes it faster instead of web-scraping everything at inference
 '''
 import asyncio
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
 import logging
-import duckdb
 import pandas as pd
 
+from backend import browser_pool
+from backend import extract
+
 # Configure logging for better troubleshooting
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-async def scrape_mcc_mnc_table(url: str):
+TARGET_URL = "https://mcc-mnc.com/"
+TABLE_NAME = "mcc_mnc_table"
+EXPECTED_ROWS = 2080  # entry count the page currently reports; fewer rows means the scrape was incomplete
+
+async def fetch_mcc_mnc_html(url: str) -> str:
     """
-    Scrapes the full MCC-MNC table from the given URL by dynamically
-    injecting and selecting an "All" option in the DataTables dropdown.
+    Loads the full MCC-MNC table in the browser by dynamically injecting and
+    selecting an "All" option in the DataTables dropdown.
 
     Args:
         url (str): The URL of the page containing the DataTables.
 
     Returns:
-        list[list[str]]: A list of lists representing the table data,
-                         with the first sublist being headers.
-                         Returns an empty list if scraping fails.
+        str: The HTML of the table wrapper, or "" if loading failed.
     """
-    browser_headless_mode = True # Set to False for debugging (will open a browser window)
-    browser = None # Initialize browser outside try for finally block
-    all_data = [] # Initialize all_data here to ensure it's always defined
-
     try:
-        async with async_playwright() as p:
-            logging.info(f"Launching browser in headless mode: {browser_headless_mode}")
-            browser = await p.chromium.launch(headless=browser_headless_mode)
-            page = await browser.new_page()
-
+        # Shared browser (BROWSER_HEADLESS=0 to watch it); images, fonts and stylesheets are not downloaded
+        async with browser_pool.page() as page:
             logging.info(f"Navigating to {url}...")
-            await page.goto(url, wait_until="networkidle", timeout=30000)
-            logging.info("Page loaded successfully.")
+            # No need to wait for networkidle - Step 1 waits for the DataTables control itself
+            await page.goto(url, wait_until="domcontentloaded", timeout=30000)
+            logging.info("Page DOM loaded.")
 
             # --- Step 1: Locate the <select> element for table length ---
             select_selector = 'select[name="mncmccTable_length"]'
@@ -45,7 +41,7 @@ async def scrape_mcc_mnc_table(url: str):
                 logging.info(f"Select element found using selector: '{select_selector}'")
             except Exception as e:
                 logging.error(f"Error: Select element with selector '{select_selector}' not found within timeout. Details: {e}", exc_info=True)
-                return [] # Return empty list on failure
+                return "" # Return empty HTML on failure
 
             # --- Step 2: Dynamically Inject the "All" Option ---
             desired_value_for_all = '5000'
@@ -71,7 +67,7 @@ async def scrape_mcc_mnc_table(url: str):
                 logging.info("Option injected successfully and change event dispatched.")
             except Exception as e:
                 logging.error(f"Error injecting option or dispatching change event: {e}", exc_info=True)
-                return [] # Return empty list on failure
+                return "" # Return empty HTML on failure
 
             # --- Step 3: Select the newly added "All" option (redundant but good for robustness) ---
             # This step might be redundant if page.evaluate already set the value and dispatched change,
@@ -82,7 +78,7 @@ async def scrape_mcc_mnc_table(url: str):
                 logging.info(f"Selected '{desired_value_for_all}'. DataTables should now be loading.")
             except Exception as e:
                 logging.error(f"Error selecting option '{desired_value_for_all}': {e}", exc_info=True)
-                return [] # Return empty list on failure
+                return "" # Return empty HTML on failure
 
             # --- Step 4: Wait for the table to fully load all data ---
             datatables_info_selector = '#mncmccTable_info'
@@ -113,145 +109,127 @@ async def scrape_mcc_mnc_table(url: str):
                 logging.info("Table wrapper HTML extracted successfully.")
             except Exception as e:
                 logging.error(f"Error extracting HTML from '{table_wrapper_selector}': {e}", exc_info=True)
-                return [] # Return empty list on failure
-
-            # --- Step 6: Parse the extracted HTML with BeautifulSoup ---
-            logging.info("Parsing extracted HTML with BeautifulSoup to find the table...")
-            soup = BeautifulSoup(page_html_content, 'html.parser')
-            table = soup.find('table', id='mncmccTable')
-            if not table:
-                logging.error(f"Error: Table with ID 'mncmccTable' not found in the extracted HTML content from '{table_wrapper_selector}'.")
-                logging.error("This indicates either the table HTML was not fully loaded/rendered, or the selector is incorrect.")
-                return [] # Return empty list on failure
-
-            # Extract headers from thead
-            headers = []
-            thead = table.find('thead')
-            if thead:
-                header_row = thead.find('tr')
-                if header_row:
-                    headers = [th.get_text(strip=True) for th in header_row.find_all('th')]
-                if headers:
-                    # all_data.append(headers) # Removed: pandas DataFrame will handle header based on `columns` argument
-                    logging.info(f"Found headers: {headers}")
-                else:
-                    logging.warning("No headers found within thead.")
-            else:
-                logging.warning("No thead element found in the table.")
-
-            # Extract data rows from tbody
-            data_rows_count = 0
-            tbody = table.find('tbody')
-            extracted_rows = [] # Store rows temporarily for DataFrame creation
-            if tbody:
-                rows = tbody.find_all('tr')
-                data_rows_count = len(rows)
-                logging.info(f"Found {data_rows_count} rows in the extracted table body (from BeautifulSoup).")
-                for row in rows:
-                    cells = row.find_all('td')
-                    row_data = [cell.get_text(strip=True) for cell in cells]
-                    if row_data:
-                        extracted_rows.append(row_data) # Append only data rows
-            else:
-                logging.error("No tbody element found in the table. Data extraction will be incomplete.")
-
-            # Combine headers and extracted_rows correctly
-            if headers and extracted_rows:
-                all_data.append(headers) # Add headers as the first element for a consistent list format
-                all_data.extend(extracted_rows) # Add all extracted data rows
-            elif extracted_rows: # If no headers were found but data rows exist
-                logging.warning("Data rows extracted but no headers found. CSV export might need manual header definition.")
-                all_data.extend(extracted_rows)
-
-
-            extracted_data_rows = len(all_data) - (1 if headers else 0) # Adjust count if headers were added
-            logging.info(f"Total extracted data rows (excluding header): {extracted_data_rows}. Total list items: {len(all_data)}")
-
-            if extracted_data_rows < 2080:
-                logging.warning(f"Warning: Less than the expected 2080 data rows were extracted ({extracted_data_rows}). Data might be incomplete.")
-
-            return all_data # Return the collected data
+                return "" # Return empty HTML on failure
+
+            return page_html_content
 
     except Exception as main_exc:
         logging.critical(f"An unhandled error occurred during scraping: {main_exc}", exc_info=True)
-        return [] # Return empty list on critical failure
-    finally:
-        if browser:
-            await browser.close()
-            logging.info("Browser closed.")
-
-async def main():
-    target_url = "https://mcc-mnc.com/"
-    table_data = await scrape_mcc_mnc_table(target_url)
-
-    if not table_data:
-        logging.error("Scraping failed or returned no data. Exiting without saving to CSV or DB.")
-        return
-
-    # --- Step 7: Save data to CSV ---
-    output_csv_filename = 'mcc_mnc_table_data.csv'
-    try:
-        if table_data and len(table_data) > 1: # Ensure there's at least a header and one data row
-            headers = table_data[0]
-            data_rows = table_data[1:]
-
-            df = pd.DataFrame(data_rows, columns=headers)
-
-            # Rename columns as needed for better readability in CSV/DB
-            df = df.rename(columns={
-                "MCC": 'Mobile Country Code',
-                "MNC": 'Mobile Network Code',
-                "ISO": "ISO Country Code",
-                "Country": 'Country',
-                "Country Code": 'Country Code',
-                "Network": 'Network Operator'
-            })
-            
-            # Example of a data cleaning step (uncomment if you need it)
-            df['Country'] = df['Country'].replace("United States of America", "United States")
-
-            df.to_csv(output_csv_filename, index=False, header=True, encoding='utf-8')
-            logging.info(f"Data saved successfully to {output_csv_filename}")
+        return "" # Return empty HTML on critical failure
+
+def parse_mcc_mnc_html(html: str) -> list[list[str]]:
+    """
+    Extracts the MCC-MNC rows from the table wrapper HTML.
+
+    Returns:
+        list[list[str]]: A list of lists representing the table data,
+                         with the first sublist being headers.
+                         Returns an empty list if the table is missing.
+    """
+    all_data = []
+
+    # --- Step 6: Parse the extracted HTML with lxml ---
+    logging.info("Parsing extracted HTML with lxml to find the table...")
+    table = extract.first(extract.parse_html(html), "//table[@id='mncmccTable']")
+    if table is None:
+        logging.error(f"Error: Table with ID 'mncmccTable' not found in the extracted HTML content from the table wrapper.")
+        logging.error("This indicates either the table HTML was not fully loaded/rendered, or the selector is incorrect.")
+        return [] # Return empty list on failure
+
+    # Extract headers from thead
+    headers = []
+    thead = extract.first(table, ".//thead")
+    if thead is not None:
+        header_row = extract.first(thead, ".//tr")
+        if header_row is not None:
+            headers = next(extract.iter_rows(header_row, "self::tr", ".//th"))
+        if headers:
+            logging.info(f"Found headers: {headers}")
         else:
-            logging.warning("No complete data (headers + rows) available to save to CSV.")
-    except Exception as e:
-        logging.error(f"Error saving data to CSV file '{output_csv_filename}': {e}", exc_info=True)
-        # If CSV saving fails, we might not want to proceed with DB operations
-        return
-
-    # --- Step 8: Save data to DuckDB ---
-    duckdb_filename = 'bryan.db'
-    con = None # Initialize con outside try for finally block
-    try:
-        con = duckdb.connect(duckdb_filename)
-
-        # Create the table with column names matching the RENAMED CSV headers
-        con.execute("""
-            CREATE OR REPLACE TABLE mcc_mnc_table (
-                "Mobile Country Code" TEXT,
-                "Mobile Network Code" TEXT,
-                "ISO Country Code" TEXT,
-                Country TEXT,
-                "Country Code" TEXT,
-                "Network Operator" TEXT
-            )
-        """)
-        logging.info("DuckDB table 'mcc_mnc_table' created or replaced successfully.")
-
-        # Load from CSV into table using the HEADER option, assuming CSV now has a header
-        con.execute(f"""
-            COPY mcc_mnc_table
-            FROM '{output_csv_filename}'
-            (FORMAT CSV, HEADER TRUE)
-        """)
-        logging.info(f"Data successfully copied from '{output_csv_filename}' to DuckDB table 'mcc_mnc_table'.")
-
-    except Exception as e:
-        logging.error(f"Error saving data to DuckDB '{duckdb_filename}': {e}", exc_info=True)
-    finally:
-        if con:
-            con.close()
-            logging.info("DuckDB connection closed.")
+            logging.warning("No headers found within thead.")
+    else:
+        logging.warning("No thead element found in the table.")
+
+    # Extract data rows from tbody
+    tbody = extract.first(table, ".//tbody")
+    extracted_rows = [] # Store rows temporarily for DataFrame creation
+    if tbody is not None:
+        extracted_rows = [row for row in extract.iter_rows(tbody) if row] # Append only data rows
+        logging.info(f"Found {len(extracted_rows)} data rows in the extracted table body.")
+    else:
+        logging.error("No tbody element found in the table. Data extraction will be incomplete.")
+
+    # Combine headers and extracted_rows correctly
+    if headers and extracted_rows:
+        all_data.append(headers) # Add headers as the first element for a consistent list format
+        all_data.extend(extracted_rows) # Add all extracted data rows
+    elif extracted_rows: # If no headers were found but data rows exist
+        logging.warning("Data rows extracted but no headers found. CSV export might need manual header definition.")
+        all_data.extend(extracted_rows)
+
+    extracted_data_rows = len(all_data) - (1 if headers else 0) # Adjust count if headers were added
+    logging.info(f"Total extracted data rows (excluding header): {extracted_data_rows}. Total list items: {len(all_data)}")
+
+    if extracted_data_rows < EXPECTED_ROWS:
+        logging.warning(f"Warning: Less than the expected {EXPECTED_ROWS} data rows were extracted ({extracted_data_rows}). Data might be incomplete.")
+
+    return all_data # Return the collected data
+
+async def scrape_mcc_mnc_table(url: str):
+    """
+    Scrapes the full MCC-MNC table from the given URL.
+
+    Returns:
+        list[list[str]]: Headers followed by the data rows, or an empty list if scraping fails.
+    """
+    html = await fetch_mcc_mnc_html(url)
+    return parse_mcc_mnc_html(html) if html else []
+
+def to_dataframe(table_data: list[list[str]]) -> pd.DataFrame:
+    """
+    Turns the scraped header + rows into the mcc_mnc_table layout.
+    """
+    if not table_data or len(table_data) < 2: # Ensure there's at least a header and one data row
+        return pd.DataFrame()
+    headers = table_data[0]
+    data_rows = table_data[1:]
+
+    df = pd.DataFrame(data_rows, columns=headers)
+
+    # Rename columns as needed for better readability in CSV/DB
+    df = df.rename(columns={
+        "MCC": 'Mobile Country Code',
+        "MNC": 'Mobile Network Code',
+        "ISO": "ISO Country Code",
+        "Country": 'Country',
+        "Country Code": 'Country Code',
+        "Network": 'Network Operator'
+    })
+
+    df['Country'] = extract.normalize_country(df['Country'])
+    return df
+
+async def fetch_content(validators: dict = None, url: str = TARGET_URL) -> tuple[str | None, dict]:
+    """
+    The rendered table markup and HTTP validators for ingest.py, which hashes the markup
+    before deciding whether to parse it. The table is built client-side, so there are no
+    usable validators and the markup is always returned.
+    """
+    html = await fetch_mcc_mnc_html(url)
+    if not html:
+        raise RuntimeError(f"Could not load the MCC-MNC table from {url}")
+    return html, {}
+
+def parse_content(html: str) -> pd.DataFrame:
+    return to_dataframe(parse_mcc_mnc_html(html))
+
+async def fetch_mcc_mnc_table(url: str = TARGET_URL) -> pd.DataFrame:
+    """
+    Scrapes and cleans the MCC-MNC table. Has no side effects - loading into DuckDB is done by ingest.py.
+    """
+    return to_dataframe(await scrape_mcc_mnc_table(url))
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    # Scrape + load just this source through the shared ingestion pipeline: python -m backend.mcc
+    from backend import ingest
+    asyncio.run(ingest.main(["--sources", "mcc"]))
@@ -0,0 +1,152 @@
+'''
+Prometheus metrics for the report pipeline - stage and upstream latency histograms, LLM latency and token counts, error and cache counters and in-flight gauges - plus the Server-Timing header built from a request's stage timings
+'''
+import contextvars
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+# ----------------------------------------
+# Metrics
+# ----------------------------------------
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds", "Duration of each pipeline stage (see timing.stage)", ["stage"], buckets=LATENCY_BUCKETS
+)
+STAGE_ERRORS = Counter("pipeline_stage_errors_total", "Pipeline stages that raised", ["stage"])
+STAGES_IN_FLIGHT = Gauge("pipeline_stages_in_flight", "Pipeline stages currently running", ["stage"])
+
+UPSTREAM_SECONDS = Histogram(
+    "upstream_request_seconds", "Duration of requests to upstream APIs", ["host"], buckets=LATENCY_BUCKETS
+)
+UPSTREAM_ERRORS = Counter("upstream_errors_total", "Upstream requests that failed", ["host"])
+UPSTREAM_IN_FLIGHT = Gauge("upstream_requests_in_flight", "Upstream requests currently open", ["host"])
+# Fed by limiter.py, per upstream (ooni, radar, scraperapi, llm)
+UPSTREAM_CONCURRENCY_LIMIT = Gauge("upstream_concurrency_limit", "Current adaptive concurrency limit", ["upstream"])
+UPSTREAM_CIRCUIT_STATE = Gauge("upstream_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ["upstream"])
+UPSTREAM_REJECTED = Counter("upstream_rejected_total", "Calls failed fast because the circuit was open", ["upstream"])
+# Fed by hedge.py - hedge rate is (won + lost) / all, win rate won / (won + lost)
+HEDGES = Counter(
+    "upstream_hedges_total", "Hedgeable upstream calls by whether a duplicate request was sent and answered first (won), "
+    "sent and beaten by the original (lost), not needed (none) or over the hedge budget (skipped)", ["upstream", "hedge"]
+)
+
+LLM_SECONDS = Histogram("llm_call_seconds", "Duration of LLM calls", ["call"], buckets=LATENCY_BUCKETS)
+LLM_TOKENS = Histogram("llm_call_tokens", "Tokens per LLM call", ["call", "kind"], buckets=TOKEN_BUCKETS)
+LLM_ERRORS = Counter("llm_errors_total", "LLM calls that failed", ["call"])
+
+CACHE_LOOKUPS = Counter("cache_lookups_total", "Memoization lookups", ["cache", "result"])
+CACHE_ERRORS = Counter("cache_errors_total", "Shared cache reads and writes that failed (served as misses)", ["op"])
+SINGLEFLIGHT = Counter(
+    "singleflight_calls_total", "Upstream and LLM calls by whether they started a request (leader), shared one "
+    "already in flight (coalesced) or were dropped when every caller left (abandoned)", ["kind", "result"]
+)
+
+REPORTS = Counter("reports_total", "Reports by outcome (success, partial, error, rejected, cancelled)", ["outcome"])
+REPORTS_IN_FLIGHT = Gauge("reports_in_flight", "Reports currently being built")
+REPORTS_QUEUED = Gauge("reports_queued", "Reports waiting for an admission slot")
+DEADLINE_EXCEEDED = Counter("deadline_exceeded_total", "Report stages left out because they missed the deadline", ["stage"])
+
+# Fed by loop_monitor.py
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a heartbeat it had scheduled",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+LOOP_LAG_RECENT_MAX = Gauge("event_loop_lag_recent_max_seconds", "Largest event loop lag over the last 10 seconds")
+LOOP_STALLS = Counter("event_loop_stalls_total", "Times a single callback blocked the event loop past the threshold")
+
+# Which LLM call is being made ("sql", "dc", "ooni", "radar", "countries", ...) - set by the caller's section
+_llm_call: contextvars.ContextVar[str] = contextvars.ContextVar("llm_call", default="other")
+
+
+# ----------------------------------------
+# Recording helpers
+# ----------------------------------------
+def observe_stage(name: str, seconds: float, failed: bool = False) -> None:
+    STAGE_SECONDS.labels(name).observe(seconds)
+    if failed:
+        STAGE_ERRORS.labels(name).inc()
+
+
+def host_of(url: str) -> str:
+    return urlsplit(url).netloc or url
+
+
+@contextmanager
+def upstream(url: str):
+    """Times one request to the host behind url; an exception in the block counts as an error."""
+    host = host_of(url)
+    UPSTREAM_IN_FLIGHT.labels(host).inc()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        UPSTREAM_ERRORS.labels(host).inc()
+        raise
+    finally:
+        UPSTREAM_SECONDS.labels(host).observe(time.perf_counter() - start)
+        UPSTREAM_IN_FLIGHT.labels(host).dec()
+
+
+@contextmanager
+def llm_call(name: str):
+    """Labels the LLM calls made inside the block (including by tasks it spawns) with name."""
+    token = _llm_call.set(name)
+    try:
+        yield
+    finally:
+        _llm_call.reset(token)
+
+
+@contextmanager
+def track_llm():
+    """Times one LLM request under the current call label."""
+    call = _llm_call.get()
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        LLM_ERRORS.labels(call).inc()
+        raise
+    finally:
+        LLM_SECONDS.labels(call).observe(time.perf_counter() - start)
+
+
+def record_llm_usage(message) -> None:
+    """Token counts from a langchain AIMessage's usage_metadata, when the provider returned them."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    call = _llm_call.get()
+    if "input_tokens" in usage:
+        LLM_TOKENS.labels(call, "prompt").observe(usage["input_tokens"])
+    if "output_tokens" in usage:
+        LLM_TOKENS.labels(call, "completion").observe(usage["output_tokens"])
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+# ----------------------------------------
+# Exposition
+# ----------------------------------------
+def render() -> tuple[bytes, str]:
+    """The /metrics payload and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
+
+
+def server_timing(summary: dict) -> str:
+    """
+    Server-Timing header value from a StageTimings summary, e.g.
+    'wall;dur=1834.2, ooni.fetch;dur=812.4;desc="3 calls"' - shown per request in browser devtools.
+    """
+    entries = []
+    for name, stage in sorted(summary.items(), key=lambda item: item[0] != "wall"):
+        entry = f"{name};dur={stage['total_ms']}"
+        if stage["count"] > 1:
+            entry += f';desc="{stage["count"]} calls"'
+        entries.append(entry)
+    return ", ".join(entries)
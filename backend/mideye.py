@@ -1,66 +1,82 @@
 '''
 Scrapes tables from Mideye website into SQL tables - makes it faster instead of web-scraping everything at inference
 '''
+import asyncio
 import requests
-from bs4 import BeautifulSoup
-import csv
 import logging
 import pandas as pd
-import duckdb
+
+from backend import extract
 # Configure logging for better output and debugging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def scrape_mideye_mobile_networks(url: str):
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+}
+
+def fetch_mideye_html(url: str, validators: dict = None) -> tuple[str | None, dict]:
     """
-    Scrapes the mobile network list table from mideye.com.
-    Assumes the table is fully loaded on initial page load,
-    has no ID, is the only table on the page, and resides within
-    a div with class 'entry-content'. It also assumes no thead/tfoot
-    and the first tbody row serves as headers.
+    Fetches the Mideye page, conditionally when validators from the last ingestion are given.
 
     Args:
         url (str): The URL of the page containing the table.
+        validators (dict): {'etag', 'last_modified'} recorded by the previous fetch, if any.
+
+    Returns:
+        (html, validators): html is None when the server answered 304 Not Modified.
     """
+    validators = validators or {}
+    headers = dict(HEADERS)
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
     logging.info(f"Attempting to fetch content from: {url}")
-    try:
-        # Use requests to get the HTML content of the page
-        # Added a User-Agent header to mimic a real browser, which can help prevent some blocks
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-        }
-        response = requests.get(url, headers=headers, timeout=15) # Added timeout for safety
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        logging.info("Successfully fetched page content.")
-
-    except requests.exceptions.HTTPError as errh:
-        logging.error(f"HTTP Error: {errh} - Status Code: {response.status_code}")
-        return
-    except requests.exceptions.ConnectionError as errc:
-        logging.error(f"Error Connecting: {errc}")
-        return
-    except requests.exceptions.Timeout as errt:
-        logging.error(f"Timeout Error: {errt}")
-        return
-    except requests.exceptions.RequestException as err:
-        logging.error(f"An unexpected error occurred: {err}")
-        return
+    # Added a User-Agent header to mimic a real browser, which can help prevent some blocks
+    response = requests.get(url, headers=headers, timeout=15) # Added timeout for safety
+    if response.status_code == 304:
+        logging.info("Mideye page not modified since the last ingestion.")
+        return None, validators
+    response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
+    logging.info("Successfully fetched page content.")
+    return response.text, {
+        'etag': response.headers.get('ETag', ''),
+        'last_modified': response.headers.get('Last-Modified', ''),
+    }
+
+def extract_table_html(html: str) -> str:
+    """
+    The markup of the operator table only - hashed by ingest.py to detect changes, so edits
+    elsewhere on the page (menus, scripts, timestamps) don't trigger a re-ingestion.
+    """
+    start = html.find('<table')
+    end = html.find('</table>', start)
+    if start == -1 or end == -1:
+        return html
+    return html[start:end + len('</table>')]
 
+def parse_mideye_table(html: str):
+    """
+    Parses the mobile network list table out of the Mideye page.
+    Assumes the table is fully loaded on initial page load,
+    has no ID, is the only table on the page, and resides within
+    a div with class 'entry-content' (or is the extracted table itself).
+    It also assumes no thead/tfoot and the first tbody row serves as headers.
+    """
     # Parse the HTML content
-    soup = BeautifulSoup(response.text, 'html.parser')
-    logging.info("HTML content parsed with BeautifulSoup.")
+    root = extract.parse_html(html)
+    logging.info("HTML content parsed with lxml.")
 
     # --- Step 1: Locate the parent div with class 'entry-content' ---
-    entry_content_div = soup.find('div', class_='entry-content')
-    if not entry_content_div:
-        logging.error("Error: Div with class 'entry-content' not found.")
-        return
-
-    logging.info("Found 'entry-content' div.")
+    entry_content_div = extract.first(root, f"//div[{extract.has_class('entry-content')}]")
+    if entry_content_div is None:
+        entry_content_div = root
 
     # --- Step 2: Locate the table within the 'entry-content' div ---
     # Since it's the only table, we can directly find it within the parent div.
-    table = entry_content_div.find('table')
-    if not table:
+    table = extract.first(entry_content_div, ".//table")
+    if table is None:
         logging.error("Error: Table not found within the 'entry-content' div.")
         return
 
@@ -68,75 +84,75 @@ def scrape_mideye_mobile_networks(url: str):
 
     # --- Step 3: Extract headers and data from tbody ---
     # Since there's no thead, we assume the first <tr> in tbody is the header.
-    all_data = []
-    headers = []
-
-    tbody = table.find('tbody')
-    if not tbody:
+    tbody = extract.first(table, ".//tbody")
+    if tbody is None:
         logging.error("Error: tbody element not found within the table.")
         return
 
-    rows = tbody.find_all('tr')
-    if not rows:
+    rows = extract.iter_rows(tbody, cell_xpath=".//td | .//th") # Use both td/th in case headers are td
+    headers = next(rows, None)
+    if headers is None:
         logging.warning("No rows found in the table tbody.")
         return
 
-    logging.info(f"Found {len(rows)} rows in the table body.")
-
-    # Extract headers from the first row
-    first_row_cells = rows[0].find_all(['td', 'th']) # Use both td/th in case headers are td
-    if first_row_cells:
-        headers = [cell.get_text(strip=True) for cell in first_row_cells]
+    all_data = []
+    if headers:
         all_data.append(headers)
         logging.info(f"Extracted headers (from first row of tbody): {headers}")
     else:
         logging.warning("Could not extract headers from the first row.")
 
-    # Extract data from subsequent rows
-    # Start from index 1 because index 0 (the first row) was treated as headers
-    for i, row in enumerate(rows[1:]):
-        cells = row.find_all('td') # Data rows typically only have <td>
-        row_data = [cell.get_text(strip=True) for cell in cells]
-        if row_data:
-            all_data.append(row_data)
-            # Log progress for large tables (e.g., every 500 rows)
-            if (i + 1) % 500 == 0:
-                logging.info(f"Processed {i + 1} data rows...")
+    # Extract data from subsequent rows, streamed one row at a time
+    all_data.extend(row for row in extract.iter_rows(tbody, "(.//tr)[position() > 1]") if row)
+    logging.info(f"Extracted {len(all_data)} rows from the table body.")
     return all_data
 
-output_filename = 'mideye_mobile_network_list.csv'
-def clean_data(input:list): #could look at polars instead of pd for speed improvement.
+def scrape_mideye_mobile_networks(url: str):
+    """
+    Scrapes the mobile network list table from mideye.com.
+
+    Args:
+        url (str): The URL of the page containing the table.
+    """
+    try:
+        html, _ = fetch_mideye_html(url)
+    except requests.exceptions.RequestException as err:
+        logging.error(f"Error fetching {url}: {err}")
+        return
+    return parse_mideye_table(html)
+
+TARGET_URL = "https://mideye.com/authentication-service/global-coverage/mobile-network-list/"
+TABLE_NAME = "mideye_mobile_network_list"
+MIN_ROWS = 300  # the list has ~376 operators; far fewer means the page layout changed
+
+def clean_data(input:list) -> pd.DataFrame:
     input = input[2:]
     df = pd.DataFrame(input, columns=["Country","Operator", "Network Code", "Display Text"])
-    for i in range(len(df)):
-        if df.loc[i,"Country"] == "":
-            df.loc[i, "Country"] = df.loc[i-1,"Country"]
-
-    df.to_csv(output_filename, index=False)
-    print(df.head(10))
-# Define the target URL
-target_url = "https://mideye.com/authentication-service/global-coverage/mobile-network-list/"
-
-con = duckdb.connect('bryan.db')
-con.execute("""
-    CREATE OR REPLACE TABLE mideye_mobile_network_list (
-        "Country" TEXT,
-        "Operator" TEXT,
-        "Network Code" TEXT,
-        "Display Text" TEXT
-    )
-""")
-
-# Load from CSV into table
-con.execute("""
-    COPY mideye_mobile_network_list 
-    FROM 'mideye_mobile_network_list.csv' 
-    (FORMAT CSV, HEADER)
-""")
-
-con.close()
-logging.info("Data saved successfully to mideye_mobile_network_list.db")
+    # operators after the first one of a country have a blank Country cell
+    return extract.forward_fill_blank(df, "Country")
+
+async def fetch_content(validators: dict = None, url: str = TARGET_URL) -> tuple[str | None, dict]:
+    """
+    The extracted table markup (None if unchanged upstream) and the new HTTP validators.
+    Used by ingest.py, which hashes the markup before deciding whether to parse it.
+    """
+    html, validators = await asyncio.to_thread(fetch_mideye_html, url, validators)  # requests is blocking
+    return (extract_table_html(html) if html is not None else None), validators
+
+def parse_content(table_html: str) -> pd.DataFrame:
+    raw = parse_mideye_table(table_html)
+    if not raw:
+        return pd.DataFrame()
+    return clean_data(raw)
+
+async def fetch_mideye_mobile_networks(url: str = TARGET_URL) -> pd.DataFrame:
+    """
+    Scrapes and cleans the Mideye list. Has no side effects - loading into DuckDB is done by ingest.py.
+    """
+    table_html, _ = await fetch_content(url=url)
+    return parse_content(table_html)
 
 if __name__ == "__main__":
-    im1 = scrape_mideye_mobile_networks(target_url)
-    clean_data(im1)
\ No newline at end of file
+    # Scrape + load just this source through the shared ingestion pipeline: python -m backend.mideye
+    from backend import ingest
+    asyncio.run(ingest.main(["--sources", "mideye"]))
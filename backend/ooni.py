@@ -1,11 +1,19 @@
 '''
 Uses OONI API - (20x faster + less code then previous playwright web-scraping version) to get results from social media tests via OONI Explorer
 '''
-import aiohttp
 import logging
 import math
+import os
 from datetime import date, timedelta
 
+from backend import hedge
+from backend import limiter
+from backend import metrics
+
+# Overridable so benchmarks can point the pipeline at a local stand-in
+OONI_API_URL = os.environ.get("OONI_API_URL", "https://api.ooni.io")
+OONI_TIMEOUT_S = float(os.environ.get("OONI_TIMEOUT_S", "30"))
+
 async def scrape_ooni_explorer(
     test_name: str,
     horizon: int = 30,
@@ -28,14 +36,22 @@ async def scrape_ooni_explorer(
     if country:
         params["probe_cc"] = country.upper()
 
-    url = "https://api.ooni.io/api/v1/measurements"
+    url = f"{OONI_API_URL}/api/v1/measurements"
+
+    import aiohttp  # imported on first use - it is a noticeable share of the API's import time
+
+    # hedge.call runs it under the "ooni" limiter
+    async def fetch_measurements(session) -> dict:
+        with metrics.upstream(url):
+            async with session.get(url, params=params) as resp:
+                if resp.status != 200:
+                    text = await resp.text()
+                    raise limiter.UpstreamError(f"OONI API error {resp.status}: {text}", resp.status)
+                return await resp.json()
 
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url, params=params) as resp:
-            if resp.status != 200:
-                text = await resp.text()
-                raise RuntimeError(f"OONI API error {resp.status}: {text}")
-            data = await resp.json()
+    # aiohttp's default is 5 minutes - a hung OONI request should count against the upstream long before that
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=OONI_TIMEOUT_S)) as session:
+        data = await hedge.call("ooni", lambda: fetch_measurements(session))
 
     results = data.get("results", [])
     logging.info(f"[ooni-api] Retrieved {len(results)} results from API.")
@@ -69,7 +85,7 @@ async def scrape_ooni_explorer(
     md_lines.append(f"**Anomalies:** {int(anomaly_count/2)}")
     md_lines.append(f"**Accessible:** {math.ceil(accessible_count/2)}")
     res = "\n".join(md_lines)
-    logging.info(f"Scraped From OONI API: {res}")
+    logging.debug(f"Scraped From OONI API: {res}")
     return "\n".join(md_lines), anomaly_count, accessible_count
 import asyncio
 
@@ -0,0 +1,295 @@
+'''
+Offline operator entity resolution - merges the operators/ISPs from the MCC, Mideye and Traforama tables into one canonical `operators` table, so reports no longer ask the LLM to do the merge
+'''
+import functools
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+import duckdb
+import pandas as pd
+import pycountry
+
+from backend.country_code_converter import COUNTRY_ALIASES
+from backend.country_code_converter import canonical_country
+from backend.country_code_converter import get_alpha2_from_country_name
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "bryan.db")
+
+# (table, operator column, kind) - kind tells the report whether a source lists mobile operators or ISPs
+SOURCES = [
+    ("mcc_mnc_table", "Network Operator", "mobile"),
+    ("mideye_mobile_network_list", "Operator", "mobile"),
+    ("traforama_isp_list", "Providers", "isp"),
+]
+
+# Two names in the same country are merged when their cores are this similar (catches "Molbilink"/"Mobilink")
+SIMILARITY_THRESHOLD = 0.88
+
+LEGAL_SUFFIXES = {
+    "ltd", "limited", "inc", "llc", "lc", "plc", "pvt", "private", "corp", "corporation", "co", "company",
+    "sa", "sas", "srl", "spa", "gmbh", "ag", "ab", "as", "asa", "bv", "nv", "oy", "kk", "pte", "bhd", "sdn",
+}
+# Short forms operators put in their names ("T-Mobile USA", "Vodafone UK"), on top of each country's
+# name, other spellings and ISO alpha-3 code - keyed by the MCC table's spelling
+COUNTRY_ABBREVIATIONS = {
+    "United States": {"us", "usa", "america", "american"},
+    "United Kingdom": {"uk", "gb", "britain", "british"},
+    "United Arab Emirates": {"uae", "emirates"},
+    "Saudi Arabia": {"ksa", "saudi"},
+    "Democratic Republic of Congo": {"drc", "rdc"},
+    "South Korea": {"korea"},
+    "Netherlands": {"nl", "holland"},
+    "Czech Republic": {"cz", "czech"},
+}
+GENERIC_WORDS = {
+    "the", "and", "of", "de", "mobile", "wireless", "cellular", "telecom", "telecoms", "telecommunication",
+    "telecommunications", "communications", "communication", "network", "networks", "broadband",
+    "internet", "services", "service", "group", "holding", "holdings", "operator", "cable", "business",
+}
+
+
+# ----------------------------------------
+# Name normalization
+# ----------------------------------------
+def normalize_name(name: str) -> str:
+    """Lowercases, strips accents and punctuation: "Télé-Com S.A." -> "tele com sa"."""
+    name = unicodedata.normalize("NFKD", name).encode("ascii", "ignore").decode("ascii").lower()
+    name = re.sub(r"(?<=\w)&(?=\w)", "", name)  # "AT&T" -> "att", matching "ATT Wireless"
+    name = name.replace("&", " and ").replace("s.a.", "sa")
+    name = re.sub(r"[^a-z0-9]+", " ", name)
+    return re.sub(r"\s+", " ", name).strip()
+
+
+@functools.lru_cache(maxsize=None)
+def country_words(country: str) -> frozenset[str]:
+    """Words that name country inside an operator name: its spellings, ISO alpha-3 code and common abbreviations."""
+    names = [country, *(alias for alias, canonical in COUNTRY_ALIASES.items() if canonical == country)]
+    alpha2 = get_alpha2_from_country_name(country)
+    if alpha2:
+        names.append(pycountry.countries.get(alpha_2=alpha2).alpha_3)
+    words = {word for n in names for word in normalize_name(n).split()} - {"and", "of", "the"}
+    return frozenset(words | COUNTRY_ABBREVIATIONS.get(country, set()))
+
+
+def core_name(name: str, country: str = "") -> str:
+    """
+    Normalized name without legal suffixes, generic telecom words or the country's name and short
+    forms, i.e. the part that identifies the company: "Telenor Pakistan (Pvt) Ltd." -> "telenor",
+    "T-Mobile USA" -> "t". Falls back to the normalized name when nothing distinctive is left.
+    """
+    normalized = normalize_name(name)
+    stripped = LEGAL_SUFFIXES | GENERIC_WORDS | (country_words(country) if country else frozenset())
+    tokens = [t for t in normalized.split() if t not in stripped]
+    return " ".join(tokens) or normalized
+
+
+def split_providers(providers: str) -> list[str]:
+    """
+    Splits Traforama's comma-separated provider list, re-attaching fragments that are only a
+    legal suffix ("Choopa, LLC" is one provider, not two).
+    """
+    names: list[str] = []
+    for piece in re.split(r"\s*,\s*", providers or ""):
+        if not piece:
+            continue
+        if names and set(normalize_name(piece).split()) <= LEGAL_SUFFIXES:
+            names[-1] = f"{names[-1]}, {piece}"
+        else:
+            names.append(piece)
+    return names
+
+
+def _similar(a: str, b: str) -> bool:
+    if a == b:
+        return True
+    a_tokens, b_tokens = a.split(), b.split()
+    # "verizon" vs "verizon fios": same company when one core is a word-prefix of the other
+    shorter, longer = sorted([a_tokens, b_tokens], key=len)
+    if len(" ".join(shorter)) >= 3 and longer[:len(shorter)] == shorter:
+        return True
+    return SequenceMatcher(None, a, b).ratio() >= SIMILARITY_THRESHOLD
+
+
+# ----------------------------------------
+# Clustering
+# ----------------------------------------
+def load_mentions(con: duckdb.DuckDBPyConnection) -> pd.DataFrame:
+    """One row per (source table, country, operator name, code) found in the reference tables."""
+    frames = []
+    for table, column, kind in SOURCES:
+        df = con.execute(f"SELECT * FROM {table}").df()
+        if table == "mcc_mnc_table":
+            codes = df["Mobile Country Code"].astype(str) + "-" + df["Mobile Network Code"].astype(str)
+        elif table == "mideye_mobile_network_list":
+            codes = df["Network Code"].fillna("").astype(str)
+        else:
+            codes = pd.Series("", index=df.index)
+        mentions = pd.DataFrame({
+            "source_table": table,
+            "kind": kind,
+            "source_country": df["Country"].fillna(""),
+            "source_name": df[column].fillna(""),
+            "code": codes,
+        })
+        if table == "traforama_isp_list":
+            mentions["source_name"] = mentions["source_name"].map(split_providers)
+            mentions = mentions.explode("source_name").dropna(subset=["source_name"])
+        frames.append(mentions)
+
+    mentions = pd.concat(frames, ignore_index=True)
+    mentions["source_name"] = mentions["source_name"].str.strip()
+    mentions = mentions[(mentions["source_name"] != "") & ~mentions["source_country"].str.startswith("*")]
+    mentions["country"] = mentions["source_country"].map(canonical_country)
+    mentions["core"] = [core_name(n, c) for n, c in zip(mentions["source_name"], mentions["country"])]
+    return mentions.reset_index(drop=True)
+
+
+def cluster_mentions(mentions: pd.DataFrame) -> pd.Series:
+    """
+    Assigns a cluster id to every mention. Blocking is by country - names are only compared
+    with other names in the same country - and matches are merged with union-find.
+    """
+    parent = list(range(len(mentions)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for _, block in mentions.groupby("country"):
+        # mentions sharing a core are joined directly; only distinct cores are compared pairwise
+        for members in block.groupby("core").groups.values():
+            root = find(members[0])
+            for m in members[1:]:
+                parent[find(m)] = root
+        firsts = block.groupby("core").head(1)
+        cores = list(zip(firsts.index, firsts["core"]))
+        for i, (a_idx, a_core) in enumerate(cores):
+            for b_idx, b_core in cores[i + 1:]:
+                if _similar(a_core, b_core):
+                    parent[find(b_idx)] = find(a_idx)
+
+    return pd.Series([find(i) for i in range(len(mentions))], index=mentions.index)
+
+
+def _letter_pairs(cores) -> Counter:
+    """How often each pair of adjacent letters occurs across all the cores."""
+    return Counter(core[i:i + 2] for core in cores for i in range(len(core) - 1))
+
+
+def _canonical_name(group: list, letter_pairs: Counter) -> str:
+    """
+    The name a cluster is listed under: the one whose core the most source tables agree on, then
+    the most frequent spelling. Between cores that tie, a typo usually makes one rare letter pair
+    ("Molbilink"'s "lb"), so the core whose rarest pair is most common wins; then the shortest name.
+    """
+    sources_by_core: dict[str, set] = defaultdict(set)
+    for m in group:
+        sources_by_core[m.core].add(m.source_table)
+    counts = Counter(m.source_name for m in group)
+    core_of = {m.source_name: m.core for m in group}
+
+    def rarest_pair(core: str) -> int:
+        return min((letter_pairs[core[i:i + 2]] for i in range(len(core) - 1)), default=0)
+
+    return min(counts, key=lambda n: (-len(sources_by_core[core_of[n]]), -counts[n], -rarest_pair(core_of[n]), len(n), n))
+
+
+def resolve_operators(mentions: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Returns (operators, operator_sources) DataFrames for the clustered mentions."""
+    mentions = mentions.assign(cluster=cluster_mentions(mentions))
+    letter_pairs = _letter_pairs(mentions["core"])
+    clusters: dict[int, list] = defaultdict(list)
+    for mention in mentions.itertuples(index=False):
+        clusters[mention.cluster].append(mention)
+
+    rows = []
+    for cluster, group in clusters.items():
+        names = [m.source_name for m in group]
+        canonical = _canonical_name(group, letter_pairs)
+        rows.append({
+            "cluster": cluster,
+            "Country": group[0].country,
+            "Operator": canonical,
+            "Kind": "+".join(sorted({m.kind for m in group})),
+            "Codes": ", ".join(sorted({m.code for m in group if m.code})),
+            "Also Known As": ", ".join(sorted(set(names) - {canonical})),
+            "Sources": ", ".join(sorted({m.source_table for m in group})),
+        })
+
+    # stable ids: ordered by country then name, so re-ingesting unchanged data yields the same ids
+    operators = pd.DataFrame(rows).sort_values(["Country", "Operator"], ignore_index=True)
+    operators.insert(0, "operator_id", range(len(operators)))
+    mentions["operator_id"] = mentions["cluster"].map(dict(zip(operators["cluster"], operators["operator_id"])))
+    operator_sources = mentions[["operator_id", "source_table", "source_country", "source_name", "code"]].drop_duplicates()
+    return operators.drop(columns=["cluster"]), operator_sources
+
+
+# ----------------------------------------
+# Ingestion step
+# ----------------------------------------
+def build_operators_table(con: duckdb.DuckDBPyConnection) -> int:
+    """
+    Rebuilds `operators` and `operator_sources` from the three reference tables in one transaction.
+    Run after any of mcc.py / mideye.py / traforama.py re-ingests. Returns the operator count.
+    """
+    start = time.perf_counter()
+    mentions = load_mentions(con)
+    operators, operator_sources = resolve_operators(mentions)
+
+    con.execute("BEGIN TRANSACTION")
+    try:
+        con.register("_operators", operators)
+        con.register("_operator_sources", operator_sources)
+        con.execute("CREATE OR REPLACE TABLE operators AS SELECT * FROM _operators")
+        con.execute("CREATE OR REPLACE TABLE operator_sources AS SELECT * FROM _operator_sources")
+        con.execute("COMMIT")
+    except Exception:
+        con.execute("ROLLBACK")
+        raise
+    finally:
+        con.unregister("_operators")
+        con.unregister("_operator_sources")
+
+    logger.info(
+        f"Resolved {len(mentions)} operator mentions into {len(operators)} operators "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return len(operators)
+
+
+def has_operators_table(con: duckdb.DuckDBPyConnection) -> bool:
+    return con.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = 'operators'"
+    ).fetchone()[0] > 0
+
+
+def get_operators(con: duckdb.DuckDBPyConnection, countries: list[str], tables: list[str] = None) -> pd.DataFrame:
+    """
+    Deduplicated operators for the given countries (as named in the MCC table), optionally
+    limited to operators that appear in at least one of the given source tables.
+    """
+    tables = tables or [table for table, _, _ in SOURCES]
+    return con.execute(
+        'SELECT Country, Operator, Kind, Codes, "Also Known As" FROM operators '
+        "WHERE Country IN (SELECT unnest(?)) AND list_has_any(string_split(Sources, ', '), ?) "
+        "ORDER BY Country, Operator",
+        [list(countries), list(tables)],
+    ).df()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    con = duckdb.connect(DB_PATH)
+    try:
+        build_operators_table(con)
+    finally:
+        con.close()
@@ -0,0 +1,36 @@
+'''
+Results fetched ahead of time - a batch of reports (see batch.py) fetches every OONI, Radar and datacenters.com key its reports need once, then builds the reports with those results in place, so the fetch wrappers serve them instead of calling the upstream again
+'''
+import json
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# fetch key -> result (or the exception the fetch raised), for the reports built inside using()
+_store: ContextVar[dict] = ContextVar("prefetched", default=None)
+
+
+def fetch_key(kind: str, args: dict) -> str:
+    return f"{kind}:{json.dumps(args, sort_keys=True, default=str)}"
+
+
+@contextmanager
+def using(results: dict):
+    """Serves results (keyed by fetch_key) to the fetches made inside the block, including by tasks it spawns."""
+    token = _store.set(results)
+    try:
+        yield
+    finally:
+        _store.reset(token)
+
+
+async def call(kind: str, args: dict, fetch):
+    """Returns the prefetched result for (kind, args) - re-raising a prefetch failure - or awaits fetch()."""
+    store = _store.get()
+    if store is not None:
+        key = fetch_key(kind, args)
+        if key in store:
+            result = store[key]
+            if isinstance(result, Exception):
+                raise result
+            return result
+    return await fetch()
@@ -0,0 +1,139 @@
+'''
+On-demand profiling of a single request - runs it under pyinstrument (sampling, with asyncio task attribution) and tracemalloc, then writes a flame graph, a speedscope profile and the top allocation sites to PROFILE_DIR. Nothing is imported or started unless a capture is requested.
+
+    curl -H "X-Profile: $PROFILE_TOKEN" -X POST .../run_report ...   # one request
+    PROFILE_ALL_REPORTS=1                                           # every report (staging only)
+'''
+import asyncio
+import hmac
+import linecache
+import logging
+import os
+import re
+import time
+import tracemalloc
+import uuid
+from contextlib import asynccontextmanager
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# The X-Profile header must carry this token; without one set, only PROFILE_ALL_REPORTS can enable captures
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_ALL_REPORTS = os.environ.get("PROFILE_ALL_REPORTS", "0") == "1"
+PROFILE_INTERVAL_S = float(os.environ.get("PROFILE_INTERVAL_S", "0.001"))
+TRACEMALLOC_FRAMES = 10
+TOP_ALLOCATIONS = 25
+
+# Profile files are named <capture id>.<kind> - capture ids are random, so links can't be guessed
+PROFILE_FILE_RE = re.compile(r"^[0-9a-f]{32}\.(html|speedscope\.json|allocations\.txt)$")
+
+# pyinstrument and tracemalloc are process-wide - one capture at a time
+_capture_lock = asyncio.Lock()
+
+
+def requested(header_value: str = None) -> bool:
+    if PROFILE_ALL_REPORTS:
+        return True
+    return bool(PROFILE_TOKEN and header_value and hmac.compare_digest(header_value, PROFILE_TOKEN))
+
+
+class Capture:
+    """One profiled request: the pyinstrument session and the tracemalloc snapshots around it."""
+
+    def __init__(self, label: str):
+        self.id = uuid.uuid4().hex
+        self.label = label
+        self.seconds = 0.0
+        self._profiler = None
+        self._started_tracemalloc = False
+        self._before = None
+        self._after = None
+        self.traced_peak = 0
+
+    def start(self) -> None:
+        from pyinstrument import Profiler
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._started_tracemalloc = True
+        self._before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        # async_mode="enabled" follows this request's tasks across awaits and shows time spent waiting as <await>
+        self._profiler = Profiler(interval=PROFILE_INTERVAL_S, async_mode="enabled")
+        self._profiler.start()
+        self._started = time.perf_counter()
+
+    def stop(self) -> None:
+        self._profiler.stop()
+        self.seconds = time.perf_counter() - self._started
+        self._after = tracemalloc.take_snapshot()
+        self.traced_peak = tracemalloc.get_traced_memory()[1]
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+    def paths(self) -> dict[str, str]:
+        return {
+            "flamegraph": os.path.join(PROFILE_DIR, f"{self.id}.html"),
+            "speedscope": os.path.join(PROFILE_DIR, f"{self.id}.speedscope.json"),
+            "allocations": os.path.join(PROFILE_DIR, f"{self.id}.allocations.txt"),
+        }
+
+    def links(self) -> dict[str, str]:
+        """URLs (served by the API's /profiles route) for the written files."""
+        return {kind: f"/profiles/{os.path.basename(path)}" for kind, path in self.paths().items()}
+
+    def top_allocations(self) -> list[str]:
+        # ignore tracemalloc's own bookkeeping and the profiler's sample storage
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "*pyinstrument*")]
+        after = self._after.filter_traces(filters)
+        before = self._before.filter_traces(filters)
+        lines = []
+        for stat in after.compare_to(before, "lineno")[:TOP_ALLOCATIONS]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size_diff / 1024:+10.1f} KiB  {stat.count_diff:+7d} blocks  {frame.filename}:{frame.lineno}")
+            source = linecache.getline(frame.filename, frame.lineno).strip()
+            if source:
+                lines.append(f"{'':30}{source}")
+        return lines
+
+    def write(self) -> dict[str, str]:
+        """Writes the flame graph, speedscope profile and allocation report; returns their paths."""
+        from pyinstrument.renderers import HTMLRenderer, SpeedscopeRenderer
+
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        paths = self.paths()
+        session = self._profiler.last_session
+        with open(paths["flamegraph"], "w", encoding="utf-8") as f:
+            f.write(HTMLRenderer().render(session))
+        with open(paths["speedscope"], "w", encoding="utf-8") as f:
+            f.write(SpeedscopeRenderer().render(session))
+        with open(paths["allocations"], "w", encoding="utf-8") as f:
+            f.write(f"{self.label} - {self.seconds:.3f}s, traced memory peak {self.traced_peak / 1024:.0f} KiB\n")
+            f.write(f"\nTop {TOP_ALLOCATIONS} allocation sites (net growth over the request):\n")
+            f.write("\n".join(self.top_allocations()) + "\n")
+        logger.info(f"[profile] {self.label} ({self.seconds:.2f}s) written to {paths['flamegraph']}")
+        return paths
+
+
+@asynccontextmanager
+async def capture(label: str, enabled: bool):
+    """
+    Profiles the block when enabled and no other capture is running. Yields the Capture
+    (its files are written when the block exits) or None.
+    """
+    if not enabled:
+        yield None
+        return
+    if _capture_lock.locked():
+        logger.warning(f"[profile] another capture is running - not profiling {label}")
+        yield None
+        return
+    async with _capture_lock:
+        cap = Capture(label)
+        cap.start()
+        try:
+            yield cap
+        finally:
+            cap.stop()
+            await asyncio.to_thread(cap.write)
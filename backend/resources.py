@@ -0,0 +1,118 @@
+'''
+Process-wide handles - the one DuckDB connection and the one LLM client every module shares, created on first use (or up front by warm_up() in the API's lifespan hook) instead of at import time, so importing the app stays cheap
+'''
+import logging
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+import duckdb
+from dotenv import load_dotenv
+
+from backend import limiter
+from backend import metrics
+from backend import timing
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "bryan.db")
+LLM_MODEL = "gpt-4.1-nano"
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+load_dotenv(os.path.join(project_root, '.env'))
+
+_con = None
+_llm = None
+_lock = threading.Lock()
+
+
+def get_con() -> duckdb.DuckDBPyConnection:
+    """
+    The shared connection to bryan.db. Code running in executor threads should query
+    through get_con().cursor() - a DuckDB connection must not be used from two threads at once.
+    """
+    global _con
+    with _lock:
+        if _con is None:
+            _con = duckdb.connect(DB_PATH)
+        return _con
+
+
+def get_llm():
+    """The shared ChatOpenAI client (langchain_openai and openai are only imported here)."""
+    global _llm
+    with _lock:
+        if _llm is None:
+            from langchain_openai import ChatOpenAI
+
+            open_ai_api_key = os.environ.get("OPENAI_API_KEY")
+            if not open_ai_api_key:
+                raise ValueError("OpenAI environment variable not set in .env file.")
+            _llm = ChatOpenAI(model=LLM_MODEL, openai_api_key=open_ai_api_key)
+        return _llm
+
+
+def llm_base_url() -> str:
+    return getattr(get_llm(), "openai_api_base", None) or os.environ.get("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+
+
+async def ainvoke(prompt: str, model=None, stage: str = None) -> str:
+    """
+    Sends prompt to model (default: the shared client) and returns the reply text, recording latency and token metrics.
+    With stage, the wait for the LLM limiter is timed as "<stage>.queue" and the call itself as stage.
+    """
+    model = model or get_llm()
+    async with limiter.limit("llm", f"{stage}.queue" if stage else None):
+        with timing.stage(stage) if stage else nullcontext(), metrics.upstream(llm_base_url()), metrics.track_llm():
+            message = await model.ainvoke(prompt)
+    metrics.record_llm_usage(message)
+    return message.content
+
+
+# ----------------------------------------
+# Warm-up
+# ----------------------------------------
+def warm_up() -> dict[str, float]:
+    """
+    Pays the first-request costs up front: opens the DB and reads the reference tables'
+    metadata, builds pycountry's lookup indexes, constructs the LLM client and imports
+    the fetchers' lazily loaded clients.
+    Returns seconds spent per step. Blocking - run it in a thread from async code.
+    """
+    from backend import country_code_converter
+    from backend import section_cache
+
+    steps = {}
+
+    started = time.perf_counter()
+    con = get_con().cursor()
+    section_cache.reference_data_version(con)
+    for table in section_cache.REFERENCE_TABLES:
+        con.execute(f"SELECT * FROM {table} LIMIT 1").fetchall()
+    steps["db"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # pycountry loads its JSON database and builds its indexes on the first lookup
+    country_code_converter.get_alpha2_from_country_name("Peru")
+    steps["pycountry"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    get_llm()
+    steps["llm_client"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    # lazily imported by the fetchers - importing on a request would block the event loop
+    import aiohttp  # noqa: F401
+    steps["imports"] = time.perf_counter() - started
+
+    logger.info("Warm-up done: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in steps.items()))
+    return steps
+
+
+async def warm_llm_connection(timeout_s: float = 5.0) -> None:
+    """Opens (and keeps pooled) the HTTPS connection to the LLM API with a free models request."""
+    try:
+        await get_llm().root_async_client.with_options(timeout=timeout_s).models.list()
+    except Exception as e:
+        logger.warning(f"LLM connection warm-up failed (first request will connect instead): {e}")
@@ -0,0 +1,130 @@
+'''
+Section-level memoization for reports - each section is keyed on the fingerprint of its own inputs (countries, source data version, prompt version), so a repeat or overlapping report only recomputes the sections whose inputs changed. Raw upstream fetches and LLM answers are memoized too, under their source's data version and their prompt. Everything is stored in the shared cache (see cache.py).
+'''
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import duckdb
+
+from backend import cache
+from backend import ingest
+from backend import metrics
+from backend import snapshot
+
+logger = logging.getLogger(__name__)
+
+# Bump a section's version whenever its prompt or rendering changes, so stale output is not reused
+PROMPT_VERSIONS = {
+    "sql": 1,
+    "dc": 1,
+    "ooni": 1,
+    "radar": 1,
+}
+
+SECTION_CACHE_TTL = int(os.environ.get("SECTION_CACHE_TTL", str(24 * 3600)))
+# LLM answers are keyed on the model and the full prompt, so they also let map-reduce reuse a country's partial answer
+LLM_CACHE_TTL = int(os.environ.get("LLM_CACHE_TTL", "3600"))
+
+# Reference table versions are cheap to compute but still a full scan - reuse them briefly
+REFERENCE_VERSION_TTL = 60
+_reference_version: tuple[float, str] = (0.0, "")
+
+REFERENCE_TABLES = ["mcc_mnc_table", "mideye_mobile_network_list", "traforama_isp_list"]
+
+
+# ----------------------------------------
+# Per-source data versions
+# ----------------------------------------
+def reference_data_version(con: duckdb.DuckDBPyConnection) -> str:
+    """
+    Content version of the MCC/Mideye/Traforama tables (and anything derived from them).
+    Changes only when one of them is re-ingested with different content. Uses the content
+    hashes recorded by ingest.py when every table was loaded through it, else hashes the rows.
+    """
+    global _reference_version
+    versions = ingest.content_versions(con)
+    if len(versions) == len(ingest.SOURCES):
+        parts = [f"{source}:{digest}" for source, digest in sorted(versions.items())]
+    else:
+        checked_at, version = _reference_version
+        if version and time.monotonic() - checked_at < REFERENCE_VERSION_TTL:
+            return version
+        parts = []
+        for table in REFERENCE_TABLES:
+            count, row_hash = con.execute(f"SELECT count(*), sum(hash(t)) FROM {table} t").fetchone()
+            parts.append(f"{table}:{count}:{row_hash}")
+    for derived in ["operators", "country_fact_sheets"]:
+        exists = con.execute(
+            "SELECT count(*) FROM information_schema.tables WHERE table_name = ?", [derived]
+        ).fetchone()[0]
+        parts.append(f"{derived}:{exists}")
+    version = hashlib.sha256("|".join(parts).encode()).hexdigest()[:16]
+    _reference_version = (time.monotonic(), version)
+    return version
+
+
+def radar_data_version() -> str:
+    """Cloudflare Radar summaries are refreshed daily."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def datacenter_data_version() -> str:
+    """datacenters.com listings change slowly - reuse for a day."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+def ooni_data_version() -> str:
+    """OONI measurements arrive continuously - reuse within the hour."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H")
+
+
+# Raw fetches are cached under their source's current data version, for at most one version period
+FETCH_VERSIONS = {
+    "ooni": (ooni_data_version, 3600),
+    "radar": (radar_data_version, 24 * 3600),
+    "datacenter": (datacenter_data_version, 24 * 3600),
+}
+
+
+# ----------------------------------------
+# Memoization
+# ----------------------------------------
+def fingerprint(section: str, inputs: dict) -> str:
+    payload = {"section": section, "prompt_version": PROMPT_VERSIONS.get(section, 0), **inputs}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+async def cached_section(section: str, inputs: dict, compute) -> str:
+    """
+    Returns the memoized output for (section, inputs) or runs compute() to produce it.
+    compute returns (markdown, complete); output built from partial data (a failed fetch)
+    is returned but not memoized, so the next report retries it.
+    """
+    key = fingerprint(section, inputs)
+    # a record/replay session must see every upstream call, so it always recomputes
+    cached = None if snapshot.active() else await cache.get("section", key)
+    metrics.cache_lookup(f"section.{section}", cached is not None)
+    if cached is not None:
+        logger.info(f"[{section}] section cache hit")
+        return cached
+    markdown, complete = await compute()
+    if complete:
+        await cache.put("section", key, markdown, SECTION_CACHE_TTL)
+    else:
+        logger.info(f"[{section}] built from partial data - not cached")
+    return markdown
+
+
+async def cached_fetch(kind: str, args: dict, fetch, keep=None):
+    """Memoizes one OONI, Radar or datacenters.com fetch for its source's current data version."""
+    version, ttl_s = FETCH_VERSIONS[kind]
+    return await cache.cached(kind, {**args, "data": version()}, fetch, ttl_s, keep)
+
+
+async def cached_llm(args: dict, call) -> str:
+    """Memoizes one LLM answer - args holds the model and the prompt."""
+    return await cache.cached("llm", args, call, LLM_CACHE_TTL)
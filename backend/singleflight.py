@@ -0,0 +1,71 @@
+'''
+Single-flight request coalescing - concurrent callers asking for the same upstream fetch or LLM call (same kind and arguments) share one in-flight task instead of each sending their own request. A caller that gives up (cancelled, or out of deadline) only stops waiting; the shared call is cancelled only once nobody is waiting for it any more.
+'''
+import asyncio
+import json
+import logging
+
+from backend import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class Flight:
+    """One shared in-flight call and how many callers are waiting on it."""
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+# In-flight calls by key - tasks belong to one event loop, so the table is per loop
+_flights: dict[str, Flight] = {}
+_flights_loop = None
+
+
+def _table() -> dict[str, Flight]:
+    global _flights, _flights_loop
+    loop = asyncio.get_running_loop()
+    if _flights_loop is not loop:
+        _flights, _flights_loop = {}, loop
+    return _flights
+
+
+def flight_key(kind: str, args: dict) -> str:
+    return f"{kind}:{json.dumps(args, sort_keys=True, default=str)}"
+
+
+async def call(kind: str, args: dict, fetch):
+    """
+    Awaits fetch() - or, if an identical (kind, args) call is already in flight, that call's
+    result (or exception). The shared task runs in the context of the caller that started it.
+    """
+    flights = _table()
+    key = flight_key(kind, args)
+    flight = flights.get(key)
+    if flight is None:
+        flight = Flight(asyncio.ensure_future(fetch()))
+        flights[key] = flight
+
+        def forget(_: asyncio.Task, key=key, flight=flight) -> None:
+            if flights.get(key) is flight:
+                del flights[key]
+
+        flight.task.add_done_callback(forget)
+        metrics.SINGLEFLIGHT.labels(kind, "leader").inc()
+    else:
+        metrics.SINGLEFLIGHT.labels(kind, "coalesced").inc()
+
+    flight.waiters += 1
+    try:
+        # shield: cancelling this caller must not cancel the call the others are waiting on
+        return await asyncio.shield(flight.task)
+    finally:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            # the last caller left - nobody wants the result, and a newcomer must start afresh
+            if flights.get(key) is flight:
+                del flights[key]
+            flight.task.cancel()
+            metrics.SINGLEFLIGHT.labels(kind, "abandoned").inc()
+            logger.debug(f"[singleflight] {key} abandoned by its last caller")
@@ -0,0 +1,152 @@
+'''
+Record/replay snapshots of every upstream response behind a report (OONI, Cloudflare Radar, ScraperAPI and the LLM), stored as one zstd-compressed JSON file per report, so a report can be rerun offline, instantly and deterministically
+
+    PIPELINE_SNAPSHOT_MODE=record   # run against the real APIs and save what they returned
+    PIPELINE_SNAPSHOT_MODE=replay   # serve the saved responses - no network; a missing response is an error
+    PIPELINE_SNAPSHOT_MODE=update   # replay what is saved, fetch and add anything missing (e.g. after a prompt change)
+'''
+import contextvars
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+import zstandard
+
+logger = logging.getLogger(__name__)
+
+MODES = ("off", "record", "replay", "update")
+PIPELINE_SNAPSHOT_MODE = os.environ.get("PIPELINE_SNAPSHOT_MODE", "off").lower()
+PIPELINE_SNAPSHOT_DIR = os.environ.get("PIPELINE_SNAPSHOT_DIR", "snapshots")
+ZSTD_LEVEL = 10
+
+if PIPELINE_SNAPSHOT_MODE not in MODES:
+    raise ValueError(f"PIPELINE_SNAPSHOT_MODE must be one of {MODES}, got '{PIPELINE_SNAPSHOT_MODE}'")
+
+
+class SnapshotMiss(LookupError):
+    """Replay asked for a response the snapshot does not contain."""
+
+
+# ----------------------------------------
+# Value encoding - fetchers return markdown strings, (markdown, count, count) tuples or DataFrames
+# ----------------------------------------
+def _encode(value) -> dict:
+    if isinstance(value, pd.DataFrame):
+        return {"type": "frame", "value": value.to_json(orient="split", index=False)}
+    if isinstance(value, tuple):
+        return {"type": "tuple", "value": list(value)}
+    return {"type": "json", "value": value}
+
+
+def _decode(entry: dict):
+    if entry["type"] == "frame":
+        return pd.read_json(io.StringIO(entry["value"]), orient="split", dtype=False)
+    if entry["type"] == "tuple":
+        return tuple(entry["value"])
+    return entry["value"]
+
+
+def call_key(kind: str, args: dict) -> str:
+    digest = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()[:24]
+    return f"{kind}:{digest}"
+
+
+# ----------------------------------------
+# Snapshot file
+# ----------------------------------------
+class Snapshot:
+    """The recorded responses of one report, keyed on the upstream call and its arguments."""
+
+    def __init__(self, path: str, mode: str):
+        self.path = path
+        self.mode = mode
+        self.entries: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        # datacenter scraping records from an executor thread while the loop records OONI/Radar/LLM
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        with open(self.path, "rb") as f:
+            payload = json.loads(zstandard.ZstdDecompressor().decompress(f.read()))
+        self.entries = payload["entries"]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._lock:
+            payload = json.dumps({"version": 1, "entries": self.entries}, sort_keys=True).encode()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(payload))
+        os.replace(tmp_path, self.path)
+        logger.info(f"[snapshot] saved {len(self.entries)} responses to {self.path}")
+
+    async def call(self, kind: str, args: dict, fetch):
+        key = call_key(kind, args)
+        if self.mode in ("replay", "update") and key in self.entries:
+            self.hits += 1
+            return _decode(self.entries[key]["result"])
+        if self.mode == "replay":
+            raise SnapshotMiss(f"{self.path} has no recorded '{kind}' response for {args}")
+        self.misses += 1
+        value = await fetch()
+        with self._lock:
+            self.entries[key] = {"kind": kind, "args": args, "result": _encode(value)}
+        return value
+
+
+_current: contextvars.ContextVar[Snapshot] = contextvars.ContextVar("pipeline_snapshot", default=None)
+
+
+def report_name(request: dict) -> str:
+    """Snapshot name for a report request - the same request always maps to the same file."""
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def snapshot_path(name: str) -> str:
+    return os.path.join(PIPELINE_SNAPSHOT_DIR, f"{name}.json.zst")
+
+
+@contextmanager
+def session(name: str, mode: str = None):
+    """
+    Records or replays every upstream call made inside the block (including tasks it spawns).
+    Yields the Snapshot, or None when snapshots are off.
+    """
+    mode = mode or PIPELINE_SNAPSHOT_MODE
+    if mode == "off":
+        yield None
+        return
+    snap = Snapshot(snapshot_path(name), mode)
+    if mode in ("replay", "update"):
+        if os.path.exists(snap.path):
+            snap.load()
+        elif mode == "replay":
+            raise SnapshotMiss(f"No snapshot at {snap.path} - record one with PIPELINE_SNAPSHOT_MODE=record")
+    token = _current.set(snap)
+    try:
+        yield snap
+    finally:
+        _current.reset(token)
+    # only a completed report is worth saving - a partial one would replay as a miss later
+    if mode == "record" or (mode == "update" and snap.misses):
+        snap.save()
+    logger.info(f"[snapshot] {mode} {name}: {snap.hits} replayed, {snap.misses} fetched")
+
+
+def active() -> bool:
+    """True inside a record/replay session - callers bypass their memoization so every call is captured."""
+    return _current.get() is not None
+
+
+async def call(kind: str, args: dict, fetch):
+    """Returns await fetch(), recorded into or replayed from the current snapshot when there is one."""
+    snap = _current.get()
+    if snap is None:
+        return await fetch()
+    return await snap.call(kind, args, fetch)
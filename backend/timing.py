@@ -0,0 +1,76 @@
+'''
+Per-request stage timings - a context-local recorder that pipeline stages report into, so /run_report can return where its time went (and the load benchmark can break latency down per stage); every stage is also exported to Prometheus via metrics.py
+
+    timings = timing.start_request()
+    with timing.stage("ooni.fetch"):
+        ...
+    timings.summary()  # {"ooni.fetch": {"count": 3, "total_ms": 812.4, "max_ms": 301.2}, ...}
+'''
+import contextvars
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from backend import metrics
+
+
+class StageTimings:
+    """Durations recorded per stage name. Stages may overlap (concurrent fetches), so totals can exceed wall time."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations: dict[str, list[float]] = defaultdict(list)
+
+    def record(self, name: str, seconds: float) -> None:
+        self.durations[name].append(seconds)
+
+    def summary(self) -> dict:
+        stages = {
+            name: {
+                "count": len(values),
+                "total_ms": round(sum(values) * 1000, 1),
+                "max_ms": round(max(values) * 1000, 1),
+            }
+            for name, values in sorted(self.durations.items())
+        }
+        wall_ms = round((time.perf_counter() - self.started) * 1000, 1)
+        stages["wall"] = {"count": 1, "total_ms": wall_ms, "max_ms": wall_ms}
+        return stages
+
+
+# Tasks spawned by asyncio.gather copy the context, so they all see (and record into) the same object
+_current: contextvars.ContextVar[StageTimings] = contextvars.ContextVar("stage_timings", default=None)
+
+
+def start_request() -> StageTimings:
+    """Starts a fresh recorder for the current request/task and returns it."""
+    timings = StageTimings()
+    _current.set(timings)
+    return timings
+
+
+def current() -> StageTimings:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Times the enclosed block (sync or async code) into the current request's recorder, if any,
+    and into the pipeline_stage_seconds histogram.
+    """
+    start = time.perf_counter()
+    failed = False
+    metrics.STAGES_IN_FLIGHT.labels(name).inc()
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        seconds = time.perf_counter() - start
+        metrics.STAGES_IN_FLIGHT.labels(name).dec()
+        metrics.observe_stage(name, seconds, failed)
+        timings = _current.get()
+        if timings is not None:
+            timings.record(name, seconds)
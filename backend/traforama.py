@@ -2,32 +2,29 @@
 Scrapes tables from Traforama website into SQL tables - makes it faster instead of web-scraping everything at inference
 '''
 import asyncio
-from playwright.async_api import async_playwright
-from bs4 import BeautifulSoup
-import csv
 import logging
-import duckdb
+import pandas as pd
+
+from backend import browser_pool
+from backend import extract
 # Configure logging for better output and debugging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-async def scrape_traforama_isp_list_playwright(url: str):
+COUNTRY_OR_PROVIDERS_XPATH = f"//h3[{extract.has_class('graf--h')}] | //p[{extract.has_class('graf--p')}]"
+
+async def fetch_traforama_html(url: str):
     """
-    Scrapes the list of Internet Service Providers by country from Traforama support.
-    Uses Playwright to handle dynamically loaded content.
-    Extracts country names from h3 tags and providers from p tags, associating them.
+    Loads the Traforama support article with Playwright to handle dynamically loaded content.
 
     Args:
         url (str): The URL of the Traforama support page.
-    """
-    browser_headless_mode = True # Set to False for debugging
-    browser = None # Initialize browser outside try for finally block
 
+    Returns:
+        str: Inner HTML of the article's main content div, or None if loading failed.
+    """
     try:
-        async with async_playwright() as p:
-            logging.info(f"Launching browser in headless mode: {browser_headless_mode}")
-            browser = await p.chromium.launch(headless=browser_headless_mode)
-            page = await browser.new_page()
-
+        # Shared browser (BROWSER_HEADLESS=0 to watch it); images, fonts and stylesheets are not downloaded
+        async with browser_pool.page() as page:
             logging.info(f"Navigating to {url}...")
             # Wait until network is mostly idle AND the specific main content div is visible.
             # This is a robust wait for dynamic content.
@@ -53,78 +50,83 @@ async def scrape_traforama_isp_list_playwright(url: str):
                 logging.error(f"Error extracting HTML from '{main_content_div_selector}': {e}")
                 return
 
-            # --- Step 2: Parse the extracted HTML with BeautifulSoup ---
-            logging.info("Parsing extracted HTML with BeautifulSoup...")
-            soup = BeautifulSoup(main_content_html, 'html.parser')
-
-            all_extracted_data = []
-            current_country = None
-
-            # Find all h3 and p tags directly within the main content div (which is now our soup)
-            for element in soup.find_all(['h3', 'p']):
-                if element.name == 'h3' and 'graf--h' in element.get('class', []):
-                    country_name = element.get_text(strip=True)
-                    country_name = country_name.split(' - ')[0].strip() # Clean up potential extra info
-                    current_country = country_name
-                    # logging.info(f"Processing Country: {current_country}") # Too verbose for full run
-                elif element.name == 'p' and 'graf--p' in element.get('class', []):
-                    if current_country:
-                        providers_text = element.get_text(strip=True)
-                        all_extracted_data.append({
-                            'Country': current_country,
-                            'Providers': providers_text
-                        })
-                        current_country = None # Reset for the next country-provider pair
-                    else:
-                        logging.warning(f"Found provider paragraph '{element.get_text(strip=True)}' without a preceding country. Skipping.")
-                # We ignore other tags or tags with different classes
-
-            if not all_extracted_data:
-                logging.warning("No country and provider data was extracted. Check selectors or page structure.")
-                return
-
-            logging.info(f"Successfully extracted {len(all_extracted_data)} country-provider pairs.")
-
-            # --- Step 3: Save data to CSV ---
-            output_filename = 'traforama_isp_list.csv'
-            try:
-                csv_headers = ['Country', 'Providers']
-                with open(output_filename, 'w', newline='', encoding='utf-8') as f:
-                    writer = csv.DictWriter(f, fieldnames=csv_headers)
-                    writer.writeheader()
-                    writer.writerows(all_extracted_data)
-                logging.info(f"Data saved successfully to {output_filename}")
-            except Exception as e:
-                logging.error(f"Error saving data to CSV file '{output_filename}': {e}")
+            return main_content_html
 
     except Exception as main_exc:
         logging.critical(f"An unhandled error occurred during scraping: {main_exc}", exc_info=True)
-    finally:
-        if browser:
-            await browser.close()
-            logging.info("Browser closed.")
-
-# Define the target URL
-target_url = "https://support.traforama.com/en/articles/list-of-internet-service-providers-by-country"
-
-con = duckdb.connect('bryan.db')
-# Create the table (wrap names with spaces in double quotes)
-con.execute("""
-    CREATE OR REPLACE TABLE traforama_isp_list (
-        Country TEXT,
-        Providers TEXT
-    )
-""")
-
-# Load from CSV into table
-con.execute("""
-    COPY traforama_isp_list 
-    FROM 'traforama_isp_list.csv' 
-    (FORMAT CSV, HEADER)
-""")
-
-con.close()
-logging.info("Data saved successfully to traforama_isp_list.db")
+
+def parse_traforama_html(html: str):
+    """
+    Extracts country names from h3 tags and providers from p tags, associating them.
+
+    Returns:
+        list[dict]: {'Country', 'Providers'} pairs, or None if nothing was found.
+    """
+    # --- Step 2: Parse the extracted HTML with lxml ---
+    logging.info("Parsing extracted HTML with lxml...")
+    root = extract.parse_html(html)
+
+    all_extracted_data = []
+    current_country = None
+
+    # Country headings (h3.graf--h) and provider paragraphs (p.graf--p), in document order
+    for element in extract.xpath(COUNTRY_OR_PROVIDERS_XPATH)(root):
+        if element.tag == 'h3':
+            country_name = extract.text(element)
+            country_name = country_name.split(' - ')[0].strip() # Clean up potential extra info
+            current_country = country_name
+        elif current_country:
+            all_extracted_data.append({
+                'Country': current_country,
+                'Providers': extract.text(element)
+            })
+            current_country = None # Reset for the next country-provider pair
+        else:
+            logging.warning(f"Found provider paragraph '{extract.text(element)}' without a preceding country. Skipping.")
+
+    if not all_extracted_data:
+        logging.warning("No country and provider data was extracted. Check selectors or page structure.")
+        return
+
+    logging.info(f"Successfully extracted {len(all_extracted_data)} country-provider pairs.")
+    return all_extracted_data
+
+async def scrape_traforama_isp_list_playwright(url: str):
+    """
+    Scrapes the list of Internet Service Providers by country from Traforama support.
+
+    Returns:
+        list[dict]: {'Country', 'Providers'} pairs, or None if scraping failed.
+    """
+    html = await fetch_traforama_html(url)
+    return parse_traforama_html(html) if html else None
+
+TARGET_URL = "https://support.traforama.com/en/articles/list-of-internet-service-providers-by-country"
+TABLE_NAME = "traforama_isp_list"
+MIN_ROWS = 60  # ~77 countries are listed today
+
+async def fetch_content(validators: dict = None, url: str = TARGET_URL) -> tuple[str | None, dict]:
+    """
+    The rendered article markup and HTTP validators for ingest.py, which hashes the markup
+    before deciding whether to parse it. The article is rendered client-side, so there are
+    no usable validators and the markup is always returned.
+    """
+    html = await fetch_traforama_html(url)
+    if not html:
+        raise RuntimeError(f"Could not load the Traforama article from {url}")
+    return html, {}
+
+def parse_content(html: str) -> pd.DataFrame:
+    return pd.DataFrame(parse_traforama_html(html) or [], columns=["Country", "Providers"])
+
+async def fetch_traforama_isp_list(url: str = TARGET_URL) -> pd.DataFrame:
+    """
+    Scrapes the Traforama list into a DataFrame. Has no side effects - loading into DuckDB is done by ingest.py.
+    """
+    pairs = await scrape_traforama_isp_list_playwright(url)
+    return pd.DataFrame(pairs or [], columns=["Country", "Providers"])
 
 if __name__ == "__main__":
-    asyncio.run(scrape_traforama_isp_list_playwright(target_url))
+    # Scrape + load just this source through the shared ingestion pipeline: python -m backend.traforama
+    from backend import ingest
+    asyncio.run(ingest.main(["--sources", "traforama"]))
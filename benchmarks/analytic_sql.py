@@ -0,0 +1,59 @@
+'''
+Offline checks for the analytic SQL guard - runs generated-looking queries through validate_sql and the sandbox, and fails when a safe query is rejected or breaks, or an unsafe one gets through
+
+    python -m benchmarks.analytic_sql
+'''
+import asyncio
+import logging
+import sys
+
+import duckdb
+
+from backend import analytic_sql
+
+# queries the LLM writes - they must validate and run
+SAFE = {
+    "trailing comment": 'SELECT Country FROM mcc_mnc_table -- every country',
+    "semicolon before comment": 'SELECT Country FROM mcc_mnc_table; -- every country',
+    "comment, semicolon, comment": '-- countries\nSELECT Country /* name */ FROM mcc_mnc_table ;  -- done\n',
+    "semicolons in quotes": "SELECT Country, ';' AS \"a;b\" FROM mcc_mnc_table WHERE Country <> '--;'",
+    "several semicolons": "SELECT count(*) AS n FROM traforama_isp_list;;",
+}
+# queries that must be refused
+UNSAFE = {
+    "second statement": "SELECT 1; DROP TABLE mcc_mnc_table",
+    "second statement after comment": "SELECT 1; -- fine\nDELETE FROM mcc_mnc_table",
+    "not a select": "DELETE FROM mcc_mnc_table",
+    "other table": "SELECT * FROM ingestion_runs",
+}
+
+
+async def check() -> list[str]:
+    failures = []
+    for name, sql in SAFE.items():
+        try:
+            columns, rows, _ = await analytic_sql.run_sandboxed(analytic_sql.validate_sql(sql))
+            if not rows:
+                failures.append(f"{name}: no rows")
+        except (analytic_sql.UnsafeQueryError, duckdb.Error) as e:
+            failures.append(f"{name}: {type(e).__name__}: {e}")
+    for name, sql in UNSAFE.items():
+        try:
+            analytic_sql.validate_sql(sql)
+            failures.append(f"{name}: accepted")
+        except analytic_sql.UnsafeQueryError:
+            pass
+    return failures
+
+
+def main() -> int:
+    logging.disable(logging.INFO)
+    failures = asyncio.run(check())
+    print(f"{len(SAFE)} safe and {len(UNSAFE)} unsafe queries checked")
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+'''
+End-to-end load benchmark for /run_report - starts the upstream stand-ins and the FastAPI app (pointed at them), drives reports at a fixed concurrency and reports p50/p95/p99 latency, throughput and the per-stage breakdown the app returns
+
+    python -m benchmarks.load --requests 40 --concurrency 8
+    python -m benchmarks.load --cold --latency llm=3:0.6 --error-rate ooni=0.05
+'''
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+
+import httpx
+from aiohttp import web
+
+from benchmarks import standins
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Distinct country mixes, so a warm run still exercises cache misses across queries
+DEFAULT_QUERIES = [
+    "Tell me about Peru",
+    "Pakistan and Iran",
+    "Germany",
+    "Brazil and Argentina",
+    "Kenya, Nigeria and Ghana",
+    "Japan",
+    "Canada and Mexico",
+    "India",
+]
+
+TABLES = ["mcc_mnc_table", "traforama_isp_list", "mideye_mobile_network_list"]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = int(rank), min(int(rank) + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+async def start_standins(profiles: dict, port: int) -> web.AppRunner:
+    runner = web.AppRunner(standins.build_app(profiles), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+def start_app(port: int, standin_url: str, cold: bool) -> subprocess.Popen:
+    env = {**os.environ, **standins.upstream_env(standin_url)}
+    if cold:
+        # every report refetches and recomputes everything
+        env["CACHE_BACKEND"] = "off"
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, url: str, timeout_s: float = 60) -> None:
+    deadline = time.monotonic() + timeout_s
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.25)
+    raise RuntimeError(f"App did not come up at {url} within {timeout_s}s")
+
+
+async def drive(app_url: str, queries: list[str], tests: list[str], requests: int, concurrency: int) -> tuple[list[dict], float]:
+    """Sends `requests` reports with at most `concurrency` in flight; returns per-request results and wall time."""
+    results = []
+    next_index = 0
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal next_index
+        while next_index < requests:
+            i = next_index
+            next_index += 1
+            payload = {"user_query": queries[i % len(queries)], "sql_tables": TABLES, "test_names": tests, "horizon": 30}
+            start = time.perf_counter()
+            try:
+                resp = await client.post(f"{app_url}/run_report", json=payload)
+                body = resp.json()
+                ok = resp.status_code == 200 and body.get("success", False)
+                error = None if ok else body.get("error") or f"HTTP {resp.status_code}: {str(body)[:200]}"
+                results.append({"latency": time.perf_counter() - start, "ok": ok, "timings": body.get("timings", {}),
+                                "error": error})
+            except (httpx.HTTPError, ValueError) as e:
+                results.append({"latency": time.perf_counter() - start, "ok": False, "timings": {}, "error": str(e)})
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=600) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def stall_site(stack: str) -> str:
+    """The innermost project frame of a loop stall stack, e.g. 'backend/datacenter.py:66'."""
+    frames = [line.strip() for line in stack.splitlines() if line.strip().startswith("File ")]
+    ours = [f for f in frames if ROOT in f and "loop_monitor" not in f] or frames or ["<unknown>"]
+    path, _, rest = ours[-1].partition(", line ")
+    return f"{os.path.relpath(path[6:-1], ROOT)}:{rest.split(',')[0]}" if ROOT in path else ours[-1]
+
+
+def summarize(results: list[dict], wall_s: float, upstream: dict, stalls: list[dict] = ()) -> dict:
+    latencies = [r["latency"] for r in results if r["ok"]]
+    stages = defaultdict(list)
+    for r in results:
+        for name, stage in r["timings"].items():
+            stages[name].append(stage["total_ms"])
+    return {
+        "requests": len(results),
+        "errors": sum(not r["ok"] for r in results),
+        "error_samples": sorted({str(r["error"])[:200] for r in results if not r["ok"]})[:5],
+        "throughput_rps": round(len(results) / wall_s, 3) if wall_s else 0.0,
+        "latency_s": {f"p{p}": round(percentile(latencies, p), 3) for p in (50, 95, 99)},
+        "latency_mean_s": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        "stages_ms": {
+            name: {"p50": round(percentile(values, 50), 1), "p95": round(percentile(values, 95), 1)}
+            for name, values in sorted(stages.items())
+        },
+        "upstream": upstream,
+        "loop_stalls": {
+            "count": len(stalls),
+            "max_ms": max((stall["blocked_ms"] for stall in stalls), default=0.0),
+            "sites": dict(Counter(stall_site(stall["stack"]) for stall in stalls).most_common(5)),
+        },
+    }
+
+
+def print_summary(summary: dict) -> None:
+    print(f"\nrequests {summary['requests']}  errors {summary['errors']}  throughput {summary['throughput_rps']} req/s")
+    for error in summary["error_samples"]:
+        print(f"  error: {error}")
+    print("latency  " + "  ".join(f"{k} {v:.2f}s" for k, v in summary["latency_s"].items()))
+    print(f"\n{'stage':<18}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, stage in summary["stages_ms"].items():
+        print(f"{name:<18}{stage['p50']:>10.1f}{stage['p95']:>10.1f}")
+    print(f"\nupstream requests {summary['upstream'].get('requests')}  errors {summary['upstream'].get('errors')}")
+    stalls = summary["loop_stalls"]
+    print(f"event loop stalls {stalls['count']}  longest {stalls['max_ms']:.0f} ms")
+    for site, count in stalls["sites"].items():
+        print(f"  {count:>4}x  {site}")
+
+
+async def run(args) -> dict:
+    profiles = standins.build_profiles(args.latency, args.error_rate, args.latency_scale)
+    standin_url = f"http://127.0.0.1:{args.standin_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    queries = list(args.queries or DEFAULT_QUERIES)
+    random.Random(args.seed).shuffle(queries)
+
+    runner = await start_standins(profiles, args.standin_port)
+    app = start_app(args.app_port, standin_url, args.cold)
+    try:
+        async with httpx.AsyncClient() as client:
+            await wait_ready(client, f"{app_url}/docs")
+        print(f"Driving {args.requests} reports at concurrency {args.concurrency} ({'cold' if args.cold else 'warm'} caches)")
+        results, wall_s = await drive(app_url, queries, args.tests, args.requests, args.concurrency)
+        async with httpx.AsyncClient() as client:
+            upstream = (await client.get(f"{standin_url}/_stats")).json()
+            stalls = (await client.get(f"{app_url}/debug/loop_stalls")).json()["stalls"]
+        return summarize(results, wall_s, upstream, stalls)
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+        await runner.cleanup()
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Load-test /run_report against local upstream stand-ins.")
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--queries", nargs="*", help="user queries to cycle through")
+    parser.add_argument("--tests", nargs="*", default=["whatsapp", "signal"], help="OONI test names per report")
+    parser.add_argument("--cold", action="store_true", help="disable the app's caches (see backend/cache.py)")
+    parser.add_argument("--app-port", type=int, default=8901)
+    parser.add_argument("--standin-port", type=int, default=8900)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="also write the summary as JSON")
+    standins.add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+
+    summary = asyncio.run(run(args))
+    print_summary(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
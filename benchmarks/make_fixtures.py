@@ -0,0 +1,152 @@
+'''
+Builds the frozen HTML fixtures the parser benchmarks run on - one gzipped page per source, shaped like the live page's markup and filled from the reference tables in bryan.db, plus the row counts and columns each parser must produce
+
+    python -m benchmarks.make_fixtures
+'''
+import gzip
+import hashlib
+import html
+import json
+import os
+
+import duckdb
+
+DB_PATH = os.path.join(os.path.dirname(__file__), "..", "backend", "bryan.db")
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Page chrome every fixture carries, so the parsers have to skip real-looking noise
+PAGE_HEAD = (
+    "<!DOCTYPE html><html lang=\"en\"><head><meta charset=\"utf-8\"><title>{title}</title>"
+    "<link rel=\"stylesheet\" href=\"/static/site.css\"><style>.x{{color:red}}</style>"
+    "<script>window.dataLayer=window.dataLayer||[];</script></head><body>"
+    "<nav class=\"menu\"><ul>" + "".join(f"<li><a href=\"/p/{i}\">Menu item {i}</a></li>" for i in range(40)) + "</ul></nav>"
+)
+PAGE_FOOT = "<footer><p>&copy; 2025</p><!-- analytics --><script src=\"/static/app.js\"></script></footer></body></html>"
+
+DATACENTER_CARD_CLASSES = (
+    "flex flex-col gap-2 rounded border border-gray-100 p-2 "
+    "hover:border-teal-300 hover:shadow-lg hover:shadow-teal-600/40"
+)
+DATACENTER_COUNTRIES = ["Pakistan", "USA", "Iran", "Germany", "Brazil"]
+DATACENTER_CARDS = 500
+
+
+def frame_digest(rows) -> str:
+    """Order-sensitive digest of row values (None counted as ""), shared with the benchmark's check."""
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update("\x1f".join("" if v is None else str(v) for v in row).encode("utf-8"))
+        digest.update(b"\x1e")
+    return digest.hexdigest()
+
+
+def _cell(value, i: int) -> str:
+    """Cell markup with the kinds of noise the live pages have: entities, inline tags, comments."""
+    value = html.escape("" if value is None else str(value))
+    if i % 11 == 0:
+        return f"<span class=\"v\">{value}</span>"
+    if i % 17 == 0:
+        return f" {value} <!-- cached -->"
+    return value
+
+
+def mcc_page(con: duckdb.DuckDBPyConnection) -> tuple[str, dict]:
+    df = con.execute("SELECT * FROM mcc_mnc_table").df()
+    headers = ["MCC", "MNC", "ISO", "Country", "Country Code", "Network"]
+    rows = "".join(
+        "<tr role=\"row\">" + "".join(f"<td>{_cell(v, i + j)}</td>" for j, v in enumerate(row)) + "</tr>"
+        for i, row in enumerate(df.itertuples(index=False, name=None))
+    )
+    # inner HTML of #mncmccTable_wrapper, as fetch_mcc_mnc_html returns it
+    page = (
+        "<div class=\"dataTables_length\"><label>Show <select name=\"mncmccTable_length\">"
+        "<option value=\"10\">10</option><option value=\"5000\">All (2080 Entries)</option></select></label></div>"
+        "<table id=\"mncmccTable\" class=\"display dataTable\"><thead><tr>"
+        + "".join(f"<th class=\"sorting\">{h}</th>" for h in headers)
+        + f"</tr></thead><tbody>{rows}</tbody></table>"
+        f"<div class=\"dataTables_info\" id=\"mncmccTable_info\">Showing 1 to {len(df):,} of {len(df):,} entries</div>"
+    )
+    return page, {"rows": len(df), "columns": list(df.columns), "digest": frame_digest(df.itertuples(index=False, name=None))}
+
+
+def mideye_page(con: duckdb.DuckDBPyConnection) -> tuple[str, dict]:
+    df = con.execute("SELECT * FROM mideye_mobile_network_list").df()
+    rows, previous = [], None
+    for i, (country, *rest) in enumerate(df.itertuples(index=False, name=None)):
+        # the live table only names the country on its first operator
+        shown = country if country != previous else ""
+        previous = country
+        rows.append("<tr>" + "".join(f"<td>{_cell(v, i + j)}</td>" for j, v in enumerate([shown, *rest])) + "</tr>")
+    page = (
+        PAGE_HEAD.format(title="Mobile network list")
+        + "<main><article><div class=\"entry-content clearfix\"><h2>Mobile network list</h2><table><tbody>"
+        "<tr><td><strong>Country</strong></td><td><strong>Operator</strong></td><td><strong>MCC-MNC</strong></td>"
+        "<td><strong>Display text</strong></td></tr><tr><td>*</td><td></td><td></td><td></td></tr>"
+        + "".join(rows)
+        + "</tbody></table></div></article></main>"
+        + PAGE_FOOT
+    )
+    return page, {"rows": len(df), "columns": list(df.columns), "digest": frame_digest(df.itertuples(index=False, name=None))}
+
+
+def traforama_page(con: duckdb.DuckDBPyConnection) -> tuple[str, dict]:
+    df = con.execute("SELECT * FROM traforama_isp_list").df()
+    sections = "".join(
+        f"<h3 class=\"graf graf--h3 graf--h\">{html.escape(country)} - Internet providers</h3>"
+        f"<p class=\"note\">Updated list</p>"
+        f"<p class=\"graf graf--p\">{_cell(providers, i + 1)}</p>"
+        for i, (country, providers) in enumerate(df.itertuples(index=False, name=None))
+    )
+    # inner HTML of div.css-11y878r, as fetch_traforama_html returns it
+    page = f"<div class=\"article\"><h1>List of Internet Service Providers by country</h1>{sections}</div>"
+    return page, {"rows": len(df), "columns": list(df.columns), "digest": frame_digest(df.itertuples(index=False, name=None))}
+
+
+def datacenter_page() -> tuple[str, dict]:
+    cards, pakistan_rows = [], []
+    for i in range(DATACENTER_CARDS):
+        country = DATACENTER_COUNTRIES[i % len(DATACENTER_COUNTRIES)]
+        cards.append(
+            f"<a class=\"{DATACENTER_CARD_CLASSES}\" href=\"/locations/dc-{i}\">"
+            f"<img src=\"/img/{i}.png\" alt=\"\"><div class=\"text font-medium hover:text-purple\">DC {i} &amp; Partners</div>"
+            f"<div class=\"text-xs text-gray-500\">Colocation</div>"
+            f"<div class=\"text-xs text-gray-500\">{i} Main Street, Capital City, {country}</div></a>"
+        )
+        if country == "Pakistan":
+            pakistan_rows.append((f"DC {i} & Partners", "Colocation", f"{i} Main Street, Capital City, {country}",
+                                  f"https://www.datacenters.com/locations/dc-{i}"))
+    page = PAGE_HEAD.format(title="Data center locations") + "<main><div class=\"grid\">" + "".join(cards) + "</div></main>" + PAGE_FOOT
+    return page, {
+        "rows": len(pakistan_rows), "columns": ["Name", "Type", "Address", "Link"],
+        "digest": frame_digest(pakistan_rows), "keyword": "pakistan",
+    }
+
+
+def main():
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    con = duckdb.connect(DB_PATH, read_only=True)
+    try:
+        pages = {
+            "mcc": mcc_page(con),
+            "mideye": mideye_page(con),
+            "traforama": traforama_page(con),
+            "datacenter": datacenter_page(),
+        }
+    finally:
+        con.close()
+
+    expected = {}
+    for source, (page, spec) in pages.items():
+        path = os.path.join(FIXTURES_DIR, f"{source}.html.gz")
+        # mtime=0 keeps the gzip bytes stable across rebuilds
+        with gzip.GzipFile(path, "wb", mtime=0) as f:
+            f.write(page.encode("utf-8"))
+        expected[source] = spec
+        print(f"{source}: {len(page):,} bytes -> {os.path.getsize(path):,} gzipped, {spec['rows']} rows")
+
+    with open(os.path.join(FIXTURES_DIR, "expected.json"), "w") as f:
+        json.dump(expected, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+'''
+Offline parser benchmarks - times extraction + cleaning for every scraper on the frozen fixtures, reports rows/sec and peak memory, and fails when a parser returns the wrong rows/columns or regresses against the saved baseline
+
+    python -m benchmarks.parsers            # run and check against this machine's baseline.json
+    python -m benchmarks.parsers --update   # record the current speeds as this machine's baseline (not committed)
+    python -m benchmarks.make_fixtures             # rebuild the fixtures after the tables change
+'''
+import argparse
+import gzip
+import json
+import logging
+import math
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+from backend import datacenter
+from backend import mcc
+from backend import mideye
+from backend import traforama
+from benchmarks.make_fixtures import FIXTURES_DIR, frame_digest
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# A run fails when a parser is this much slower than its baseline...
+DEFAULT_MAX_REGRESSION = 0.5
+# ...and at least this many ms slower - sub-ms parsers swing by more than 50% on scheduler noise alone
+DEFAULT_MIN_SLOWDOWN_MS = 2.0
+# Each timed sample repeats the parse until it has run at least this long, so fast parsers aren't timed at timer resolution
+MIN_SAMPLE_S = 0.05
+
+DATACENTER_URL = "https://www.datacenters.com/locations?query=pakistan"
+
+
+def _datacenter(page: str) -> pd.DataFrame:
+    df = pd.DataFrame(datacenter.iter_datacenter_cards(page, DATACENTER_URL))
+    return datacenter.filter_to_country(df, "pakistan")
+
+
+# source -> markup -> cleaned DataFrame, exactly as ingestion / the report pipeline runs it
+PARSERS = {
+    "mcc": mcc.parse_content,
+    "mideye": lambda page: mideye.parse_content(mideye.extract_table_html(page)),
+    "traforama": traforama.parse_content,
+    "datacenter": _datacenter,
+}
+
+
+def load_fixture(source: str) -> str:
+    with gzip.open(os.path.join(FIXTURES_DIR, f"{source}.html.gz"), "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def check_output(source: str, df: pd.DataFrame, spec: dict) -> list[str]:
+    """Problems with a parser's output compared with the fixture's expectations."""
+    problems = []
+    if list(df.columns) != spec["columns"]:
+        problems.append(f"columns {list(df.columns)} != {spec['columns']}")
+    if len(df) != spec["rows"]:
+        problems.append(f"{len(df)} rows != {spec['rows']}")
+    elif frame_digest(df.itertuples(index=False, name=None)) != spec["digest"]:
+        problems.append("row values differ from the fixture's source rows")
+    return problems
+
+
+def bench(source: str, page: str, repeat: int) -> dict:
+    parse = PARSERS[source]
+    start = time.perf_counter()
+    parse(page)  # warm-up: compiled selectors, imports
+    loops = max(1, math.ceil(MIN_SAMPLE_S / max(time.perf_counter() - start, 1e-6)))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            df = parse(page)
+        timings.append((time.perf_counter() - start) / loops)
+
+    tracemalloc.start()
+    parse(page)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return {
+        "df": df,
+        "median_ms": median * 1000,
+        "min_ms": min(timings) * 1000,
+        "rows_per_sec": len(df) / median if median else 0.0,
+        "peak_mb": peak / 1e6,
+    }
+
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark and check the scraper parsers on frozen fixtures.")
+    parser.add_argument("--sources", nargs="+", choices=list(PARSERS), default=list(PARSERS))
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per source")
+    parser.add_argument("--max-regression", type=float, default=DEFAULT_MAX_REGRESSION,
+                        help="fail when the best time exceeds baseline by this fraction")
+    parser.add_argument("--min-slowdown-ms", type=float, default=DEFAULT_MIN_SLOWDOWN_MS,
+                        help="...and by at least this many milliseconds")
+    parser.add_argument("--update", action="store_true", help="write the measured speeds to baseline.json")
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)  # the parsers log per call
+    with open(os.path.join(FIXTURES_DIR, "expected.json")) as f:
+        expected = json.load(f)
+    baseline = {}
+    if os.path.exists(BASELINE_PATH) and not args.update:
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+    elif not args.update:
+        print("No baseline for this machine yet - checking outputs only (record one with --update)")
+
+    failures, results = [], {}
+    print(f"{'source':<12}{'rows':>7}{'median ms':>12}{'rows/sec':>12}{'peak MB':>10}{'vs baseline':>14}")
+    for source in args.sources:
+        page = load_fixture(source)
+        result = bench(source, page, args.repeat)
+        problems = check_output(source, result.pop("df"), expected[source])
+        failures.extend(f"{source}: {p}" for p in problems)
+
+        def slower(result: dict) -> bool:
+            # best-of-repeat, like timeit - a busy machine only ever adds time, so the median drifts with load
+            return (result["min_ms"] > baseline[source]["min_ms"] * (1 + args.max_regression)
+                    and result["min_ms"] - baseline[source]["min_ms"] >= args.min_slowdown_ms)
+
+        versus = ""
+        if source in baseline:
+            if slower(result):
+                # a slowdown that lasts a whole run is usually another process - confirm it before failing
+                retry = bench(source, page, args.repeat)
+                retry.pop("df")
+                result = min(result, retry, key=lambda r: r["min_ms"])
+            ratio = result["min_ms"] / baseline[source]["min_ms"]
+            versus = f"{ratio:.2f}x"
+            if slower(result):
+                failures.append(f"{source}: {ratio:.2f}x slower than baseline ({baseline[source]['min_ms']:.1f}ms best)")
+        results[source] = {k: round(v, 3) for k, v in result.items()}
+        print(f"{source:<12}{expected[source]['rows']:>7}{result['median_ms']:>12.1f}"
+              f"{result['rows_per_sec']:>12,.0f}{result['peak_mb']:>10.2f}{versus:>14}")
+
+    if args.update:
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {BASELINE_PATH}")
+
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+'''
+In-memory Redis-protocol stand-in - enough of RESP2 (PING, GET, SET with EX/PX, DEL, EXISTS, DBSIZE, FLUSHDB) to run the app with CACHE_BACKEND=redis and no Redis server
+
+    python -m benchmarks.redis_standin --port 6390
+    CACHE_BACKEND=redis CACHE_URL=redis://127.0.0.1:6390/0 uvicorn main:app
+'''
+import argparse
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Store:
+    """Keys to (value, expires_at or None)."""
+
+    def __init__(self):
+        self.entries: dict[bytes, tuple[bytes, float | None]] = {}
+        self.commands = 0
+
+    def get(self, key: bytes) -> bytes | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        return value
+
+    def set(self, key: bytes, value: bytes, options: list[bytes]) -> None:
+        expires_at = None
+        if len(options) >= 2 and options[0].upper() in (b"EX", b"PX"):
+            ttl_s = int(options[1]) / (1 if options[0].upper() == b"EX" else 1000)
+            expires_at = time.monotonic() + ttl_s
+        self.entries[key] = (value, expires_at)
+
+
+def encode(reply) -> bytes:
+    if reply is None:
+        return b"$-1\r\n"
+    if isinstance(reply, int):
+        return b":%d\r\n" % reply
+    if isinstance(reply, Exception):
+        return b"-ERR %s\r\n" % str(reply).encode()
+    if isinstance(reply, str):
+        return b"+%s\r\n" % reply.encode()
+    return b"$%d\r\n%s\r\n" % (len(reply), reply)
+
+
+def execute(store: Store, command: list[bytes]):
+    store.commands += 1
+    name, args = command[0].upper(), command[1:]
+    if name == b"PING":
+        return "PONG"
+    if name == b"GET":
+        return store.get(args[0])
+    if name == b"SET":
+        store.set(args[0], args[1], args[2:])
+        return "OK"
+    if name == b"DEL":
+        return sum(store.entries.pop(key, None) is not None for key in args)
+    if name == b"EXISTS":
+        return sum(store.get(key) is not None for key in args)
+    if name == b"DBSIZE":
+        return len(store.entries)
+    if name == b"FLUSHDB":
+        store.entries.clear()
+        return "OK"
+    if name in (b"SELECT", b"CLIENT"):
+        # clients announce their name and library on connect - nothing to do
+        return "OK"
+    return ValueError(f"unknown command '{name.decode()}'")
+
+
+async def read_command(reader: asyncio.StreamReader) -> list[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):
+        # inline command, e.g. from telnet
+        return line.split()
+    parts = []
+    for _ in range(int(line[1:])):
+        length = int((await reader.readline())[1:])
+        parts.append((await reader.readexactly(length + 2))[:-2])
+    return parts
+
+
+def handler(store: Store):
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while (command := await read_command(reader)) is not None:
+                if command:
+                    writer.write(encode(execute(store, command)))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+async def start(port: int, host: str = "127.0.0.1") -> tuple[asyncio.Server, Store]:
+    store = Store()
+    server = await asyncio.start_server(handler(store), host, port)
+    return server, store
+
+
+async def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve an in-memory Redis-protocol stand-in.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6390)
+    args = parser.parse_args(argv)
+    server, _ = await start(args.port, args.host)
+    logger.info(f"Redis stand-in listening on {args.host}:{args.port}")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
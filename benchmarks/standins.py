@@ -0,0 +1,233 @@
+'''
+Local stand-ins for every upstream the report pipeline calls - OONI measurements, Cloudflare Radar, ScraperAPI (serving datacenters.com result pages) and an OpenAI-compatible chat endpoint - with configurable latency and error distributions
+
+    python -m benchmarks.standins --port 8900 --latency llm=0.8:0.4 --error-rate ooni=0.02
+
+Point the app at it with:
+    OONI_API_URL=http://127.0.0.1:8900  CF_RADAR_API_URL=http://127.0.0.1:8900/client/v4/radar
+    SCRAPERAPI_ENDPOINT=http://127.0.0.1:8900/scraperapi  OPENAI_BASE_URL=http://127.0.0.1:8900/v1
+'''
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+
+from aiohttp import web
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+SERVICES = ["ooni", "radar", "scraperapi", "llm"]
+
+# Median seconds and lognormal sigma per service - roughly what the real APIs show
+DEFAULT_LATENCY = {
+    "ooni": (0.6, 0.5),
+    "radar": (0.25, 0.4),
+    "scraperapi": (2.5, 0.5),
+    "llm": (1.5, 0.4),
+}
+
+OONI_MAX_RESULTS = 100
+
+
+@dataclass
+class Profile:
+    """Latency (lognormal around a median) and error behaviour for one service."""
+    median_s: float
+    sigma: float
+    error_rate: float = 0.0
+    error_status: int = 500
+
+    def delay(self) -> float:
+        return random.lognormvariate(0, self.sigma) * self.median_s if self.median_s > 0 else 0.0
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+
+@dataclass
+class Stats:
+    requests: dict = field(default_factory=lambda: {s: 0 for s in SERVICES})
+    errors: dict = field(default_factory=lambda: {s: 0 for s in SERVICES})
+
+
+def _parse_pairs(pairs: list[str]) -> dict[str, str]:
+    parsed = {}
+    for pair in pairs or []:
+        service, _, value = pair.partition("=")
+        if service not in SERVICES:
+            raise SystemExit(f"Unknown service '{service}' (expected one of {SERVICES})")
+        parsed[service] = value
+    return parsed
+
+
+def build_profiles(latency: list[str] = None, error_rate: list[str] = None, scale: float = 1.0) -> dict[str, Profile]:
+    """Profiles from CLI-style overrides: latency "llm=0.8:0.4" (median:sigma), error_rate "ooni=0.02"."""
+    latencies = _parse_pairs(latency)
+    errors = _parse_pairs(error_rate)
+    profiles = {}
+    for service, (median_s, sigma) in DEFAULT_LATENCY.items():
+        if service in latencies:
+            median_text, _, sigma_text = latencies[service].partition(":")
+            median_s, sigma = float(median_text), float(sigma_text or sigma)
+        profiles[service] = Profile(median_s * scale, sigma, float(errors.get(service, 0.0)),
+                                    429 if service == "llm" else 500)
+    return profiles
+
+
+# ----------------------------------------
+# Fake payloads
+# ----------------------------------------
+def ooni_payload(params) -> dict:
+    limit = min(int(params.get("limit", "50") or 50), OONI_MAX_RESULTS)
+    cc = params.get("probe_cc", "ZZ")
+    test = params.get("test_name", "web_connectivity")
+    return {"metadata": {"count": limit}, "results": [
+        {
+            "probe_cc": cc,
+            "probe_asn": 1000 + i,
+            "measurement_start_time": f"2025-01-{1 + i % 28:02d}T00:00:00Z",
+            "test_name": test,
+            "anomaly": random.random() < 0.1,
+        }
+        for i in range(limit)
+    ]}
+
+
+def radar_payload(metric: str, params) -> dict:
+    if metric == "top":
+        limit = int(params.get("limit", "20"))
+        result = {"top_0": [
+            {"rank": i + 1, "domain": f"site{i + 1}.example", "categories": [{"name": "Technology"}]}
+            for i in range(limit)
+        ]}
+    else:
+        categories = {
+            "device_type": ["desktop", "mobile", "other"],
+            "ip_version": ["IPv4", "IPv6"],
+            "http_version": ["HTTP/1.x", "HTTP/2", "HTTP/3"],
+            "tls_version": ["TLS 1.2", "TLS 1.3", "TLS QUIC"],
+            "os": ["ANDROID", "WINDOWS", "IOS", "MACOSX", "LINUX"],
+        }.get(metric, ["a", "b"])
+        weights = [random.random() for _ in categories]
+        total = sum(weights)
+        result = {"summary_0": {c: f"{100 * w / total:.2f}" for c, w in zip(categories, weights)}}
+    return {"success": True, "errors": [], "result": result}
+
+
+def pick_countries(prompt: str) -> list[str]:
+    """Answers the country-selection prompt: the listed values the user's question mentions."""
+    question = prompt.split("The user asked:", 1)[-1].split("\n", 1)[0].lower()
+    listed = prompt.split("question:", 1)[-1].split("Respond as", 1)[0].splitlines()
+    return [v.strip() for v in listed if v.strip() and v.strip().lower() in question] or ["Peru"]
+
+
+def chat_payload(body: dict) -> dict:
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []))
+    prompt_tokens = max(1, len(prompt) // 4)
+    if "Respond as a Python list of strings" in prompt:
+        content = repr(pick_countries(prompt))
+    else:
+        content = "### Stand-in answer\n\n| Column | Value |\n|---|---|\n| rows | 3 |\n"
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": f"chatcmpl-standin-{time.monotonic_ns()}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stand-in"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+# ----------------------------------------
+# App
+# ----------------------------------------
+def build_app(profiles: dict[str, Profile]) -> web.Application:
+    stats = Stats()
+    with gzip.open(os.path.join(FIXTURES_DIR, "datacenter.html.gz"), "rt", encoding="utf-8") as f:
+        datacenter_page = f.read()
+
+    async def simulate(service: str, respond):
+        """Waits out the service's latency, then either fails or returns respond()."""
+        profile = profiles[service]
+        stats.requests[service] += 1
+        await asyncio.sleep(profile.delay())
+        if profile.fails():
+            stats.errors[service] += 1
+            return web.json_response({"error": f"stand-in {service} failure"}, status=profile.error_status)
+        return respond()
+
+    async def ooni(request):
+        return await simulate("ooni", lambda: web.json_response(ooni_payload(request.query)))
+
+    async def radar(request):
+        metric = request.match_info["metric"]
+        return await simulate("radar", lambda: web.json_response(radar_payload(metric, request.query)))
+
+    async def scraperapi(request):
+        return await simulate("scraperapi", lambda: web.Response(text=datacenter_page, content_type="text/html"))
+
+    async def chat(request):
+        body = await request.json()
+        return await simulate("llm", lambda: web.json_response(chat_payload(body)))
+
+    async def models(request):
+        # the app's startup warm-up lists models to open its connection to the LLM API
+        return web.json_response({"object": "list", "data": [{"id": "stand-in", "object": "model", "owned_by": "stand-in"}]})
+
+    async def stats_view(request):
+        return web.json_response({"requests": stats.requests, "errors": stats.errors})
+
+    app = web.Application()
+    app.router.add_get("/api/v1/measurements", ooni)
+    app.router.add_get("/client/v4/radar/http/summary/{metric}", radar)
+    app.router.add_get("/client/v4/radar/ranking/{metric}", radar)
+    app.router.add_get("/scraperapi", scraperapi)
+    app.router.add_get("/scraperapi/", scraperapi)
+    app.router.add_post("/v1/chat/completions", chat)
+    app.router.add_get("/v1/models", models)
+    app.router.add_get("/_stats", stats_view)
+    app["stats"] = stats
+    return app
+
+
+def upstream_env(base_url: str) -> dict[str, str]:
+    """Environment that points the pipeline at stand-ins served from base_url."""
+    return {
+        "OONI_API_URL": base_url,
+        "CF_RADAR_API_URL": f"{base_url}/client/v4/radar",
+        "SCRAPERAPI_ENDPOINT": f"{base_url}/scraperapi",
+        "SCRAPERAPI_KEY": "stand-in",
+        "OPENAI_BASE_URL": f"{base_url}/v1",
+        "OPENAI_API_KEY": "stand-in",
+        # stand-ins don't rate limit (and run faster than the real APIs) - keep limiter.py's concurrency
+        # and circuit breakers in the loop but lift the request rates set for the real quotas
+        **{f"{name}_RATE_PER_S": "1000" for name in ("OONI", "RADAR", "SCRAPERAPI", "LLM")},
+    }
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", nargs="*", metavar="SERVICE=MEDIAN[:SIGMA]",
+                        help=f"per-service latency in seconds, services: {SERVICES}")
+    parser.add_argument("--error-rate", nargs="*", metavar="SERVICE=RATE", help="per-service failure probability")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiply every median latency")
+
+
+def main(argv: list[str] = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve local stand-ins for the pipeline's upstream APIs.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    profiles = build_profiles(args.latency, args.error_rate, args.latency_scale)
+    print(json.dumps({s: vars(p) for s, p in profiles.items()}, indent=2))
+    web.run_app(build_app(profiles), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,72 @@
-from fastapi import FastAPI, Request, Query
+import time
+
+# Start of the import clock - reported with the warm-up and first-response times at startup
+_import_started = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Header, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 import asyncio
 import backend.final_truly_async as fta
 from backend import broadsqlasync
-from fastapi.responses import HTMLResponse
+from backend import admission
+from backend import analytic_sql
+from backend import asynccloudflare
+from backend import batch
+from backend import cache
+from backend import deadline
+from backend import hedge
+from backend import ingest
+from backend import limiter
+from backend import jobs
+from backend import loop_monitor
+from backend import metrics
+from backend import profiling
+from backend import resources
+from backend import snapshot
+from backend import timing
+from fastapi.responses import FileResponse, HTMLResponse, Response
 import os
 import logging
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.exception_handlers import request_validation_exception_handler
-app = FastAPI()
+
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+# Optional in-process refresh of the reference tables, e.g. INGEST_INTERVAL_HOURS=24
+INGEST_INTERVAL_HOURS = float(os.environ.get("INGEST_INTERVAL_HOURS", "0"))
+# Warm the DB, pycountry and LLM client before accepting traffic; WARMUP=0 skips it (e.g. for quick reloads)
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logging.info(f"Imported app in {IMPORT_SECONDS * 1000:.0f} ms")
+    if WARMUP:
+        started = time.perf_counter()
+        await asyncio.to_thread(resources.warm_up)
+        if snapshot.PIPELINE_SNAPSHOT_MODE != "replay":
+            await resources.warm_llm_connection()
+        logging.info(f"Warm-up finished in {(time.perf_counter() - started) * 1000:.0f} ms")
+    loop_monitor.start()
+    await jobs.start(run_job)
+    app.state.ready_at = time.perf_counter()
+    logging.info(f"Ready to serve {(app.state.ready_at - _import_started) * 1000:.0f} ms after import started")
+    if INGEST_INTERVAL_HOURS > 0:
+        app.state.ingestion_task = asyncio.create_task(
+            ingest.run_scheduler(INGEST_INTERVAL_HOURS, on_refresh=lambda statuses: analytic_sql.reset_sandbox())
+        )
+    yield
+    task = getattr(app.state, "ingestion_task", None)
+    if task:
+        task.cancel()
+    await jobs.stop()
+    await asynccloudflare.close_client()
+    await cache.close()
+    await loop_monitor.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow frontend to call API
 app.add_middleware(
@@ -21,26 +77,120 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    # Stages recorded anywhere in the request (see timing.stage) show up in the browser's devtools
+    timings = timing.start_request()
+    response = await call_next(request)
+    response.headers["Server-Timing"] = metrics.server_timing(timings.summary())
+    return response
+
+@app.middleware("http")
+async def log_first_response(request: Request, call_next):
+    response = await call_next(request)
+    if not getattr(app.state, "first_response_logged", False):
+        app.state.first_response_logged = True
+        ttfb = time.perf_counter() - _import_started
+        logging.info(f"First response ({request.url.path}) sent {ttfb * 1000:.0f} ms after import started")
+    return response
+
 class ReportRequest(BaseModel):
     user_query: str
     sql_tables: list[str]
     test_names: list[str]
     only_anomalies: bool = False
     horizon: int = 30
+    # latency budget - sections not ready in time come back as "timed out" and finish in the background
+    deadline_ms: int | None = Field(None, gt=0)
 
-@app.post("/run_report")
-async def run_report(req: ReportRequest):
+class BatchRequest(BaseModel):
+    reports: list[ReportRequest] = Field(min_length=1)
+
+async def build_report(req: ReportRequest, timings: timing.StageTimings) -> dict:
     try:
-        result = await fta.combined_pipeline(
-            user_query=req.user_query,
-            sql_tables=req.sql_tables,
-            test_names=req.test_names,
-            only_anomalies=req.only_anomalies,
-            horizon=req.horizon
-        )
-        return {"success": True, "report": result}
+        # PIPELINE_SNAPSHOT_MODE=record/replay captures or serves every upstream response for this request
+        with snapshot.session(snapshot.report_name(req.model_dump(exclude={"deadline_ms"}))), \
+                deadline.start(req.deadline_ms) as budget:
+            result = await fta.combined_pipeline(
+                user_query=req.user_query,
+                sql_tables=req.sql_tables,
+                test_names=req.test_names,
+                only_anomalies=req.only_anomalies,
+                horizon=req.horizon
+            )
+        timed_out = budget.timed_out if budget else []
+        metrics.REPORTS.labels("partial" if timed_out else "success").inc()
+        return {"success": True, "report": result, "timed_out": timed_out, "timings": timings.summary()}
     except Exception as e:
-        return {"success": False, "error": str(e)}
+        metrics.REPORTS.labels("error").inc()
+        return {"success": False, "error": str(e), "timings": timings.summary()}
+
+@app.post("/run_report")
+async def run_report(req: ReportRequest, request: Request, x_profile: str | None = Header(None)):
+    timings = timing.current() or timing.start_request()
+
+    async def admitted_report() -> dict:
+        # at most MAX_INFLIGHT_REPORTS run at once; the rest queue (bounded) or get a 503 (see admission.py)
+        async with admission.get_controller().slot():
+            # "X-Profile: <PROFILE_TOKEN>" runs this one report under the profiler (see profiling.py)
+            async with profiling.capture(f"run_report {req.user_query!r}", profiling.requested(x_profile)) as capture:
+                response = await build_report(req, timings)
+            if capture:
+                response["profile"] = capture.links()
+            return response
+
+    try:
+        return await admission.cancel_on_disconnect(request, admitted_report())
+    except admission.Overloaded as e:
+        return JSONResponse(status_code=503, content={"success": False, "error": str(e)},
+                            headers={"Retry-After": str(e.retry_after_s)})
+    except admission.ClientDisconnected:
+        # nobody is listening - 499 is nginx's "client closed request", for the access log
+        return Response(status_code=499)
+
+async def run_job(request: dict) -> dict:
+    # one report job from the queue (see jobs.py) - each gets its own stage timings
+    return await build_report(ReportRequest(**request), timing.start_request())
+
+@app.post("/reports", status_code=202)
+async def submit_report(req: ReportRequest):
+    # queued for the background workers - poll the returned url for progress and the finished report
+    try:
+        return await jobs.get_queue().submit(req.model_dump())
+    except admission.Overloaded as e:
+        return JSONResponse(status_code=503, content={"success": False, "error": str(e)},
+                            headers={"Retry-After": str(e.retry_after_s)})
+
+@app.post("/reports/batch")
+async def run_report_batch(req: BatchRequest, request: Request):
+    # the whole batch holds one admission slot; its fetches are deduplicated across reports (see batch.py)
+    async def admitted_batch() -> dict:
+        async with admission.get_controller().slot():
+            return await batch.run_batch([r.model_dump() for r in req.reports])
+
+    try:
+        return await admission.cancel_on_disconnect(request, admitted_batch())
+    except admission.Overloaded as e:
+        return JSONResponse(status_code=503, content={"success": False, "error": str(e)},
+                            headers={"Retry-After": str(e.retry_after_s)})
+    except admission.ClientDisconnected:
+        return Response(status_code=499)
+
+@app.get("/reports/{job_id}")
+async def get_report_job(job_id: str):
+    job = await jobs.get_queue().get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    return job
+
+@app.get("/profiles/{name}")
+async def get_profile(name: str):
+    if not profiling.PROFILE_FILE_RE.match(name):
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    path = os.path.join(profiling.PROFILE_DIR, name)
+    if not os.path.exists(path):
+        return JSONResponse(status_code=404, content={"error": "Not found"})
+    return FileResponse(path)
 
 
 
@@ -54,7 +204,7 @@ async def get_raw_tables(user_query: str = Query("Tell me all about Peru")):
 
         # --- Get raw tables ---
         for name in table_names:
-            df = fta.con.execute(f"SELECT * FROM {name}").df()
+            df = await asyncio.to_thread(broadsqlasync.read_table, name)
             raw_tables.append({
                 "name": name,
                 "columns": list(df.columns),
@@ -63,7 +213,7 @@ async def get_raw_tables(user_query: str = Query("Tell me all about Peru")):
 
         # --- Get filtered tables ---
         for i, name in enumerate(table_names):
-            df = fta.con.execute(f"SELECT * FROM {name}").df()
+            df = await asyncio.to_thread(broadsqlasync.read_table, name)
             if i == 0:
                 countries_list = await broadsqlasync.extract_relevant_rows(df, user_query)
             filtered = broadsqlasync.filter_df(df, "Country", countries_list)
@@ -79,6 +229,31 @@ async def get_raw_tables(user_query: str = Query("Tell me all about Peru")):
         logging.exception("Error in /raw_tables route")
         return JSONResponse(status_code=500, content={"error": str(e)})
 
+@app.get("/analytic_query")
+async def analytic_query(user_query: str = Query(..., description="Counting/aggregate question over the telecom reference tables")):
+    try:
+        result = await analytic_sql.analytic_pipeline(user_query)
+        return {"success": True, **result}
+    except Exception as e:
+        logging.exception("Error in /analytic_query route")
+        return {"success": False, "error": str(e)}
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    payload, content_type = metrics.render()
+    return Response(content=payload, media_type=content_type)
+
+@app.get("/debug/loop_stalls")
+async def loop_stalls():
+    """Stacks of the most recent callbacks that blocked the event loop (see loop_monitor.py)."""
+    return {"threshold_ms": loop_monitor.LOOP_BLOCK_THRESHOLD_S * 1000, "stalls": loop_monitor.recent_stalls()}
+
+@app.get("/debug/upstreams")
+async def upstreams():
+    """Adaptive concurrency limit and circuit state (see limiter.py) and hedge delay (see hedge.py) per upstream."""
+    hedges = hedge.states()
+    return {name: {**state, **hedges.get(name, {})} for name, state in limiter.states().items()}
+
 @app.get("/", response_class=HTMLResponse)
 async def serve_index():
     with open("index.html", encoding="utf-8") as f: